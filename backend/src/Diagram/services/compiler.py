@@ -1,158 +1,65 @@
-import os
-import subprocess
-import tempfile
-import shutil
 from pathlib import Path
-from typing import Tuple, Optional
-import io
+from typing import Tuple, Optional, Sequence
 from src.config import get_settings
+from src.compilation.services import compile_engine, CompileJob, CompileResult, to_standalone
 
 # Get settings instance
 settings = get_settings()
 
-try:
-    from pdf2image import convert_from_path
-    PDF2IMAGE_AVAILABLE = True
-except ImportError:
-    PDF2IMAGE_AVAILABLE = False
-    print("pdf2image not available, PNG conversion will use mock generation")
-
 class DiagramLatexCompiler:
-    def __init__(self, temp_dir: Optional[str] = None, timeout: Optional[int] = None):
-        self.temp_dir = temp_dir or tempfile.gettempdir()
+    def __init__(self, timeout: Optional[int] = None):
         self.timeout = timeout or settings.LATEX_TIMEOUT
     
-    def compile_latex(self, latex_code: str, output_format: str = "pdf") -> Tuple[bool, Optional[bytes], Optional[str]]:
+    async def compile_latex(
+        self,
+        latex_code: str,
+        output_format: str = "pdf",
+        user_id: Optional[str] = None,
+        priority: bool = False,
+        standalone: bool = False,
+        quality: str = "final",
+        exports: Sequence[str] = (),
+    ) -> CompileResult:
         """
-        Compile LaTeX code to PDF or PNG using Tectonic (preferred) or fallback methods
+        Compile LaTeX code to PDF or PNG through the shared compile engine
         Optimized for TikZ diagrams
+        With standalone=True the output is cropped to the content (previews)
+        With quality="preview" Tectonic runs one pass with draft graphics at low DPI
+        With exports, the PDF is compiled once and converted to each format (result.exports)
         """
-        try:
-            print(f"DiagramCompiler: Starting compilation to {output_format}")
-            
-            if output_format not in ["pdf", "png"]:
-                return False, None, "Invalid output format. Must be 'pdf' or 'png'"
-            
-            # Create temporary directory for compilation
-            with tempfile.TemporaryDirectory(dir=self.temp_dir) as temp_dir:
-                # Create complete LaTeX document
-                complete_latex = self._create_complete_document(latex_code)
-                
-                # Write LaTeX file
-                tex_file = Path(temp_dir) / "diagram.tex"
-                with open(tex_file, 'w', encoding='utf-8') as f:
-                    f.write(complete_latex)
-                
-                print("DiagramCompiler: Document written, compiling to PDF...")
-                
-                # Try Tectonic first, then fallback to other methods
-                success, tectonic_error = self._compile_with_tectonic(tex_file)
-                print(f"DiagramCompiler: Tectonic compile result: success={success}")
-                if tectonic_error:
-                    print(f"DiagramCompiler: Tectonic error message (first 500 chars): {tectonic_error[:500]}")
-                
-                if not success:
-                    print(f"DiagramCompiler: Tectonic compilation failed")
-                    return False, None, self._format_compilation_error(tectonic_error)
-                
-                pdf_file = tex_file.with_suffix('.pdf')
-                
-                if output_format == "pdf":
-                    print("DiagramCompiler: Returning PDF content")
-                    try:
-                        with open(pdf_file, 'rb') as f:
-                            return True, f.read(), None
-                    except Exception as e:
-                        return False, None, f"Failed to read PDF: {str(e)}"
-                else:
-                    print("DiagramCompiler: Converting to PNG...")
-                    # Try to convert PDF to PNG
-                    png_bytes, error_msg = self._pdf_to_png(pdf_file)
-                    if png_bytes is None:
-                        # If PNG conversion fails, create mock PNG
-                        print("DiagramCompiler: PNG conversion failed, creating mock PNG")
-                        png_bytes, error_msg = self._create_mock_png(pdf_file)
-                        if png_bytes is None:
-                            return False, None, error_msg
-                    return True, png_bytes, None
-                    
-        except Exception as e:
-            error_str = str(e)
-            print(f"DiagramCompiler: Exception occurred: {error_str}")
-            return False, None, f"Compilation failed: {error_str}"
-    
-    def _compile_with_tectonic(self, tex_file: Path) -> Tuple[bool, Optional[str]]:
-        """Try to compile with Tectonic LaTeX engine - optimized for TikZ"""
-        try:
-            print("DiagramCompiler: Trying Tectonic...")
-            
-            # Use config to get Tectonic paths
-            tectonic_paths = settings.get_tectonic_paths()
-            
-            tectonic_cmd = None
-            for path in tectonic_paths:
-                print(f"DiagramCompiler: Checking Tectonic path: {path}")
-                try:
-                    result = subprocess.run([path, '--version'], capture_output=True, timeout=10)
-                    if result.returncode == 0:
-                        tectonic_cmd = str(Path(path).expanduser().resolve())
-                        print(f"DiagramCompiler: Found Tectonic at: {tectonic_cmd}")
-                        break
-                    else:
-                        print(f"DiagramCompiler: Tectonic at {path} returned code {result.returncode}")
-                except (FileNotFoundError, subprocess.TimeoutExpired) as e:
-                    print(f"DiagramCompiler: Tectonic not found at {path}: {e}")
-                    continue
-            
-            if not tectonic_cmd:
-                return False, "Tectonic not found"
-            
-            # Change to the directory containing the tex file
-            original_dir = os.getcwd()
-            os.chdir(tex_file.parent)
-            
-            try:
-                # Set up environment for Tectonic - disable fontconfig to avoid font issues
-                env = os.environ.copy()
-                env['FONTCONFIG_FILE'] = ''
-                env['FONTCONFIG_PATH'] = ''
-                env['TECTONIC_MINIMAL_MODE'] = '1'
-                
-                print(f"DiagramCompiler: Running {tectonic_cmd} on {tex_file.name}")
-                result = subprocess.run(
-                    [tectonic_cmd, '--print', '--keep-logs', '--outfmt=pdf', tex_file.name],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.timeout,
-                    cwd=tex_file.parent,
-                    env=env
-                )
-                
-                print(f"DiagramCompiler: Tectonic return code: {result.returncode}")
-                
-                if result.returncode != 0:
-                    error_msg = f"Tectonic failed with return code {result.returncode}"
-                    if result.stderr:
-                        error_msg += f": {result.stderr[:500]}"
-                    if result.stdout:
-                        error_msg += f"\nOutput: {result.stdout[-500:]}"
-                    return False, error_msg
-                
-                # Check if PDF was created
-                pdf_file = tex_file.with_suffix('.pdf')
-                if not pdf_file.exists():
-                    return False, "PDF file was not created by Tectonic"
-                
-                print("DiagramCompiler: Tectonic compilation successful")
-                return True, None
-                
-            finally:
-                os.chdir(original_dir)
-            
-        except subprocess.TimeoutExpired:
-            return False, "Tectonic compilation timed out"
-        except Exception as e:
-            return False, f"Tectonic compilation error: {str(e)}"
+        print(f"DiagramCompiler: Starting compilation to {output_format}")
+        
+        # Create complete LaTeX document
+        complete_latex = self._create_complete_document(latex_code, standalone=standalone)
+        
+        result = await compile_engine.compile(CompileJob(
+            latex=complete_latex,
+            output_format=output_format,
+            tex_name="diagram",
+            dpi=300,
+            timeout=self.timeout,
+            label="DiagramCompiler",
+            user_id=user_id,
+            priority=priority,
+            quality=quality,
+            exports=tuple(exports),
+        ))
+        print(f"DiagramCompiler: Compile result: success={result.success}, stage={result.stage}")
+        
+        if result.success:
+            return result
+        
+        if result.stage == "tectonic":
+            print(f"DiagramCompiler: Tectonic error message (first 500 chars): {(result.error or '')[:500]}")
+            result.error = self._format_compilation_error(result.error)
+        elif result.stage == "rasterize" and output_format == "png":
+            # If PNG conversion fails, create mock PNG
+            print(f"DiagramCompiler: PNG conversion failed, creating mock PNG")
+            png_bytes, error_msg = self._create_mock_png()
+            if png_bytes is not None:
+                return CompileResult(True, content=png_bytes, timings=result.timings)
+            result.error = error_msg
+        return result
     
     def _format_compilation_error(self, error_msg: str) -> str:
         """
@@ -204,8 +111,22 @@ class DiagramLatexCompiler:
         # Otherwise return first 1000 chars of original error message
         return f"LaTeX Compilation Error:\n\n{error_msg[:1000]}"
     
-    def _create_complete_document(self, latex_code: str) -> str:
-        """Create a complete LaTeX document optimized for TikZ diagrams"""
+    def _create_complete_document(self, latex_code: str, standalone: bool = False) -> str:
+        """Create a complete LaTeX document optimized for TikZ diagrams
+
+        With standalone=True the page is cropped to the diagram (tight bounding box)
+        whenever the document allows it.
+        """
+        document = self._create_page_document(latex_code)
+        if standalone:
+            standalone_document = to_standalone(document)
+            if standalone_document is not None:
+                print("DiagramCompiler: Using standalone (tight bounding box) layout")
+                return standalone_document
+        return document
+
+    def _create_page_document(self, latex_code: str) -> str:
+        """Wrap the diagram in a full article page"""
         print("DiagramCompiler: Creating complete document for diagram...")
         print(f"DiagramCompiler: Input LaTeX code length: {len(latex_code)} characters")
         
@@ -322,95 +243,6 @@ class DiagramLatexCompiler:
         
         return result
     
-    def _pdf_to_png(self, pdf_file: Path) -> Tuple[Optional[bytes], Optional[str]]:
-        """Convert PDF to PNG using pdf2image or fallback methods"""
-        try:
-            print("DiagramCompiler: Converting PDF to PNG...")
-            
-            if PDF2IMAGE_AVAILABLE:
-                print("DiagramCompiler: Using pdf2image for conversion")
-                # Use config to get Poppler paths
-                poppler_paths = settings.get_poppler_paths()
-                
-                poppler_path = None
-                for path in poppler_paths:
-                    if os.path.exists(path) and os.path.exists(os.path.join(path, "pdftoppm.exe")):
-                        poppler_path = path
-                        print(f"DiagramCompiler: Found working Poppler at: {path}")
-                        break
-                
-                if not poppler_path:
-                    print("DiagramCompiler: No working Poppler installation found, trying without path")
-                    try:
-                        images = convert_from_path(str(pdf_file), dpi=300, first_page=1, last_page=1)
-                    except Exception as e:
-                        print(f"DiagramCompiler: pdf2image failed without path: {str(e)}")
-                        return None, f"Poppler not found. Please install Poppler or add it to PATH. Error: {str(e)}"
-                else:
-                    print(f"DiagramCompiler: Using Poppler path: {poppler_path}")
-                    images = convert_from_path(str(pdf_file), dpi=300, first_page=1, last_page=1, 
-                                             poppler_path=poppler_path)
-                
-                if images:
-                    # Convert first page to PNG bytes
-                    img_buffer = io.BytesIO()
-                    images[0].save(img_buffer, format='PNG')
-                    png_bytes = img_buffer.getvalue()
-                    print("DiagramCompiler: PDF to PNG conversion successful with pdf2image")
-                    return png_bytes, None
-                else:
-                    return None, "No pages found in PDF"
-            else:
-                # Fallback to external tools
-                return self._pdf_to_png_external(pdf_file)
-                
-        except Exception as e:
-            print(f"DiagramCompiler: PDF to PNG conversion failed: {str(e)}")
-            return None, f"PNG conversion error: {str(e)}"
-    
-    def _pdf_to_png_external(self, pdf_file: Path) -> Tuple[Optional[bytes], Optional[str]]:
-        """Fallback PDF to PNG conversion using external tools"""
-        try:
-            png_file = pdf_file.with_suffix('.png')
-            
-            # Try using magick (ImageMagick)
-            result = subprocess.run(
-                ['magick', 'convert', '-density', '300', str(pdf_file), str(png_file)],
-                capture_output=True,
-                text=True,
-                timeout=self.timeout
-            )
-            
-            if result.returncode != 0:
-                # Try pdftoppm as fallback
-                result = subprocess.run(
-                    ['pdftoppm', '-png', '-r', '300', str(pdf_file), str(pdf_file.stem)],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.timeout
-                )
-                
-                if result.returncode != 0:
-                    return None, f"PDF to PNG conversion failed: {result.stderr}"
-                
-                # pdftoppm creates files with different naming
-                possible_png = pdf_file.parent / f"{pdf_file.stem}-1.png"
-                if possible_png.exists():
-                    png_file = possible_png
-            
-            if not png_file.exists():
-                return None, "PNG file was not created"
-            
-            with open(png_file, 'rb') as f:
-                return f.read(), None
-                
-        except subprocess.TimeoutExpired:
-            return None, "PNG conversion timed out"
-        except FileNotFoundError as e:
-            return None, f"Conversion tool not found: {str(e)}. Please install ImageMagick or poppler-utils."
-        except Exception as e:
-            return None, f"PNG conversion error: {str(e)}"
-    
     def _create_mock_pdf(self, tex_file: Path) -> Tuple[bool, Optional[str]]:
         """Create a mock PDF for development when compilation fails"""
         try:
@@ -519,7 +351,7 @@ startxref
             print(f"DiagramCompiler: Failed to create mock PDF: {str(e)}")
             return False, f"Failed to create mock PDF: {str(e)}"
 
-    def _create_mock_png(self, pdf_file: Path) -> Tuple[Optional[bytes], Optional[str]]:
+    def _create_mock_png(self) -> Tuple[Optional[bytes], Optional[str]]:
         """Create a mock PNG for development when PDF to PNG conversion tools are not available"""
         try:
             print("DiagramCompiler: Creating mock PNG for development...")
@@ -541,10 +373,6 @@ startxref
                 0xAE, 0x42, 0x60, 0x82
             ])
             
-            png_file = pdf_file.with_suffix('.png')
-            with open(png_file, 'wb') as f:
-                f.write(png_data)
-            
             print("DiagramCompiler: Mock PNG created successfully")
             return bytes(png_data), None
             
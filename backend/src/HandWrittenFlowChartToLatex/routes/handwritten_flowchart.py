@@ -1,10 +1,8 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header, Form
 from sqlmodel import Session
 from typing import Optional
 from uuid import UUID
 import logging
-import io
 
 from ..services import gemini_flowchart_service, latex_flowchart_generator, flowchart_compiler
 from ..schemas.handwritten_flowchart_schemas import (
@@ -16,6 +14,8 @@ from ...auth.routes import get_current_user, User
 from ...auth.access import check_project_access, check_sub_project_access
 from ...auth.middleware.credits_middleware import require_credits
 from ...auth.models.credits import ServiceType
+from ...compilation.responses import compile_error_response, compile_export_response, compile_output_response
+from ...compilation.services import is_priority_user
 from ...utils.database import get_session
 
 logger = logging.getLogger(__name__)
@@ -148,10 +148,11 @@ async def generate_latex_from_analysis(
 async def compile_flowchart_latex(
     request: CompileRequest,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    accept: Optional[str] = Header(None)
 ):
     """
-    Compile LaTeX flowchart code to PDF or PNG
+    Compile LaTeX flowchart code to PDF, PNG or SVG
     Authenticated users only. Checks access if sub_project_id provided.
     """
     # Check access if sub_project_id is provided
@@ -161,23 +162,21 @@ async def compile_flowchart_latex(
              raise HTTPException(status_code=403, detail="Not authorized to access this project")
 
     try:
-        success, content, error = flowchart_compiler.compile_latex(
+        result = await flowchart_compiler.compile_latex(
             request.latex_code, 
-            request.output_format
+            "pdf" if request.output_formats else request.output_format,
+            user_id=current_user.id,
+            priority=is_priority_user(session, current_user.id),
+            quality=request.output_quality,
+            exports=request.output_formats or (),
         )
         
-        if not success:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "detail": error,
-                    "error_type": "compilation_error",
-                    "latex_code": request.latex_code[:500] + "..." if len(request.latex_code) > 500 else request.latex_code
-                }
-            )
+        if not result.success:
+            return compile_error_response(result, request.latex_code)
         
-        media_type = "application/pdf" if request.output_format == "pdf" else "image/png"
-        return StreamingResponse(io.BytesIO(content), media_type=media_type)
+        if request.output_formats:
+            return await compile_export_response(result, accept)
+        return compile_output_response(result, request.output_format)
         
     except HTTPException:
         raise
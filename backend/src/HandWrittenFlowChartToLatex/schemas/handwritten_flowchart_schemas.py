@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 
 class FlowchartAnalysisRequest(BaseModel):
     """Request model for flowchart analysis"""
@@ -37,5 +37,7 @@ from uuid import UUID
 class CompileRequest(BaseModel):
     """Request for compiling LaTeX to PDF/PNG"""
     latex_code: str
-    output_format: str  # 'pdf' or 'png'
+    output_format: str  # 'pdf', 'png' or 'svg'
     sub_project_id: Optional[UUID] = None
+    output_quality: Literal["preview", "final"] = "final"  # preview: one pass, draft graphics, low DPI
+    output_formats: Optional[List[Literal["pdf", "png", "svg"]]] = None  # export all of these from one compile
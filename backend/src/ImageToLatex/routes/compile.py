@@ -1,19 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Header
 from pydantic import BaseModel
 from sqlmodel import Session, select
-from typing import Optional, List
-import io
+from typing import Literal, Optional, List
 import logging
 from ..services.compiler import ImageToLatexCompiler
 from ...auth.middleware.credits_middleware import create_credit_checker
 from ...auth.models.credits import ServiceType
 from ...auth.models.sub_project import SubProjectFileLink
 from ...auth.models.project import ProjectFile, FileType
+from ...compilation.responses import compile_error_response, compile_export_response, compile_output_response
+from ...compilation.services import asset_cache, is_priority_user
 
 from ...auth.routes import get_current_user, User
 from ...utils.database import get_session
-from ...utils.supabase_storage import storage_service
 
 logger = logging.getLogger(__name__)
 
@@ -21,8 +20,11 @@ class CompileRequest(BaseModel):
     latex_code: str
     output_format: str  # 'pdf' or 'png'
     sub_project_id: Optional[str] = None
+    output_quality: Literal["preview", "final"] = "final"
+    output_formats: Optional[List[Literal["pdf", "png", "svg"]]] = None  # export all of these from one compile
 
 compile_router = APIRouter()
+compiler = ImageToLatexCompiler()
 
 from ...auth.access import check_sub_project_access
 from uuid import UUID
@@ -32,7 +34,8 @@ async def compile_latex_endpoint(
     request: CompileRequest,
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
-    credit_check: dict = Depends(create_credit_checker(ServiceType.LATEX_COMPILATION))
+    credit_check: dict = Depends(create_credit_checker(ServiceType.LATEX_COMPILATION)),
+    accept: Optional[str] = Header(None)
 ):
     """
     Compile LaTeX code to PDF or PNG
@@ -59,43 +62,40 @@ async def compile_latex_endpoint(
             try:
                 sub_project_uuid = UUID(request.sub_project_id)
                 
-                # Query linked files
-                links = session.exec(
-                    select(SubProjectFileLink)
-                    .where(SubProjectFileLink.sub_project_id == sub_project_uuid)
+                # Linked image files in one query
+                project_files = session.exec(
+                    select(ProjectFile)
+                    .join(SubProjectFileLink, SubProjectFileLink.project_file_id == ProjectFile.id)
+                    .where(
+                        SubProjectFileLink.sub_project_id == sub_project_uuid,
+                        ProjectFile.file_type == FileType.IMAGE,
+                        ProjectFile.file_url.is_not(None),
+                    )
                 ).all()
                 
-                for link in links:
-                    # Get the project file
-                    project_file = session.exec(
-                        select(ProjectFile)
-                        .where(ProjectFile.id == link.project_file_id)
-                    ).first()
-                    
-                    if project_file and project_file.file_type == FileType.IMAGE and project_file.file_url:
-                        # Download file content from Supabase
-                        file_content = await storage_service.download_file(project_file.file_url)
-                        if file_content:
-                            assets.append({
-                                "filename": project_file.filename,
-                                "content": file_content
-                            })
-                            logger.info(f"Loaded linked file: {project_file.filename}")
+                # Local copies unless a file changed since it was last downloaded from Supabase,
+                # fetched concurrently within the per-request budget
+                fetched = await asset_cache.get_many([
+                    (project_file.file_url, project_file.filename, project_file.updated_at)
+                    for project_file in project_files
+                ])
+                assets = [asset for asset in fetched if asset is not None]
+                logger.info(f"Loaded {len(assets)} of {len(project_files)} linked files")
             except Exception as e:
                 logger.warning(f"Failed to fetch linked files: {str(e)}")
         
-        compiler = ImageToLatexCompiler()
-        success, content, error = compiler.compile_latex(request.latex_code, request.output_format, assets=assets)
-        if not success:
+        result = await compiler.compile_latex(
+            request.latex_code,
+            "pdf" if request.output_formats else request.output_format,
+            assets=assets,
+            user_id=user_id,
+            priority=is_priority_user(session, user_id),
+            quality=request.output_quality,
+            exports=request.output_formats or (),
+        )
+        if not result.success:
             # Return detailed compilation error as JSON instead of generic HTTPException
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "detail": error,
-                    "error_type": "compilation_error",
-                    "latex_code": request.latex_code[:500] + "..." if len(request.latex_code) > 500 else request.latex_code
-                }
-            )
+            return compile_error_response(result, request.latex_code)
         
         # Consume credits for successful compilation
         await credits_service.consume_credits(
@@ -104,8 +104,9 @@ async def compile_latex_endpoint(
             {"output_format": request.output_format, "latex_length": len(request.latex_code)}
         )
         
-        media_type = "application/pdf" if request.output_format == "pdf" else "image/png"
-        return StreamingResponse(io.BytesIO(content), media_type=media_type)
+        if request.output_formats:
+            return await compile_export_response(result, accept)
+        return compile_output_response(result, request.output_format)
     except HTTPException:
         raise
     except Exception as e:
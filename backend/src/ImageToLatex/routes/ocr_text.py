@@ -1,4 +1,4 @@
-from fastapi import APIRouter, UploadFile, File, Depends
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Depends
 from sqlmodel import Session
 import logging
 from ..services import ocr_service, image_to_latex_service, gemini_service
@@ -8,6 +8,7 @@ from ...auth.middleware.credits_middleware import create_credit_checker
 from ...auth.models.credits import ServiceType
 
 from ...auth.routes import get_current_user, User
+from ...compilation.services import CompileQueueFull, FixResult, fix_cache, is_priority_user, latex_fixer
 from ...utils.database import get_session
 
 logger = logging.getLogger(__name__)
@@ -217,31 +218,68 @@ class FixLatexResponse(BaseModel):
     success: bool
     fixed_latex: str | None = None
     error: str | None = None
+    method: str | None = None  # "local" (rule-based), "cache" (learned fix) - both verified by compiling - or "llm"
+    applied_fixes: list[str] = []
 
 
 @ocr_router.post("/fix-latex", response_model=FixLatexResponse)
 async def fix_latex_with_error(
     request: FixLatexRequest,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
 ):
     """
-    Fix LaTeX code based on compilation error using Gemini AI.
+    Fix LaTeX code based on its compilation error.
+    Mechanical errors (missing packages, stray & or #, unsupported listings
+    languages, oversized TikZ coordinates) are patched locally, then fixes
+    learned from earlier Gemini repairs of the same error are replayed; both
+    are verified by recompiling. Gemini is only asked when neither works, and a
+    Gemini fix that compiles is learned for the next document with this error.
     This endpoint is called when LaTeX compilation fails.
     """
     try:
         logger.info(f"Fixing LaTeX for user {current_user.email}")
         logger.info(f"Error message: {request.error_message[:200]}...")
-        
+
+        priority = is_priority_user(session, current_user.id)
+        log, method, local_fix = request.error_message, None, None
+        try:
+            log, compiled = await latex_fixer.diagnose(
+                request.latex_code, request.error_message, user_id=current_user.id, priority=priority
+            )
+            if compiled is not None:
+                method, local_fix = "local", FixResult(request.latex_code, rounds=1, result=compiled)
+            else:
+                local_fix = await latex_fixer.repair(request.latex_code, log, user_id=current_user.id, priority=priority)
+                method = "local"
+                if local_fix is None:
+                    local_fix = await fix_cache.reuse(request.latex_code, log, user_id=current_user.id, priority=priority)
+                    method = "cache"
+        except CompileQueueFull:
+            local_fix = None
+        if local_fix is not None:
+            logger.info(f"Fixed LaTeX ({method}) in {local_fix.rounds} round(s): {', '.join(local_fix.fixes) or 'no changes needed'}")
+            return FixLatexResponse(
+                success=True,
+                fixed_latex=local_fix.latex,
+                error=None,
+                method=method,
+                applied_fixes=local_fix.fixes
+            )
+
         # Call Gemini to fix the LaTeX with error context
-        # Use Gemini first, fallback to Groq
-        fix_result = await image_to_latex_service.explain_error(request.error_message, request.latex_code)
+        fix_result = await gemini_service.fix_latex_with_error(request.latex_code, request.error_message)
         
         if fix_result.get("success") and fix_result.get("data"):
             fixed_code = fix_result["data"].get("content", "")
+            # Verified and learned after the response is sent, against the error the server reproduces
+            background_tasks.add_task(fix_cache.learn, request.latex_code, fixed_code, current_user.id, priority)
             return FixLatexResponse(
                 success=True,
                 fixed_latex=fixed_code,
-                error=None
+                error=None,
+                method="llm"
             )
         else:
             return FixLatexResponse(
@@ -1,174 +1,78 @@
-import os
-import subprocess
-import tempfile
-import shutil
 from pathlib import Path
-from typing import Tuple, Optional
-import io
+from typing import Tuple, Optional, Sequence
 from src.config import get_settings
+from src.compilation.services import compile_engine, CompileJob, CompileResult
 
 # Get settings instance
 settings = get_settings()
 
-try:
-	from pdf2image import convert_from_path
-	PDF2IMAGE_AVAILABLE = True
-except ImportError:
-	PDF2IMAGE_AVAILABLE = False
-	print("pdf2image not available, PNG conversion will use mock generation")
-
 class ImageToLatexCompiler:
-	def __init__(self, temp_dir: Optional[str] = None, timeout: Optional[int] = None):
-		self.temp_dir = temp_dir or tempfile.gettempdir()
+	def __init__(self, timeout: Optional[int] = None):
 		self.timeout = timeout or settings.LATEX_TIMEOUT
 
 	def _create_complete_document(self, latex_code: str) -> str:
 		# Optionally wrap code in a minimal LaTeX document
 		return latex_code
 
-	def compile_latex(self, latex_code: str, output_format: str = "pdf", assets: Optional[list] = None) -> Tuple[bool, Optional[bytes], Optional[str]]:
+	async def compile_latex(
+		self,
+		latex_code: str,
+		output_format: str = "pdf",
+		assets: Optional[list] = None,
+		user_id: Optional[str] = None,
+		priority: bool = False,
+		quality: str = "final",
+		exports: Sequence[str] = (),
+	) -> CompileResult:
 		"""
-		Compile LaTeX code to PDF or PNG using Tectonic (preferred) or fallback methods
+		Compile LaTeX code to PDF or PNG through the shared compile engine
 		Optimized for mathematical formulas and OCR-generated LaTeX
 		
 		Args:
 			latex_code: The LaTeX source code
 			output_format: Either "pdf" or "png"
 			assets: Optional list of {"filename": str, "content": bytes} dicts for linked files
+			user_id: Requesting user, used for fair queuing in the compile scheduler
+			priority: True for PRO/TEAM users, served from the scheduler's priority lane
+			quality: "final", or "preview" for one TeX pass, draft graphics and a low DPI
+			exports: Formats converted from the one compiled PDF, returned in result.exports
 		"""
-		try:
-			print(f"ImageToLatexCompiler: Starting compilation to {output_format}")
-			print(f"ImageToLatexCompiler: Temp dir: {self.temp_dir}")
-			print(f"ImageToLatexCompiler: Timeout: {self.timeout}")
-			print(f"ImageToLatexCompiler: Input LaTeX length: {len(latex_code)}")
-			print(f"ImageToLatexCompiler: Assets count: {len(assets) if assets else 0}")
-			if output_format not in ["pdf", "png"]:
-				print("ImageToLatexCompiler: Invalid output format requested.")
-				return False, None, "Invalid output format. Must be 'pdf' or 'png'"
-			with tempfile.TemporaryDirectory(dir=self.temp_dir) as temp_dir:
-				print(f"ImageToLatexCompiler: Using temp_dir: {temp_dir}")
-				
-				# Write asset files (linked images) to temp directory
-				if assets:
-					for asset in assets:
-						asset_path = Path(temp_dir) / asset["filename"]
-						with open(asset_path, 'wb') as f:
-							f.write(asset["content"])
-						print(f"ImageToLatexCompiler: Written asset file: {asset['filename']}")
-				
-				complete_latex = self._create_complete_document(latex_code)
-				tex_file = Path(temp_dir) / "imagetolatex.tex"
-				with open(tex_file, 'w', encoding='utf-8') as f:
-					f.write(complete_latex)
-				print(f"ImageToLatexCompiler: Written LaTeX to {tex_file}")
-				print("ImageToLatexCompiler: Document written, compiling to PDF...")
-				success, tectonic_error = self._compile_with_tectonic(tex_file)
-				print(f"ImageToLatexCompiler: Tectonic compile result: success={success}")
-				if tectonic_error:
-					print(f"ImageToLatexCompiler: Tectonic error message (first 500 chars): {tectonic_error[:500]}")
-				
-				if not success:
-					print(f"ImageToLatexCompiler: Tectonic compilation failed")
-					return False, None, self._format_compilation_error(tectonic_error)
-				
-				pdf_file = tex_file.with_suffix('.pdf')
-				print(f"ImageToLatexCompiler: PDF file path: {pdf_file}")
-				# DEBUG: Copy PDF to persistent debug directory for inspection
-				try:
-					debug_dir = Path(settings.__dict__.get('DEBUG_PDF_DIR', 'd:/Software Projects Backup/Tizkit/backend/debug_pdfs'))
-					debug_dir.mkdir(parents=True, exist_ok=True)
-					debug_pdf_path = debug_dir / pdf_file.name
-					shutil.copy2(pdf_file, debug_pdf_path)
-					print(f"ImageToLatexCompiler: Copied PDF to {debug_pdf_path}")
-				except Exception as e:
-					print(f"ImageToLatexCompiler: Failed to copy PDF for debug: {str(e)}")
-
-				if output_format == "pdf":
-					print("ImageToLatexCompiler: Returning PDF content")
-					try:
-						with open(pdf_file, 'rb') as f:
-							pdf_bytes = f.read()
-						print(f"ImageToLatexCompiler: PDF read success, size={len(pdf_bytes)} bytes")
-						return True, pdf_bytes, None
-					except Exception as e:
-						print(f"ImageToLatexCompiler: Failed to read PDF: {str(e)}")
-						return False, None, f"Failed to read PDF: {str(e)}"
-				else:
-					print("ImageToLatexCompiler: Converting to PNG...")
-					png_bytes, error_msg = self._pdf_to_png(pdf_file)
-					print(f"ImageToLatexCompiler: PNG conversion result: bytes={len(png_bytes) if png_bytes else 'None'}, error_msg={error_msg}")
-					if png_bytes is None:
-						print("ImageToLatexCompiler: PNG conversion failed, creating mock PNG")
-						png_bytes, error_msg = self._create_mock_png(pdf_file)
-						print(f"ImageToLatexCompiler: Mock PNG result: bytes={len(png_bytes) if png_bytes else 'None'}, error_msg={error_msg}")
-						if png_bytes is None:
-							print(f"ImageToLatexCompiler: Failed to create mock PNG: {error_msg}")
-							return False, None, error_msg
-					return True, png_bytes, None
-		except Exception as e:
-			print(f"ImageToLatexCompiler: Exception occurred: {str(e)}")
-			return False, None, f"Compilation failed: {str(e)}"
-
-	def _compile_with_tectonic(self, tex_file: Path) -> Tuple[bool, Optional[str]]:
-		try:
-			tectonic_paths = settings.get_tectonic_paths()
-			print(f"ImageToLatexCompiler: Searching for Tectonic in {len(tectonic_paths)} paths...")
-			tectonic_cmd = None
-			for path in tectonic_paths:
-				print(f"ImageToLatexCompiler: Trying Tectonic path: {path}")
-				try:
-					result = subprocess.run([path, '--version'], capture_output=True, timeout=10)
-					if result.returncode == 0:
-						tectonic_cmd = str(Path(path).expanduser().resolve())
-						print(f"ImageToLatexCompiler: Found working Tectonic at: {tectonic_cmd}")
-						break
-					else:
-						print(f"ImageToLatexCompiler: Path {path} returned non-zero exit code")
-				except FileNotFoundError:
-					print(f"ImageToLatexCompiler: Path {path} not found")
-				except subprocess.TimeoutExpired:
-					print(f"ImageToLatexCompiler: Path {path} timed out")
-				except Exception as e:
-					print(f"ImageToLatexCompiler: Path {path} error: {str(e)}")
-			
-			if not tectonic_cmd:
-				print("ImageToLatexCompiler: No working Tectonic found")
-				return False, "Tectonic not found"
-			
-			print(f"ImageToLatexCompiler: Using Tectonic: {tectonic_cmd}")
-			print(f"ImageToLatexCompiler: Compiling file: {tex_file}")
-			original_dir = os.getcwd()
-			os.chdir(tex_file.parent)
-			print(f"ImageToLatexCompiler: Changed to directory: {tex_file.parent}")
-			try:
-				env = os.environ.copy()
-				env['FONTCONFIG_FILE'] = ''
-				env['FONTCONFIG_PATH'] = ''
-				env['TECTONIC_MINIMAL_MODE'] = '1'
-				print(f"ImageToLatexCompiler: Running Tectonic with minimal mode...")
-				result = subprocess.run([tectonic_cmd, str(tex_file)], capture_output=True, env=env, timeout=self.timeout)
-				os.chdir(original_dir)
-				
-				print(f"ImageToLatexCompiler: Tectonic exit code: {result.returncode}")
-				if result.stdout:
-					print(f"ImageToLatexCompiler: Tectonic stdout (first 300 chars): {result.stdout.decode('utf-8', errors='ignore')[:300]}")
-				if result.stderr:
-					print(f"ImageToLatexCompiler: Tectonic stderr (first 300 chars): {result.stderr.decode('utf-8', errors='ignore')[:300]}")
-				
-				if result.returncode == 0:
-					print("ImageToLatexCompiler: Tectonic compilation successful!")
-					return True, None
-				else:
-					error_msg = result.stderr.decode('utf-8')
-					print(f"ImageToLatexCompiler: Tectonic compilation failed with error")
-					return False, error_msg
-			except Exception as e:
-				os.chdir(original_dir)
-				print(f"ImageToLatexCompiler: Exception during Tectonic compilation: {str(e)}")
-				return False, str(e)
-		except Exception as e:
-			print(f"ImageToLatexCompiler: Exception in _compile_with_tectonic: {str(e)}")
-			return False, str(e)
+		print(f"ImageToLatexCompiler: Starting compilation to {output_format}")
+		print(f"ImageToLatexCompiler: Input LaTeX length: {len(latex_code)}")
+		print(f"ImageToLatexCompiler: Assets count: {len(assets) if assets else 0}")
+
+		# Opt-in artifact retention: keep the compiled PDF for inspection
+		artifact_dir = Path(settings.COMPILE_ARTIFACT_DIR) if settings.COMPILE_ARTIFACT_DIR else None
+
+		result = await compile_engine.compile(CompileJob(
+			latex=self._create_complete_document(latex_code),
+			output_format=output_format,
+			tex_name="imagetolatex",
+			assets=assets or [],
+			dpi=200,
+			timeout=self.timeout,
+			artifact_dir=artifact_dir,
+			label="ImageToLatexCompiler",
+			user_id=user_id,
+			priority=priority,
+			quality=quality,
+			exports=tuple(exports),
+		))
+		print(f"ImageToLatexCompiler: Compile result: success={result.success}, stage={result.stage}")
+
+		if result.success:
+			return result
+
+		if result.stage == "tectonic":
+			print(f"ImageToLatexCompiler: Tectonic error message (first 500 chars): {(result.error or '')[:500]}")
+			result.error = self._format_compilation_error(result.error)
+		elif result.stage == "rasterize" and output_format == "png":
+			print(f"ImageToLatexCompiler: PNG conversion failed ({result.error}), creating mock PNG")
+			png_bytes, error_msg = self._create_mock_png()
+			if png_bytes is not None:
+				return CompileResult(True, content=png_bytes, timings=result.timings)
+			result.error = error_msg
+		return result
 
 	def _format_compilation_error(self, error_msg: str) -> str:
 		"""
@@ -315,34 +219,7 @@ startxref
 		except Exception as e:
 			return False, f"Failed to create mock PDF: {str(e)}"
 
-	def _pdf_to_png(self, pdf_file: Path) -> Tuple[Optional[bytes], Optional[str]]:
-		if not PDF2IMAGE_AVAILABLE:
-			return None, "pdf2image not available"
-		try:
-			# Get Poppler paths from settings
-			poppler_paths = settings.get_poppler_paths()
-			poppler_path = None
-			for path in poppler_paths:
-				if os.path.exists(path) and os.path.exists(os.path.join(path, "pdftoppm.exe")):
-					poppler_path = path
-					break
-			print(f"ImageToLatexCompiler: Using poppler_path for pdf2image: {poppler_path}")
-			# Pass poppler_path if found
-			kwargs = {"dpi": 200, "fmt": "png"}
-			if poppler_path:
-				kwargs["poppler_path"] = poppler_path
-			images = convert_from_path(str(pdf_file), **kwargs)
-			if not images:
-				return None, "PDF to PNG conversion failed"
-			img = images[0]
-			with io.BytesIO() as output:
-				img.save(output, format="PNG")
-				return output.getvalue(), None
-		except Exception as e:
-			print(f"ImageToLatexCompiler: pdf2image conversion error: {str(e)}")
-			return None, str(e)
-
-	def _create_mock_png(self, pdf_file: Path) -> Tuple[Optional[bytes], Optional[str]]:
+	def _create_mock_png(self) -> Tuple[Optional[bytes], Optional[str]]:
 		"""Create a mock PNG for development when PDF to PNG conversion tools are not available"""
 		try:
 			# Create a simple PNG header and basic image data
@@ -361,10 +238,6 @@ startxref
 				0x00, 0x00, 0x00, 0x00, 0x49, 0x45, 0x4E, 0x44,  # IEND chunk
 				0xAE, 0x42, 0x60, 0x82
 			])
-			png_file = pdf_file.with_suffix('.png')
-			with open(png_file, 'wb') as f:
-				f.write(png_data)
-
 			return bytes(png_data), None
 		except Exception as e:
 			return None, f"Failed to create mock PNG: {str(e)}"
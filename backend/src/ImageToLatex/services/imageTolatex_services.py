@@ -9,6 +9,7 @@ from typing import Dict, Any
 
 import httpx
 from src.config import get_settings
+from src.compilation.services import lint_latex
 
 # Get settings instance
 settings = get_settings()
@@ -301,6 +302,7 @@ class ImageToLatexService:
         - Try Gemini first
         - Fallback to Groq (if configured)
         - Post-process: strip code fences, escape stray &, wrap into minimal document if needed
+        - Lint the result; data["lint_errors"] lists what would still fail before compiling
         """
         prompt = (
             "Fix this LaTeX so it compiles.\n"
@@ -367,6 +369,9 @@ class ImageToLatexService:
             else:
                 result["data"]["content"] = content
 
+            # Structural problems the model left behind; the compile endpoint would reject these
+            result["data"]["lint_errors"] = [e.as_dict() for e in lint_latex(result["data"]["content"])]
+
         return result
 
     async def improve_text(self, text: str) -> Dict[str, Any]:
@@ -1,11 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
-from pydantic import BaseModel
-from typing import Optional
-from uuid import UUID
+from fastapi import APIRouter, HTTPException, Depends, Header
 from sqlmodel import Session
-from io import BytesIO
 import logging
+from typing import Optional
 
 from ..schemas.table_schemas import TableGenerateRequest, TableGenerateResponse
 from ..services.latex_generator import table_latex_generator
@@ -14,6 +10,9 @@ from ...auth.routes import get_current_user, User
 from ...auth.access import check_sub_project_access
 from ...auth.middleware.credits_middleware import require_credits
 from ...auth.models.credits import ServiceType
+from ...compilation.responses import compile_error_response, compile_export_response, compile_output_response
+from ...compilation.schemas import CompileRequest
+from ...compilation.services import is_priority_user
 from ...utils.database import get_session
 
 logger = logging.getLogger(__name__)
@@ -21,11 +20,6 @@ logger = logging.getLogger(__name__)
 table_router = APIRouter()
 compiler = TableLatexCompiler()
 
-class CompileRequest(BaseModel):
-    latex_code: str
-    output_format: str = "pdf"
-    sub_project_id: Optional[UUID] = None
-
 @table_router.post("/generate", response_model=TableGenerateResponse)
 @require_credits(ServiceType.TABLE_GENERATION)
 async def generate_table_latex(
@@ -81,7 +75,8 @@ async def preview_table(
 async def compile_table_latex(
     request: CompileRequest,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    accept: Optional[str] = Header(None)
 ):
     """
     Compile LaTeX code into the specified output format (PDF or PNG).
@@ -94,19 +89,22 @@ async def compile_table_latex(
              raise HTTPException(status_code=403, detail="Not authorized to access this project")
 
     try:
-        success, output, error_msg = compiler.compile_latex(request.latex_code, request.output_format)
-        if not success:
+        result = await compiler.compile_latex(
+            request.latex_code,
+            "pdf" if request.output_formats else request.output_format,
+            user_id=current_user.id,
+            priority=is_priority_user(session, current_user.id),
+            standalone=request.standalone,
+            quality=request.output_quality,
+            exports=request.output_formats or (),
+        )
+        if not result.success:
             # Return detailed compilation error as JSON
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "detail": error_msg,
-                    "error_type": "compilation_error",
-                    "latex_code": request.latex_code[:500] + "..." if len(request.latex_code) > 500 else request.latex_code
-                }
-            )
+            return compile_error_response(result, request.latex_code)
 
-        return StreamingResponse(BytesIO(output), media_type="application/pdf" if request.output_format == "pdf" else "image/png")
+        if request.output_formats:
+            return await compile_export_response(result, accept)
+        return compile_output_response(result, request.output_format)
     except HTTPException:
         raise
     except Exception as e:
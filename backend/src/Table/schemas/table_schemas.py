@@ -16,6 +16,7 @@ class TableData(BaseModel):
 
 class TableProjectData(BaseModel):
     cells: List[List[Dict[str, Any]]]  # More flexible cell structure
+    standalone: bool = False  # Crop the document to the table (previews)
 
 class TableGenerateRequest(BaseModel):
     data: TableProjectData
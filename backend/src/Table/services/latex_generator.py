@@ -1,11 +1,26 @@
 import json
 from typing import Dict, Any
 
+from src.compilation.services import to_standalone
+
 class TableLatexGenerator:
     """Service for generating LaTeX code specifically for tables"""
     
-    def _create_complete_document(self, content: str, title: str = "Generated Table") -> str:
-        """Create a complete LaTeX document optimized for tables"""
+    def _create_complete_document(self, content: str, title: str = "Generated Table", standalone: bool = False) -> str:
+        """Create a complete LaTeX document optimized for tables
+
+        With standalone=True the title block is dropped and the page is cropped to
+        the table, unless the table style needs a full page (longtable).
+        """
+        if standalone:
+            standalone_document = to_standalone(self._create_page_document(content, title, heading=False))
+            if standalone_document is not None:
+                return standalone_document
+        return self._create_page_document(content, title)
+
+    def _create_page_document(self, content: str, title: str, heading: bool = True) -> str:
+        """Wrap the table in a full article page, with title and section heading unless heading=False"""
+        heading_block = "\\maketitle\n\n\\section{Generated Table}\n\n" if heading else ""
         return f"""\\documentclass[12pt]{{article}}
 \\usepackage[utf8]{{inputenc}}
 \\usepackage[T1]{{fontenc}}
@@ -71,11 +86,7 @@ class TableLatexGenerator:
 
 \\begin{{document}}
 
-\\maketitle
-
-\\section{{Generated Table}}
-
-{content}
+{heading_block}{content}
 
 \\end{{document}}"""
 
@@ -108,8 +119,8 @@ class TableLatexGenerator:
         else:
             table_content = self._generate_standard_table(cells, table_data)
         
-        # Create complete document
-        return self._create_complete_document(table_content, "Table Document")
+        # Create complete document (tight bounding box for previews when requested)
+        return self._create_complete_document(table_content, "Table Document", standalone=table_data.get('standalone', False))
     
     def _generate_standard_table(self, cells: list, table_data: Dict[str, Any]) -> str:
         """Generate a standard tabular table"""
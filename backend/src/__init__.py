@@ -24,14 +24,28 @@ logging.basicConfig(level=logging.INFO)
 async def lifespan(app: FastAPI):
     """Application lifespan: run startup and shutdown logic here.
 
-    Startup: test DB connection and log results.
-    Shutdown: perform any cleanup if needed.
+    Startup: probe the LaTeX toolchain once, warm the Tectonic bundle cache,
+    test DB connection and log results.
+    Shutdown: stop admitting compiles and drain the compile queue.
     """
     # STARTUP
     try:
-        logger.info("Lifespan startup: testing database connection...")
+        from src.compilation.services import toolchain
         logger.info(f"Configured TECTONIC_PATH: {settings.TECTONIC_PATH}")
         logger.info(f"Configured POPPLER_PATH: {settings.POPPLER_PATH}")
+        await toolchain.probe()
+    except Exception as e:
+        logger.exception(f"Toolchain probe failed during startup: {e}")
+
+    try:
+        from src.compilation.warmup import warm_up_bundle
+        logger.info(f"Lifespan startup: warming Tectonic bundle cache ({settings.TECTONIC_CACHE_DIR or 'default cache dir'})...")
+        await warm_up_bundle()
+    except Exception as e:
+        logger.exception(f"Bundle warm-up failed during startup: {e}")
+
+    try:
+        logger.info("Lifespan startup: testing database connection...")
         # test_database_connection is synchronous (using sync DB engine). Run it in threadpool.
         ok = await run_in_threadpool(test_database_connection)
         if ok:
@@ -46,6 +60,8 @@ async def lifespan(app: FastAPI):
     # SHUTDOWN
     try:
         logger.info("Lifespan shutdown: cleaning up resources...")
+        from src.compilation.services import compile_scheduler
+        await compile_scheduler.drain(settings.COMPILE_DRAIN_TIMEOUT)
     except Exception:
         logger.exception("Exception during shutdown cleanup")
 
@@ -75,7 +91,23 @@ app.add_middleware(
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Health check endpoint to verify that the API is running."""
-    return {"status": "ok", "version": version}
+    from src.compilation.services import asset_cache, compile_cache, compile_jobs, compile_scheduler, fix_cache, image_normalizer, latex_fixer, page_renderer, preamble_formats, project_assembler, tikz_externalizer, toolchain
+    return {
+        "status": "ok",
+        "version": version,
+        "toolchain": toolchain.describe(),
+        "compile_cache": compile_cache.stats(),
+        "preamble_formats": preamble_formats.stats(),
+        "compile_scheduler": compile_scheduler.stats(),
+        "compile_jobs": compile_jobs.stats(),
+        "page_cache": page_renderer.stats(),
+        "latex_fixer": latex_fixer.stats(),
+        "fix_cache": fix_cache.stats(),
+        "asset_cache": asset_cache.stats(),
+        "image_normalizer": image_normalizer.stats(),
+        "tikz_externalizer": tikz_externalizer.stats(),
+        "project_assembler": project_assembler.stats(),
+    }
 
 
  
@@ -108,6 +140,14 @@ except Exception:
     logger.exception("Failed to import/include table router")
 
 
+# Asynchronous compile jobs
+try:
+    from src.compilation.routes import router as _compile_router
+    app.include_router(_compile_router, prefix="/compile", tags=["compile"])
+except Exception:
+    logger.exception("Failed to import/include compile router")
+
+
 # ImageToLatex routes (package bundles multiple routers)
 try:
     from src.ImageToLatex.routes import ImageToLatex_Router as _imagetolatex_router
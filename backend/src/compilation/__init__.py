@@ -0,0 +1,3 @@
+"""Compilation package. Shared LaTeX compile path under src.compilation.*"""
+
+__all__ = ["services", "routes", "schemas"]
@@ -0,0 +1,143 @@
+"""
+HTTP responses for compiled outputs.
+
+Outputs stored in the compile cache are served straight from the cache file
+with FileResponse: Content-Length, Range requests, and zero-copy `pathsend`
+on ASGI servers that support it. Outputs that only exist in memory (cache
+disabled or entry too large) are sent as a plain Response with Content-Length.
+
+Failed compiles share one JSON error body. Documents rejected by the
+pre-compile linter carry their structured `lint_errors` (line, column, message).
+
+Outputs fetched back by URL are typed from their stored bytes (stored_format),
+never from the URL.
+
+Multi-format exports (`output_formats`) are returned as a JSON manifest, or as
+multipart/mixed when the client sends `Accept: multipart/mixed`.
+"""
+
+import asyncio
+import base64
+import uuid
+from typing import Optional
+
+from fastapi import Response
+from fastapi.responses import FileResponse, JSONResponse
+
+from src.compilation.services import CompileResult
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+def stored_format(result: CompileResult) -> Optional[str]:
+    """Output format of a stored result, from its leading bytes; None when it is none of MEDIA_TYPES."""
+    if result.path is not None:
+        try:
+            with open(result.path, "rb") as f:
+                head = f.read(512)
+        except OSError:
+            return None
+    else:
+        head = (result.content or b"")[:512]
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in head):
+        return "svg"
+    return None
+
+
+def compile_output_response(result: CompileResult, output_format: str) -> Response:
+    """Serve a successful compile result, from its cache file when it has one."""
+    media_type = MEDIA_TYPES.get(output_format, "application/octet-stream")
+    headers = {"Server-Timing": result.server_timing}
+    if result.render_id:
+        # Other pages: GET /compile/renders/{X-Render-Id}/pages/{n}.png
+        headers["X-Render-Id"] = result.render_id
+
+    if result.path is not None and result.path.exists():
+        # Cache entries are named by their content address, a stable ETag across hits
+        headers["ETag"] = f'"{result.path.name}"'
+        return FileResponse(result.path, media_type=media_type, headers=headers)
+    if result.content is not None:
+        return Response(content=result.content, media_type=media_type, headers=headers)
+    return JSONResponse(
+        status_code=410,
+        content={"detail": "Compiled output is no longer available, compile again", "error_type": "expired"},
+    )
+
+
+def compile_error_response(result: CompileResult, latex_code: str) -> JSONResponse:
+    """400 response for a failed compile, with the linter's errors when it rejected the document."""
+    content = {
+        "detail": result.error,
+        "error_type": "lint_error" if result.stage == "lint" else "compilation_error",
+        "latex_code": latex_code[:500] + "..." if len(latex_code) > 500 else latex_code,
+    }
+    if result.lint_errors:
+        content["lint_errors"] = [e.as_dict() for e in result.lint_errors]
+    return JSONResponse(status_code=400, content=content, headers={"Server-Timing": result.server_timing})
+
+
+def output_url(result: CompileResult, output_format: str) -> Optional[str]:
+    """Download URL of a cached output (GET /compile/outputs/{key}.{format})."""
+    if result.path is None:
+        return None
+    return f"/compile/outputs/{result.path.name}.{output_format}"
+
+
+def export_manifest(result: CompileResult) -> dict:
+    """JSON manifest for a multi-format export.
+
+    Cached outputs are referenced by URL. Outputs that only exist in memory are
+    inlined as base64.
+    """
+    outputs = []
+    for output_format, output in result.exports.items():
+        entry = {"format": output_format, "media_type": MEDIA_TYPES[output_format], "success": output.success}
+        if not output.success:
+            entry["error"] = output.error
+        else:
+            entry["size"] = output.size
+            url = output_url(output, output_format)
+            if url is not None:
+                entry["url"] = url
+            else:
+                entry["data"] = base64.b64encode(output.content).decode("ascii")
+        outputs.append(entry)
+    return {"outputs": outputs, "render_id": result.render_id, "timings": result.timings}
+
+
+async def compile_export_response(result: CompileResult, accept: Optional[str] = None) -> Response:
+    """Serve every format of a multi-format export in one response."""
+    headers = {"Server-Timing": result.server_timing}
+    if not accept or "multipart/mixed" not in accept:
+        return JSONResponse(content=export_manifest(result), headers=headers)
+
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for output_format, output in result.exports.items():
+        body += f"--{boundary}\r\n".encode()
+        if output.success:
+            content = await asyncio.to_thread(output.read_bytes)
+            body += (
+                f"Content-Type: {MEDIA_TYPES[output_format]}\r\n"
+                f'Content-Disposition: attachment; filename="output.{output_format}"\r\n'
+                f"Content-Length: {len(content)}\r\n\r\n"
+            ).encode()
+            body += content
+        else:
+            body += (
+                "Content-Type: text/plain; charset=utf-8\r\n"
+                f'Content-Disposition: attachment; filename="output.{output_format}.error"\r\n\r\n'
+            ).encode()
+            body += (output.error or "Conversion failed").encode("utf-8")
+        body += b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return Response(content=bytes(body), media_type=f"multipart/mixed; boundary={boundary}", headers=headers)
@@ -0,0 +1,397 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlmodel import Session, select
+import asyncio
+import json
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, List, Literal, Optional
+from uuid import UUID
+
+from src.auth.access import check_project_access, check_sub_project_access
+from src.auth.middleware.credits_middleware import create_credit_checker, require_credits
+from src.auth.models.credits import ServiceType
+from src.auth.models.project import FileType, ProjectFile
+from src.auth.models.sub_project import SubProject, SubProjectFileLink
+from src.auth.services.credits_service import CreditsService
+from src.auth.routes import get_current_user, User
+from src.compilation.responses import compile_error_response, compile_export_response, compile_output_response, stored_format
+from src.compilation.schemas import (
+    CompileJobRequest,
+    CompileJobResponse,
+    CompileJobStatus,
+    LintRequest,
+    LintResponse,
+    ProjectCompileRequest,
+)
+from src.compilation.services import (
+    CompileQueueFull,
+    CompileResult,
+    Fragment,
+    MAX_DPI,
+    MIN_DPI,
+    PreviewSession,
+    RasterizeError,
+    SUPPORTED_FORMATS,
+    asset_cache,
+    compile_cache,
+    compile_jobs,
+    compile_scheduler,
+    is_priority_user,
+    lint_failures,
+    lint_latex,
+    page_renderer,
+    project_assembler,
+)
+from src.Diagram.services.compiler import diagram_compiler
+from src.HandWrittenFlowChartToLatex.services import flowchart_compiler
+from src.Table.services.compiler import table_compiler
+from src.utils.database import get_session
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Compilers reachable through the job API, keyed by CompileJobRequest.kind
+COMPILERS = {
+    "diagram": diagram_compiler,
+    "table": table_compiler,
+    "flowchart": flowchart_compiler,
+}
+
+# Compilers that support the tight-bounding-box preview layout
+STANDALONE_KINDS = ("diagram", "table")
+
+# Cached output names: "<cache key>.<format>"
+OUTPUT_NAME = re.compile(r"^([0-9a-f]{64})\.(pdf|png|svg)$")
+RENDER_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _get_job(job_id: str, current_user: User):
+    record = compile_jobs.get(job_id, current_user.id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Compile job not found")
+    return record
+
+
+@router.post("/jobs", response_model=CompileJobResponse, status_code=status.HTTP_202_ACCEPTED)
+@require_credits(ServiceType.LATEX_COMPILATION)
+async def submit_compile_job(
+    request: CompileJobRequest,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """
+    Queue a diagram, table or flowchart compile and return its job id immediately.
+    Follow progress with GET /compile/jobs/{id} or the SSE stream at /compile/jobs/{id}/events.
+    """
+    if request.output_format not in SUPPORTED_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid output format. Must be 'pdf', 'png' or 'svg'")
+
+    if request.sub_project_id:
+        sub, project, is_owner = check_sub_project_access(session, request.sub_project_id, current_user.id)
+        if not project:
+            raise HTTPException(status_code=403, detail="Not authorized to access this project")
+
+    priority = is_priority_user(session, current_user.id)
+    # Reject with 429 now rather than accepting a job that cannot be queued
+    compile_scheduler.check_admission(current_user.id, priority)
+
+    compiler = COMPILERS[request.kind]
+    output_format = "pdf" if request.output_formats else request.output_format
+    options = {
+        "user_id": current_user.id,
+        "priority": priority,
+        "quality": request.output_quality,
+        "exports": request.output_formats or (),
+    }
+    if request.kind in STANDALONE_KINDS:
+        options["standalone"] = request.standalone
+    record = compile_jobs.submit(
+        kind=request.kind,
+        user_id=current_user.id,
+        output_format=output_format,
+        compile_fn=lambda: compiler.compile_latex(request.latex_code, output_format, **options),
+    )
+    return CompileJobResponse(
+        job_id=record.id,
+        status=record.status,
+        status_url=f"/compile/jobs/{record.id}",
+        events_url=f"/compile/jobs/{record.id}/events",
+        result_url=f"/compile/jobs/{record.id}/result",
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=CompileJobStatus)
+async def get_compile_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Return the current status of a compile job."""
+    return CompileJobStatus(**_get_job(job_id, current_user).describe())
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_compile_job_events(job_id: str, current_user: User = Depends(get_current_user)):
+    """
+    Server-Sent Events stream of the job's stages: queued, running, rasterizing, done (or failed).
+    Past stages are replayed first, and the stream closes once the job finishes.
+    """
+    record = _get_job(job_id, current_user)
+
+    async def event_stream():
+        async for event in compile_jobs.events(record):
+            yield f"event: {event['status']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_compile_job_result(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    accept: Optional[str] = Header(None)
+):
+    """Download the compiled PDF/PNG of a finished job (the export manifest for `output_formats` jobs)."""
+    record = _get_job(job_id, current_user)
+    if not record.finished:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Compile job has not finished yet", "status": record.status},
+        )
+    if record.status == "failed":
+        lint_errors = record.result.lint_errors if record.result else []
+        content = {"detail": record.error, "error_type": "lint_error" if lint_errors else "compilation_error"}
+        if lint_errors:
+            content["lint_errors"] = [e.as_dict() for e in lint_errors]
+        return JSONResponse(status_code=400, content=content)
+    if record.result.exports:
+        return await compile_export_response(record.result, accept)
+    return compile_output_response(record.result, record.output_format)
+
+
+@router.get("/outputs/{name}")
+async def get_compiled_output(name: str, current_user: User = Depends(get_current_user)):
+    """Download one output of a multi-format export by the URL listed in its manifest.
+
+    Only users the output was compiled for can fetch it. It is served with the
+    media type of the stored file, and a suffix naming another format is not found.
+    """
+    match = OUTPUT_NAME.match(name)
+    if not match or not await asyncio.to_thread(compile_cache.granted, match.group(1), str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Compiled output not found or expired")
+    path = await asyncio.to_thread(compile_cache.get_path, match.group(1))
+    result = CompileResult(True, path=path)
+    if path is None or await asyncio.to_thread(stored_format, result) != match.group(2):
+        raise HTTPException(status_code=404, detail="Compiled output not found or expired")
+    return compile_output_response(result, match.group(2))
+
+
+@router.get("/renders/{render_id}/pages/{page}.png")
+async def get_rendered_page(
+    render_id: str,
+    page: int,
+    dpi: int = Query(150, ge=MIN_DPI, le=MAX_DPI),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Rasterize one page of a compiled PDF on demand, at the requested DPI.
+    `render_id` is the X-Render-Id header of a compile response. Pages are cached,
+    so scrolling back through a long document does not re-render it. Only users
+    the document was compiled for can render its pages.
+    """
+    if not RENDER_ID.match(render_id) or page < 1:
+        raise HTTPException(status_code=404, detail="Page not found")
+    if not await asyncio.to_thread(compile_cache.granted, render_id, str(current_user.id)):
+        raise HTTPException(status_code=404, detail="Compiled document not found or expired, compile again")
+    try:
+        result = await page_renderer.render(render_id, page, dpi)
+    except RasterizeError as e:
+        raise HTTPException(status_code=404, detail=f"Page {page} cannot be rendered: {str(e)}")
+    if result is None:
+        raise HTTPException(status_code=404, detail="Compiled document not found or expired, compile again")
+    if await asyncio.to_thread(stored_format, result) != "png":
+        raise HTTPException(status_code=404, detail=f"Page {page} cannot be rendered")
+    return compile_output_response(result, "png")
+
+
+@router.post("/projects/{project_id}")
+async def compile_project(
+    project_id: UUID,
+    request: ProjectCompileRequest,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+    credit_check: dict = Depends(create_credit_checker(ServiceType.LATEX_COMPILATION)),
+):
+    """
+    Compile a whole project: its latex_content and preamble, with every sub-project
+    compiled concurrently as a cached standalone fragment and included where
+    `\\subproject{<id>}` places it (appended in order when nothing is placed).
+    Only sub-projects that changed since the last compile are recompiled.
+    """
+    project, is_owner = check_project_access(session, project_id, current_user.id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    sub_projects = session.exec(
+        select(SubProject)
+        .where(SubProject.project_id == project_id)
+        .order_by(SubProject.created_at)
+    ).all()
+
+    # Linked images of all sub-projects in one query, each file fetched once
+    files_by_sub_project: Dict[UUID, List[ProjectFile]] = defaultdict(list)
+    if sub_projects:
+        links = session.exec(
+            select(SubProjectFileLink.sub_project_id, ProjectFile)
+            .join(ProjectFile, SubProjectFileLink.project_file_id == ProjectFile.id)
+            .where(
+                SubProjectFileLink.sub_project_id.in_([sub.id for sub in sub_projects]),
+                ProjectFile.file_type == FileType.IMAGE,
+                ProjectFile.file_url.is_not(None),
+            )
+        ).all()
+        for sub_project_id, project_file in links:
+            files_by_sub_project[sub_project_id].append(project_file)
+    project_files = list({f.id: f for files in files_by_sub_project.values() for f in files}.values())
+    fetched = await asset_cache.get_many([(f.file_url, f.filename, f.updated_at) for f in project_files])
+    # By file, not filename: sub-projects may each link their own "figure.png"
+    assets = {f.id: asset for f, asset in zip(project_files, fetched) if asset is not None}
+
+    fragments = [
+        Fragment(
+            id=str(sub.id),
+            title=sub.title,
+            latex=sub.latex_code or "",
+            assets=[assets[f.id] for f in files_by_sub_project[sub.id] if f.id in assets],
+        )
+        for sub in sub_projects
+    ]
+    result = await project_assembler.compile(
+        project.latex_content,
+        project.preamble,
+        fragments,
+        request.output_format,
+        user_id=current_user.id,
+        priority=is_priority_user(session, current_user.id),
+        quality=request.output_quality,
+    )
+    if not result.success:
+        return compile_error_response(result, project.latex_content or "")
+
+    await credit_check["credits_service"].consume_credits(
+        current_user.id,
+        ServiceType.LATEX_COMPILATION,
+        {"output_format": request.output_format, "project_id": str(project_id), "sub_projects": len(fragments)}
+    )
+    return compile_output_response(result, request.output_format)
+
+
+@router.post("/lint", response_model=LintResponse)
+async def lint_document(request: LintRequest, current_user: User = Depends(get_current_user)):
+    """
+    Check a document for unbalanced braces, mismatched \\begin/\\end and unknown
+    environments without compiling it. Runs in milliseconds and costs no credits,
+    so editors can call it on every keystroke. Only problems with severity
+    "error" make the document invalid; warnings are compiled anyway.
+    """
+    errors = lint_latex(request.latex_code)
+    return LintResponse(valid=not lint_failures(errors), errors=[e.as_dict() for e in errors])
+
+
+@router.websocket("/preview")
+async def live_preview(
+    websocket: WebSocket,
+    token: str = Query(...),
+    kind: str = Query("diagram"),
+    standalone: bool = Query(True),
+    quality: Literal["preview", "final"] = Query("preview"),
+    session: Session = Depends(get_session)
+):
+    """
+    Live preview for the diagram and table editors.
+
+    The client sends `{"revision": n, "latex_code": "..."}` on every edit. Revisions
+    are debounced and compiled at preview quality (`quality=final` for full quality),
+    the compile of a superseded revision is cancelled, and only the newest PNG is
+    pushed back: a JSON `{"type": "preview", "revision": n, ...}` header
+    followed by a binary frame. Failures arrive as `{"type": "error", ...}`.
+    """
+    try:
+        current_user = get_current_user(token, session)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    if kind not in STANDALONE_KINDS:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=f"Live preview supports {', '.join(STANDALONE_KINDS)}")
+        return
+
+    await websocket.accept()
+    compiler = COMPILERS[kind]
+    credits_service = CreditsService(session)
+    priority = is_priority_user(session, current_user.id)
+
+    async def compile_revision(latex_code: str) -> CompileResult:
+        availability = await credits_service.check_credits_availability(current_user.id, ServiceType.LATEX_COMPILATION)
+        if not availability.get("has_credits") and not availability.get("is_unlimited"):
+            return CompileResult(False, error="Insufficient credits", stage="credits")
+        try:
+            return await compiler.compile_latex(
+                latex_code,
+                "png",
+                user_id=current_user.id,
+                priority=priority,
+                standalone=standalone,
+                quality=quality,
+            )
+        except CompileQueueFull:
+            return CompileResult(False, error="Compile queue is full, retrying shortly", stage="queue")
+
+    async def publish(revision: int, result: CompileResult) -> None:
+        if not result.success:
+            await websocket.send_json({
+                "type": "error",
+                "revision": revision,
+                "detail": result.error,
+                "error_type": "compilation_error" if result.stage == "tectonic" else result.stage,
+                "lint_errors": [e.as_dict() for e in result.lint_errors],
+            })
+            return
+        await websocket.send_json({
+            "type": "preview",
+            "revision": revision,
+            "media_type": "image/png",
+            "size": result.size,
+            "server_timing": result.server_timing,
+        })
+        await websocket.send_bytes(await asyncio.to_thread(result.read_bytes))
+        await credits_service.consume_credits(
+            current_user.id,
+            ServiceType.LATEX_COMPILATION,
+            {"endpoint": "live_preview", "auto_consumed": True}
+        )
+
+    preview = PreviewSession(compile_revision, publish)
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                latex_code = message["latex_code"]
+                revision = int(message.get("revision") or preview.revision + 1)
+                if not isinstance(latex_code, str):
+                    raise TypeError("latex_code must be a string")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                await websocket.send_json({
+                    "type": "error",
+                    "detail": 'Expected {"revision": n, "latex_code": "..."}',
+                    "error_type": "invalid_message",
+                })
+                continue
+            preview.submit(revision, latex_code)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await preview.close()
+        logger.info(f"Live preview closed for user {current_user.id}: {preview.stats()}")
@@ -0,0 +1,67 @@
+from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional
+from uuid import UUID
+
+
+class CompileRequest(BaseModel):
+    """Request for compiling LaTeX to PDF/PNG"""
+    latex_code: str
+    output_format: str = "pdf"  # 'pdf', 'png' or 'svg'
+    sub_project_id: Optional[UUID] = None
+    standalone: bool = False  # Diagram/table previews cropped to the content
+    output_quality: Literal["preview", "final"] = "final"  # preview: one pass, draft graphics, low DPI
+    output_formats: Optional[List[Literal["pdf", "png", "svg"]]] = None  # export all of these from one compile
+
+
+class CompileJobRequest(CompileRequest):
+    """Request for an asynchronous compile through POST /compile/jobs"""
+    kind: Literal["diagram", "table", "flowchart"]
+
+
+class ProjectCompileRequest(BaseModel):
+    """Request for compiling a whole project through POST /compile/projects/{project_id}"""
+    output_format: Literal["pdf", "png", "svg"] = "pdf"
+    output_quality: Literal["preview", "final"] = "final"
+
+
+class CompileJobResponse(BaseModel):
+    """Returned as soon as an asynchronous compile is accepted"""
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+    result_url: str
+
+
+class LintErrorItem(BaseModel):
+    """One structural problem found by the pre-compile linter (1-based line and column)"""
+    line: int
+    column: int
+    message: str
+    severity: str = "error"  # error | warning
+
+
+class LintRequest(BaseModel):
+    """Request for checking a document without compiling it"""
+    latex_code: str
+
+
+class LintResponse(BaseModel):
+    """Result of POST /compile/lint"""
+    valid: bool
+    errors: List[LintErrorItem] = []
+
+
+class CompileJobStatus(BaseModel):
+    """Current state of an asynchronous compile"""
+    job_id: str
+    kind: str
+    status: str  # queued | running | rasterizing | done | failed
+    output_format: str
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
+    cache_hit: bool = False
+    timings: Dict[str, float] = {}
+    usage: Dict[str, float] = {}  # max_rss_mb and cpu_seconds of the compile tools
+    lint_errors: List[LintErrorItem] = []  # structural errors found before Tectonic ran
@@ -0,0 +1,124 @@
+"""
+Compilation Services Module
+
+Shared compile path used by every LaTeX compiler in the app:
+- LatexCompileEngine: runs Tectonic and rasterization without blocking the event loop
+- CompileCache: content-addressed disk cache of compiled outputs with LRU eviction
+- PreambleFormatCache: one precompiled Tectonic format per distinct preamble
+- PdfRasterizer: renders only the requested pages to PNG with pdftoppm/pdftocairo
+- PageRenderer: single pages of cached PDFs rendered on demand, with a page cache of their own
+- ToolchainRegistry: tectonic/poppler paths, versions and capabilities, probed once at startup
+- CompileScheduler: bounded worker pool with fair queuing, a PRO/TEAM lane and 429 backpressure
+- CompileJobManager: background compile jobs tracked by id for polling and SSE progress
+- run_sandboxed: compile tools in their own process group under RLIMIT_AS/RLIMIT_CPU, with usage
+- PreviewSession: debounced, latest-wins live preview that cancels superseded compiles
+- lint_latex: single-pass structural check that rejects doomed documents before Tectonic
+- LatexFixer: rule-based patches for common Tectonic errors, verified by recompiling
+- FixCache: LLM fixes learned per error signature and replayed, with confidence from reuse
+- AssetCache: linked project files kept locally by content hash, revalidated by updated_at/ETag
+- ImageNormalizer: linked photos downscaled and recompressed to the size they print at
+- TikzExternalizer: tikzpictures compiled once into cached PDFs and included, so edits recompile one picture
+- ProjectAssembler: whole projects built from sub-projects compiled concurrently as cached fragments
+
+Usage:
+    from src.compilation.services import compile_engine, CompileJob
+"""
+
+from .cache import CompileCache
+from .formats import PreambleFormatCache
+from .rasterizer import PdfRasterizer, RasterizeError
+from .standalone import to_standalone
+from .engine import LatexCompileEngine, CompileJob, CompileResult, SUPPORTED_FORMATS
+from .toolchain import ToolchainRegistry, Tool
+from .scheduler import CompileScheduler, CompileQueueFull, is_priority_user
+from .jobs import CompileJobManager, CompileJobRecord
+from .preview import PreviewSession
+from .sandbox import ResourceLimits, run_sandboxed
+from .pages import PageRenderer, MIN_DPI, MAX_DPI
+from .lint import LintError, lint_failures, lint_latex
+from .fixer import LatexFixer, FixResult, parse_tectonic_log, scale_tikz_dimensions
+from .fix_cache import FixCache, error_signature
+from .assets import AssetCache
+from .images import ImageNormalizer, find_image_uses
+from .tikz import TikzExternalizer, TikzPicture
+from .assembly import ProjectAssembler, Fragment
+from src.utils.supabase_storage import storage_service
+
+# Global instances shared by all compilers
+toolchain = ToolchainRegistry()
+compile_cache = CompileCache()
+compile_scheduler = CompileScheduler()
+preamble_formats = PreambleFormatCache(toolchain)
+rasterizer = PdfRasterizer(toolchain)
+image_normalizer = ImageNormalizer()
+tikz_externalizer = TikzExternalizer()
+compile_engine = LatexCompileEngine(
+    toolchain,
+    cache=compile_cache,
+    scheduler=compile_scheduler,
+    formats=preamble_formats,
+    rasterizer=rasterizer,
+    images=image_normalizer,
+    tikz=tikz_externalizer,
+)
+compile_jobs = CompileJobManager()
+page_renderer = PageRenderer(compile_cache, rasterizer)
+latex_fixer = LatexFixer(compile_engine)
+fix_cache = FixCache(compile_engine)
+asset_cache = AssetCache(storage_service)
+project_assembler = ProjectAssembler(compile_engine)
+
+__all__ = [
+    'LatexCompileEngine',
+    'CompileJob',
+    'CompileResult',
+    'SUPPORTED_FORMATS',
+    'CompileCache',
+    'PreambleFormatCache',
+    'preamble_formats',
+    'PdfRasterizer',
+    'RasterizeError',
+    'rasterizer',
+    'to_standalone',
+    'ToolchainRegistry',
+    'Tool',
+    'toolchain',
+    'CompileScheduler',
+    'CompileQueueFull',
+    'is_priority_user',
+    'compile_scheduler',
+    'CompileJobManager',
+    'CompileJobRecord',
+    'compile_jobs',
+    'PreviewSession',
+    'ResourceLimits',
+    'run_sandboxed',
+    'PageRenderer',
+    'MIN_DPI',
+    'MAX_DPI',
+    'page_renderer',
+    'LintError',
+    'lint_latex',
+    'lint_failures',
+    'LatexFixer',
+    'FixResult',
+    'parse_tectonic_log',
+    'scale_tikz_dimensions',
+    'latex_fixer',
+    'FixCache',
+    'error_signature',
+    'fix_cache',
+    'AssetCache',
+    'asset_cache',
+    'ImageNormalizer',
+    'find_image_uses',
+    'image_normalizer',
+    'TikzExternalizer',
+    'TikzPicture',
+    'tikz_externalizer',
+    'ProjectAssembler',
+    'Fragment',
+    'project_assembler',
+    'compile_cache',
+    'compile_engine',
+]
@@ -0,0 +1,203 @@
+"""
+Project-level assembly compiles.
+
+A mother Project holds sub-projects (tables, diagrams, flowcharts, ...) next
+to its own `latex_content` and `preamble`. A project compile builds the whole
+document in two steps:
+- every placed sub-project's `latex_code` is compiled on its own as a
+  tight-box standalone fragment. Fragments compile concurrently, each in its
+  own Tectonic process under the scheduler, and the compile cache keys them
+  by content, so unchanged fragments are cache hits
+- the project document is compiled with each fragment included as an
+  \\includegraphics of its PDF, named after the fragment's compile key (source
+  and linked files), so changing only a linked image changes the project key
+
+`\\subproject{<id>}` in `latex_content` places a sub-project, optionally with
+graphicx options (`\\subproject[width=\\linewidth]{<id>}`). When the content
+places none, every sub-project is appended in order. Editing one table in a
+40-figure thesis recompiles that table and the assembly, nothing else.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional
+
+from src.config import get_settings
+from .engine import CompileJob, CompileResult, LatexCompileEngine, _read_output
+from .standalone import class_options, standalone_class, to_standalone
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SUBPROJECT = re.compile(r"\\subproject(?:\[([^\]]*)\])?\{([^}]*)\}")
+DOCUMENTCLASS = re.compile(r"\\documentclass(\[[^\]]*\])?\{[^}]*\}")
+DEFAULT_CLASS = "\\documentclass{article}"
+# Shown where \subproject names an unknown sub-project, like an undefined \ref
+MISSING = "\\textbf{??}"
+
+
+@dataclass
+class Fragment:
+    """One sub-project as handed to the assembler."""
+    id: str
+    title: str
+    latex: str
+    assets: List[dict] = field(default_factory=list)  # its linked files, as for CompileJob.assets
+
+
+def project_document(latex_content: Optional[str], preamble: Optional[str]) -> str:
+    """The project's document: `latex_content` as is when complete, else wrapped in the preamble."""
+    content = latex_content or ""
+    if "\\documentclass" in content:
+        return content
+    preamble = preamble or ""
+    if "\\documentclass" not in preamble:
+        preamble = f"{DEFAULT_CLASS}\n{preamble}"
+    return f"{preamble}\n\\begin{{document}}\n{content}\n\\end{{document}}\n"
+
+
+def fragment_document(latex: str, preamble: Optional[str]) -> str:
+    """A sub-project as a tight-box document of its own.
+
+    Complete documents are cropped with to_standalone (kept as full pages when
+    they cannot be); bare fragments get the project preamble (and class options) under the standalone class.
+    """
+    if "\\documentclass" in latex:
+        return to_standalone(latex) or latex
+    options = class_options(DOCUMENTCLASS.search(preamble or ""))
+    packages = DOCUMENTCLASS.sub("", preamble or "")
+    return f"{standalone_class(options)}\n{packages}\n\\begin{{document}}\n{latex}\n\\end{{document}}\n"
+
+
+def place_fragments(document: str, placed: Dict[str, str]) -> str:
+    """Replace \\subproject markers with the fragment PDFs in `placed` (sub-project id -> filename).
+
+    Without markers, every fragment is appended before \\end{document}, in order.
+    """
+    def include(filename: str, options: Optional[str] = None) -> str:
+        # draft=false: previews turn graphics into draft boxes, but fragments are the document's own content
+        options = f"draft=false, {options}" if options else "draft=false"
+        return f"\\includegraphics[{options}]{{{filename}}}"
+
+    if SUBPROJECT.search(document):
+        def substitute(match: re.Match) -> str:
+            filename = placed.get(match.group(2).strip())
+            return include(filename, match.group(1)) if filename else MISSING
+        document = SUBPROJECT.sub(substitute, document)
+    elif placed:
+        block = "".join(f"\\begin{{center}}\n{include(filename)}\n\\end{{center}}\n" for filename in placed.values())
+        end = document.rfind("\\end{document}")
+        document = document[:end] + block + document[end:] if end >= 0 else document + block
+
+    match = DOCUMENTCLASS.search(document)
+    if match and "{graphicx}" not in document[:document.find("\\begin{document}")]:
+        document = document[:match.end()] + "\n\\usepackage{graphicx}" + document[match.end():]
+    return document
+
+
+class ProjectAssembler:
+    """Compiles sub-projects as cached fragments and assembles the project document from them."""
+
+    def __init__(self, engine: LatexCompileEngine, concurrency: Optional[int] = None):
+        self.engine = engine
+        self.concurrency = max(1, concurrency or settings.COMPILE_PROJECT_CONCURRENCY)
+        self.projects = 0
+        self.fragments_compiled = 0
+        self.fragments_reused = 0
+
+    async def compile(
+        self,
+        latex_content: Optional[str],
+        preamble: Optional[str],
+        fragments: List[Fragment],
+        output_format: str = "pdf",
+        user_id: Optional[str] = None,
+        priority: bool = False,
+        quality: str = "final",
+    ) -> CompileResult:
+        """Compile a project document with its sub-projects.
+
+        Raises CompileQueueFull when a fragment cannot be admitted.
+        """
+        self.projects += 1
+        document = project_document(latex_content, preamble)
+        markers = {match.group(2).strip() for match in SUBPROJECT.finditer(document)}
+        if markers:
+            fragments = [fragment for fragment in fragments if fragment.id in markers]
+        fragments = [fragment for fragment in fragments if fragment.latex and fragment.latex.strip()]
+
+        jobs = [
+            CompileJob(
+                latex=fragment_document(fragment.latex, preamble),
+                tex_name="fragment",
+                assets=fragment.assets,
+                label=f"ProjectAssembler ({fragment.title})",
+                user_id=user_id,
+                priority=priority,
+            )
+            for fragment in fragments
+        ]
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def render(job: CompileJob) -> CompileResult:
+            async with slots:
+                return await self.engine.compile(job)
+
+        started = time.perf_counter()
+        renders = [asyncio.create_task(render(job)) for job in jobs]
+        try:
+            results = await asyncio.gather(*renders)
+        except BaseException:
+            # A fragment was not admitted (or the request went away): the others are wasted work
+            for task in renders:
+                task.cancel()
+            await asyncio.gather(*renders, return_exceptions=True)
+            raise
+        fragments_ms = (time.perf_counter() - started) * 1000
+
+        placed: Dict[str, str] = {}
+        assets: Dict[str, dict] = {}  # by filename: identical sub-projects share one fragment
+        for fragment, job, result in zip(fragments, jobs, results):
+            content = None
+            if result.success:
+                # The cache may evict a fragment before the project leaves the queue: hold its bytes,
+                # not a path to the cache entry
+                content = result.content if result.content is not None else await asyncio.to_thread(_read_output, result.path)
+            if content is None:
+                return CompileResult(
+                    False,
+                    error=f"Sub-project \"{fragment.title}\" failed to compile: {result.error or 'output expired, compile again'}",
+                    stage="fragment",
+                    timings={"fragments": fragments_ms},
+                )
+            # The fragment's compile key covers its source and its linked files
+            key = self.engine.cache_key(job)
+            filename = f"subproject-{key[:16]}.pdf"
+            assets[filename] = {"filename": filename, "sha256": key, "content": content}
+            placed[fragment.id] = filename
+
+        reused = sum(1 for result in results if result.cache_hit)
+        self.fragments_reused += reused
+        self.fragments_compiled += len(results) - reused
+        logger.info(f"ProjectAssembler: {len(fragments)} fragment(s), {reused} from cache, in {fragments_ms:.0f}ms")
+        result = await self.engine.compile(CompileJob(
+            latex=place_fragments(document, placed),
+            output_format=output_format,
+            tex_name="project",
+            assets=list(assets.values()),
+            label="ProjectAssembler",
+            user_id=user_id,
+            priority=priority,
+            quality=quality,
+        ))
+        return replace(result, timings={"fragments": fragments_ms, **result.timings})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "projects": self.projects,
+            "fragments_compiled": self.fragments_compiled,
+            "fragments_reused": self.fragments_reused,
+        }
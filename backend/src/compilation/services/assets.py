@@ -0,0 +1,185 @@
+"""
+Local cache of linked project files used in compiles.
+
+Sub-project compiles pull their linked images from Supabase storage. Every
+download is kept in a content-addressed blob store (a CompileCache keyed by
+the SHA-256 of the bytes, under its own size cap), and a small reference per
+storage path records the `updated_at` and ETag it was fetched at:
+- same `updated_at` as the reference: served from disk, no network call
+- `updated_at` changed: revalidated with If-None-Match; a 304 keeps the blob
+- otherwise downloaded again and stored
+
+Downloads stream to disk next to the blob store and are moved into it, so an
+image is never held in memory. Cached assets reach the compile job directory
+as hardlinks (symlinks or copies as fallbacks, see
+LatexCompileEngine._prepare_job_dir), never rewritten byte by byte, and the
+compile cache keys them by their digest.
+
+get_many fetches all of a compile's files concurrently, bounded by
+COMPILE_ASSET_FETCH_CONCURRENCY and a per-request time budget.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+
+from src.config import get_settings
+from .cache import CompileCache
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class AssetStorage(Protocol):
+    async def download_to_file_if_changed(
+        self, file_path: str, target: Path, etag: Optional[str] = None
+    ) -> Tuple[bool, Optional[str], bool]: ...
+
+
+@dataclass
+class AssetRef:
+    """What a storage path pointed to when it was last fetched."""
+    file_path: str
+    updated_at: Optional[str]
+    etag: Optional[str]
+    sha256: str
+    size: int
+
+
+class AssetCache:
+    """Content-addressed local copies of storage objects, revalidated by updated_at/ETag."""
+
+    def __init__(self, storage: AssetStorage, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.storage = storage
+        root = Path(cache_dir or settings.COMPILE_ASSET_CACHE_DIR or Path(tempfile.gettempdir()) / "tizkit_asset_cache")
+        self.blobs = CompileCache(
+            cache_dir=str(root / "blobs"),
+            max_bytes=max_bytes if max_bytes is not None else settings.COMPILE_ASSET_CACHE_MAX_MB * 1024 * 1024,
+        )
+        self.refs_dir = root / "refs"
+        self.incoming_dir = root / "incoming"
+        self.downloads = 0
+        self.revalidations = 0
+        self.timeouts = 0
+
+    async def get_many(
+        self,
+        files: Sequence[Tuple[str, str, Optional[datetime]]],
+        concurrency: Optional[int] = None,
+        budget: Optional[float] = None,
+    ) -> List[Optional[dict]]:
+        """Fetch (file_path, filename, updated_at) entries concurrently; one result per entry, in input order.
+
+        Files still downloading when the `budget` (seconds) runs out are None,
+        like files whose download failed, so the compile starts on time.
+        """
+        if not files:
+            return []
+        semaphore = asyncio.Semaphore(concurrency or settings.COMPILE_ASSET_FETCH_CONCURRENCY)
+        budget = budget if budget is not None else settings.COMPILE_ASSET_FETCH_BUDGET_SECONDS
+
+        async def fetch(file_path: str, filename: str, updated_at: Optional[datetime]) -> Optional[dict]:
+            async with semaphore:
+                try:
+                    return await self.get(file_path, filename, updated_at)
+                except Exception as e:
+                    logger.warning(f"AssetCache: Failed to fetch {filename}: {str(e)}")
+                    return None
+
+        tasks = [asyncio.create_task(fetch(*entry)) for entry in files]
+        done, pending = await asyncio.wait(tasks, timeout=budget)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.timeouts += len(pending)
+            logger.warning(f"AssetCache: {len(pending)} of {len(files)} linked file(s) not fetched within {budget}s")
+            await asyncio.gather(*pending, return_exceptions=True)
+        return [task.result() if task in done else None for task in tasks]
+
+    async def get(self, file_path: str, filename: str, updated_at: Optional[datetime] = None) -> Optional[dict]:
+        """Return a compile asset for a storage object, fetching it only when it may have changed.
+
+        The asset is {"filename", "path", "sha256"} for cached files, or
+        {"filename", "content"} when the cache cannot hold it. None when the download fails.
+        """
+        version = updated_at.isoformat() if updated_at else None
+        ref = await asyncio.to_thread(self._read_ref, file_path)
+        blob = await asyncio.to_thread(self.blobs.get_path, ref.sha256) if ref else None
+
+        if ref is not None and blob is not None and version is not None and ref.updated_at == version:
+            return {"filename": filename, "path": blob, "sha256": ref.sha256}
+
+        incoming = await asyncio.to_thread(self._incoming_file)
+        try:
+            downloaded, etag, not_modified = await self.storage.download_to_file_if_changed(
+                file_path, incoming, ref.etag if blob is not None else None
+            )
+            if not_modified and blob is not None:
+                self.revalidations += 1
+                await asyncio.to_thread(self._write_ref, AssetRef(file_path, version, ref.etag, ref.sha256, ref.size))
+                return {"filename": filename, "path": blob, "sha256": ref.sha256}
+            if not downloaded:
+                return None
+
+            self.downloads += 1
+            sha256, size = await asyncio.to_thread(_digest, incoming)
+            path = await asyncio.to_thread(self.blobs.put_file, sha256, incoming)
+            if path is None:
+                return {"filename": filename, "content": await asyncio.to_thread(incoming.read_bytes)}
+            await asyncio.to_thread(self._write_ref, AssetRef(file_path, version, etag, sha256, size))
+            return {"filename": filename, "path": path, "sha256": sha256}
+        finally:
+            # Still there when the download failed or the blob store did not take it
+            incoming.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.blobs.stats(),
+            "downloads": self.downloads,
+            "revalidations": self.revalidations,
+            "timeouts": self.timeouts,
+        }
+
+    def _incoming_file(self) -> Path:
+        """A fresh empty file next to the blob store for a download to stream into."""
+        self.incoming_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=self.incoming_dir, suffix=".tmp")
+        os.close(fd)
+        return Path(name)
+
+    def _ref_path(self, file_path: str) -> Path:
+        key = hashlib.sha256(file_path.encode("utf-8")).hexdigest()
+        return self.refs_dir / key[:2] / f"{key}.json"
+
+    def _read_ref(self, file_path: str) -> Optional[AssetRef]:
+        try:
+            return AssetRef(**json.loads(self._ref_path(file_path).read_text(encoding="utf-8")))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _write_ref(self, ref: AssetRef) -> None:
+        path = self._ref_path(ref.file_path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(ref.__dict__), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"AssetCache: Failed to record {ref.file_path}: {e}")
+
+
+def _digest(path: Path) -> Tuple[str, int]:
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
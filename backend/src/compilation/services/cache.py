@@ -0,0 +1,266 @@
+"""
+Content-addressed cache for compiled outputs.
+
+Entries are keyed by a hash of the normalized LaTeX source, the linked asset
+contents, the output format and the DPI, and live on local disk under a size
+cap with least-recently-used eviction. Methods are synchronous and meant to be
+called from a worker thread.
+
+Keys are shared by every user who compiles the same document, so an entry
+also records who it was produced for (`grant`) in a small owners file next to
+it, checked before the entry is served by URL (`granted`). Owners files are
+removed with their entry.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from src.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Next to each entry: the hashed ids of the users it was produced for
+OWNERS_SUFFIX = ".owners"
+
+
+def normalize_source(latex: str) -> str:
+    """Normalize line endings and trailing whitespace so cosmetic edits share a key."""
+    lines = latex.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def hash_assets(assets: Iterable[dict]) -> str:
+    """Hash linked assets by filename and content, independent of their order.
+
+    Cached assets carry the digest of their content, so their files are not read.
+    """
+    digests = sorted(
+        f"{asset['filename']}:{asset.get('sha256') or hashlib.sha256(asset['content']).hexdigest()}"
+        for asset in assets
+    )
+    return hashlib.sha256("\n".join(digests).encode("utf-8")).hexdigest()
+
+
+class CompileCache:
+    """Disk-backed LRU cache of compile outputs with hit/miss counters.
+
+    Each process keeps its own LRU index, rebuilt from file modification
+    times on first use, so several workers can share one cache directory.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or settings.COMPILE_CACHE_DIR or Path(tempfile.gettempdir()) / "tizkit_compile_cache")
+        self.max_bytes = max_bytes if max_bytes is not None else settings.COMPILE_CACHE_MAX_MB * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(latex: str, output_format: str, dpi: int, assets: Iterable[dict] = (), variant: str = "") -> str:
+        """Build the cache key for a compile request."""
+        h = hashlib.sha256()
+        for part in (normalize_source(latex), hash_assets(assets), output_format, str(dpi), variant):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return cached bytes for `key` and mark it most recently used."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                content = path.read_bytes()
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another worker sharing the directory
+                self._size -= self._index.pop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def get_path(self, key: str) -> Optional[Path]:
+        """Like `get`, but return the entry's path instead of reading it (for large entries)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self._size -= self._index.pop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return path
+
+    def discard(self, key: str) -> None:
+        """Drop `key` from the cache, e.g. when its content turned out to be unusable."""
+        with self._lock:
+            self._load_index()
+            self._size -= self._index.pop(key, 0)
+            _unlink(self._path(key))
+            _unlink(self._owners_path(key))
+
+    def grant(self, key: str, owner: str) -> None:
+        """Record that `owner` may fetch the entry under `key`."""
+        if not self.enabled:
+            return
+        if not self._path(key).exists():
+            return
+        path = self._owners_path(key)
+        entry = _owner_key(owner)
+        try:
+            if entry in _read_owners(path):
+                return
+            with open(path, "a", encoding="utf-8") as f:
+                # One short O_APPEND write: safe against other workers granting the same entry
+                f.write(f"{entry}\n")
+        except OSError as e:
+            logger.warning(f"CompileCache: Failed to record owner of {key[:12]}: {e}")
+
+    def granted(self, key: str, owner: str) -> bool:
+        """Whether `owner` was granted the entry under `key`."""
+        try:
+            return _owner_key(owner) in _read_owners(self._owners_path(key))
+        except OSError:
+            return False
+
+    def put(self, key: str, content: bytes) -> Optional[Path]:
+        """Store `content` under `key`, evicting least recently used entries past the cap.
+
+        Returns the entry's path, or None when the content was not stored.
+        """
+        if not self.enabled or len(content) > self.max_bytes:
+            return None
+        return self._store(key, len(content), lambda tmp_path: tmp_path.write_bytes(content))
+
+    def put_file(self, key: str, source: Path) -> Optional[Path]:
+        """Move the file at `source` into the cache under `key` (a rename on the same filesystem).
+
+        Returns the entry's path, or None when the file was not stored (and `source` is left in place).
+        """
+        try:
+            size = source.stat().st_size
+        except FileNotFoundError:
+            return None
+        if not self.enabled or size > self.max_bytes:
+            return None
+        return self._store(key, size, lambda tmp_path: _move(source, tmp_path))
+
+    def _store(self, key: str, size: int, write: Callable[[Path], object]) -> Optional[Path]:
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                write(tmp_path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"CompileCache: Failed to store entry {key[:12]}: {e}")
+                return None
+            self._size += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+            return path if key in self._index else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _owners_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}{OWNERS_SUFFIX}"
+
+    def _load_index(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.cache_dir.exists():
+            return
+        entries = []
+        for path in self.cache_dir.glob("*/*"):
+            if path.suffix in (".tmp", OWNERS_SUFFIX):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            _unlink(self._path(key))
+            _unlink(self._owners_path(key))
+
+
+def _owner_key(owner: str) -> str:
+    """What an owners file records about a user: a hash, not the id."""
+    return hashlib.sha256(str(owner).encode("utf-8")).hexdigest()[:16]
+
+
+def _read_owners(path: Path) -> Set[str]:
+    try:
+        return set(path.read_text(encoding="utf-8").split())
+    except FileNotFoundError:
+        return set()
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _move(source: Path, target: Path) -> None:
+    try:
+        os.replace(source, target)
+    except OSError:
+        # Job directory and cache on different filesystems
+        shutil.copyfile(source, target)
@@ -0,0 +1,625 @@
+"""
+Shared LaTeX compile engine.
+
+The diagram, table, flowchart and image-to-latex compilers all hand their
+documents to this engine. Tectonic runs as an asyncio subprocess inside a
+per-job working directory, so a long compile never blocks the event loop and
+never touches the process-wide working directory.
+
+Identical compiles that arrive while one is already running (double clicks,
+retries, several tabs) join that run instead of starting their own Tectonic
+process; the run is cancelled once every caller waiting on it has gone.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.config import get_settings
+from .cache import CompileCache
+from .formats import PreambleFormat, PreambleFormatCache
+from .images import ImageNormalizer
+from .lint import LintError, format_lint_errors, lint_failures, lint_latex
+from .sandbox import run_sandboxed
+from .rasterizer import PdfRasterizer, RasterizeError
+from .scheduler import CompileQueueFull, CompileScheduler
+from .tikz import TikzExternalizer, TikzPicture
+from .toolchain import ToolchainRegistry
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = ("pdf", "png", "svg")
+# Formats that can be derived from one compiled PDF (CompileJob.exports)
+EXPORT_FORMATS = ("pdf", "png", "svg")
+# "preview": one TeX pass, draft (placeholder) graphics and a low DPI; "final": full quality
+OUTPUT_QUALITIES = ("preview", "final")
+DRAFT_GRAPHICS = "\\PassOptionsToPackage{draft}{graphicx}\n"
+
+# Set by the compile job manager so the engine can report "running" and
+# "rasterizing" without every compiler threading a callback through.
+stage_listener: ContextVar[Optional[Callable[[str], None]]] = ContextVar("compile_stage_listener", default=None)
+
+# Environment shared by every Tectonic run - disable fontconfig to avoid font issues
+TECTONIC_ENV = {
+    "FONTCONFIG_FILE": "",
+    "FONTCONFIG_PATH": "",
+    "TECTONIC_MINIMAL_MODE": "1",
+}
+
+
+@dataclass
+class CompileJob:
+    """A single document handed to the engine by one of the compilers."""
+    latex: str
+    output_format: str = "pdf"
+    tex_name: str = "document"
+    assets: List[dict] = field(default_factory=list)  # {"filename", "content": bytes} or cached {"filename", "path", "sha256"}
+    dpi: int = 300
+    page: int = 1  # page converted for PNG/SVG output
+    env: Dict[str, str] = field(default_factory=dict)
+    timeout: Optional[int] = None
+    artifact_dir: Optional[Path] = None  # retain the compiled PDF here when set (opt-in, COMPILE_ARTIFACT_DIR)
+    label: str = "CompileEngine"
+    user_id: Optional[str] = None  # fair-queuing key for the scheduler
+    priority: bool = False  # PRO/TEAM jobs use the scheduler's priority lane
+    use_cache: bool = True  # False bypasses the result cache (bundle warm-up)
+    quality: str = "final"  # one of OUTPUT_QUALITIES
+    exports: Tuple[str, ...] = ()  # EXPORT_FORMATS derived from the same PDF into CompileResult.exports
+    lint: bool = True  # reject structurally broken documents before they reach Tectonic (COMPILE_LINT)
+    externalize: bool = True  # compile TikZ pictures separately and include their cached PDFs
+
+
+@dataclass
+class CompileResult:
+    """Outcome of a compile, including the stage that failed and per-stage timings (ms)."""
+    success: bool
+    content: Optional[bytes] = None
+    error: Optional[str] = None
+    stage: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    cache_hit: bool = False
+    shared: bool = False  # joined an identical compile that was already in flight
+    usage: Dict[str, float] = field(default_factory=dict)  # max_rss_mb / cpu_seconds of the compile tools
+    path: Optional[Path] = None  # output file in the compile cache, served without reading it into memory
+    exports: Dict[str, "CompileResult"] = field(default_factory=dict)  # per format, for CompileJob.exports
+    render_id: Optional[str] = None  # cache key of the PDF, for lazy page renders (PageRenderer)
+    lint_errors: List[LintError] = field(default_factory=list)  # set when stage == "lint"
+
+    @property
+    def size(self) -> int:
+        if self.content is not None:
+            return len(self.content)
+        return self.path.stat().st_size if self.path is not None else 0
+
+    def read_bytes(self) -> bytes:
+        """The output as bytes, read from the cache entry when it was not kept in memory."""
+        if self.content is not None:
+            return self.content
+        return self.path.read_bytes()
+
+    @property
+    def server_timing(self) -> str:
+        """Render timings as a `Server-Timing` header value."""
+        metrics = []
+        for name, ms in self.timings.items():
+            desc = ';desc="hit"' if name == "cache" and self.cache_hit else ""
+            metrics.append(f"{name}{desc};dur={ms:.1f}")
+        if self.usage:
+            metrics.append(f'cpu;desc="max_rss={self.usage["max_rss_mb"]:.0f}MB";dur={self.usage["cpu_seconds"] * 1000:.1f}')
+        return ", ".join(metrics)
+
+
+@dataclass
+class _Flight:
+    """An in-progress compile that identical requests can join."""
+    task: asyncio.Task
+    waiters: int = 0
+
+
+class LatexCompileEngine:
+    """Runs Tectonic and rasterization off the event loop for all compilers."""
+
+    def __init__(
+        self,
+        toolchain: ToolchainRegistry,
+        temp_dir: Optional[str] = None,
+        timeout: Optional[int] = None,
+        cache: Optional[CompileCache] = None,
+        scheduler: Optional[CompileScheduler] = None,
+        formats: Optional[PreambleFormatCache] = None,
+        rasterizer: Optional[PdfRasterizer] = None,
+        images: Optional[ImageNormalizer] = None,
+        tikz: Optional[TikzExternalizer] = None,
+    ):
+        self.toolchain = toolchain
+        self.rasterizer = rasterizer or PdfRasterizer(toolchain)
+        self.temp_dir = temp_dir or settings.COMPILE_WORK_DIR or tempfile.gettempdir()
+        self.timeout = timeout or settings.LATEX_TIMEOUT
+        self.cache = cache
+        self.scheduler = scheduler
+        self.formats = formats
+        self.images = images
+        self.tikz = tikz
+        self._inflight: Dict[str, _Flight] = {}
+
+    async def compile(self, job: CompileJob) -> CompileResult:
+        """Compile `job.latex` to PDF or PNG in a fresh working directory.
+
+        Cached outputs and the render id of a successful compile are granted to
+        `job.user_id`, cache hits included, so only users who compiled a document
+        can fetch it by URL. Raises CompileQueueFull when the scheduler cannot admit the job.
+        """
+        result = await self._compile(job)
+        if result.success and job.user_id is not None and self.cache is not None and self.cache.enabled:
+            keys = [output.path.name for output in (result, *result.exports.values()) if output.path is not None]
+            if result.render_id:
+                keys.append(result.render_id)
+            await asyncio.to_thread(self._grant, keys, str(job.user_id))
+        return result
+
+    def _grant(self, keys: List[str], owner: str) -> None:
+        for key in dict.fromkeys(keys):
+            self.cache.grant(key, owner)
+
+    async def _compile(self, job: CompileJob) -> CompileResult:
+        if job.output_format not in SUPPORTED_FORMATS:
+            return CompileResult(False, error="Invalid output format. Must be 'pdf', 'png' or 'svg'", stage="validate")
+        if job.quality not in OUTPUT_QUALITIES:
+            return CompileResult(False, error="Invalid output quality. Must be 'preview' or 'final'", stage="validate")
+        if job.exports:
+            return await self._compile_exports(job)
+        if job.quality == "preview":
+            job = self._preview_job(job)
+
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        try:
+            store = self.cache is not None and self.cache.enabled and job.use_cache
+            if store:
+                with _stage(timings, "cache"):
+                    key = self.cache_key(job)
+                    cached = await asyncio.to_thread(self.cache.get_path, key)
+                if cached is not None:
+                    return CompileResult(True, path=cached, timings=timings, cache_hit=True, render_id=self.render_id(job))
+            else:
+                key = self.cache_key(job)
+
+            # Doomed documents fail here in milliseconds instead of holding a scheduler slot
+            if job.lint and settings.COMPILE_LINT:
+                with _stage(timings, "lint"):
+                    lint_errors = lint_failures(lint_latex(job.latex))
+                if lint_errors:
+                    logger.info(f"{job.label}: Rejected by lint with {len(lint_errors)} error(s), first: {lint_errors[0]}")
+                    return CompileResult(
+                        False,
+                        error=format_lint_errors(lint_errors),
+                        stage="lint",
+                        timings=timings,
+                        lint_errors=lint_errors,
+                    )
+
+            # Single-flight: identical requests join the compile already running
+            flight = self._inflight.get(key)
+            if flight is not None:
+                logger.info(f"{job.label}: Joining in-flight compile {key[:12]}")
+                with _stage(timings, "singleflight"):
+                    result = await self._join(key, flight)
+                return replace(result, timings=timings, shared=True)
+
+            flight = self._start_flight(key, self._compile_fresh(job, key if store else None))
+            result = await self._join(key, flight)
+            timings.update(result.timings)
+            return replace(result, timings=timings)
+
+        except CompileQueueFull:
+            logger.warning(f"{job.label}: Compile rejected, queue full")
+            raise
+        except Exception as e:
+            logger.error(f"{job.label}: Compilation failed: {str(e)}")
+            return CompileResult(False, error=f"Compilation failed: {str(e)}", stage="engine", timings=timings)
+
+        finally:
+            timings["total"] = (time.perf_counter() - started) * 1000
+            logger.info(f"{job.label}: compile timings (ms) {_format_timings(timings)}")
+
+    async def _compile_exports(self, job: CompileJob) -> CompileResult:
+        """Compile the PDF once and derive every format in `job.exports` from it.
+
+        Returns the PDF result with one result per requested format in `exports`;
+        a failed conversion fails only its own entry.
+        """
+        invalid = [fmt for fmt in job.exports if fmt not in EXPORT_FORMATS]
+        if invalid:
+            return CompileResult(False, error=f"Invalid export format(s): {', '.join(invalid)}", stage="validate")
+
+        pdf = await self.compile(replace(job, output_format="pdf", exports=()))
+        if not pdf.success:
+            return pdf
+
+        formats = list(dict.fromkeys(job.exports))
+        derived = [fmt for fmt in formats if fmt != "pdf"]
+        results: Dict[str, CompileResult] = {"pdf": pdf} if "pdf" in formats else {}
+        if derived:
+            base = self._preview_job(job) if job.quality == "preview" else job
+            work_dir: Optional[Path] = None
+            try:
+                pdf_file = pdf.path
+                if pdf_file is None:
+                    # Not cached: give the converters a file to read
+                    work_dir = Path(tempfile.mkdtemp(prefix=f"{job.tex_name}_export_", dir=self.temp_dir))
+                    pdf_file = work_dir / f"{job.tex_name}.pdf"
+                    await asyncio.to_thread(pdf_file.write_bytes, pdf.content)
+                converted = await asyncio.gather(*(
+                    self._derive(replace(base, output_format=fmt, exports=()), pdf_file) for fmt in derived
+                ))
+                results.update(zip(derived, converted))
+            finally:
+                if work_dir is not None:
+                    await asyncio.to_thread(shutil.rmtree, work_dir, True)
+
+        return replace(pdf, exports={fmt: results[fmt] for fmt in formats})
+
+    async def _derive(self, job: CompileJob, pdf_file: Path) -> CompileResult:
+        """Convert an already compiled PDF to `job.output_format`, through the result cache."""
+        timings: Dict[str, float] = {}
+        key = self.cache_key(job)
+        store = self.cache is not None and self.cache.enabled and job.use_cache
+        if store:
+            with _stage(timings, "cache"):
+                cached = await asyncio.to_thread(self.cache.get_path, key)
+            if cached is not None:
+                return CompileResult(True, path=cached, timings=timings, cache_hit=True)
+
+        usage: Dict[str, float] = {}
+        try:
+            content = await self._convert(job, pdf_file, timings, usage)
+        except RasterizeError as e:
+            return CompileResult(False, error=str(e), stage="rasterize", timings=timings, usage=usage)
+
+        path = await asyncio.to_thread(self.cache.put, key, content) if store else None
+        return CompileResult(True, content=content, path=path, timings=timings, usage=usage)
+
+    def _start_flight(self, key: str, coro) -> _Flight:
+        flight = _Flight(task=asyncio.create_task(coro))
+        self._inflight[key] = flight
+        flight.task.add_done_callback(lambda _: self._forget_flight(key, flight))
+        return flight
+
+    def _forget_flight(self, key: str, flight: _Flight) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    async def _join(self, key: str, flight: _Flight) -> CompileResult:
+        """Wait for a shared compile; it is cancelled once nobody is waiting for it."""
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._forget_flight(key, flight)
+                flight.task.cancel()
+
+    async def _compile_fresh(self, job: CompileJob, cache_key: Optional[str]) -> CompileResult:
+        """Compile a job that missed the cache, waiting for a scheduler slot first."""
+        timings: Dict[str, float] = {}
+        if self.tikz is not None and self.tikz.enabled and job.externalize:
+            # Before taking a slot: the pictures queue for slots of their own
+            with _stage(timings, "tikz"):
+                job = await self._externalize(job)
+        if self.scheduler is None:
+            return await self._run(job, timings, cache_key)
+
+        queued = time.perf_counter()
+        async with self.scheduler.slot(job.user_id, job.priority):
+            timings["queue"] = (time.perf_counter() - queued) * 1000
+            return await self._run(job, timings, cache_key)
+
+    async def _externalize(self, job: CompileJob) -> CompileJob:
+        """Compile the job's TikZ pictures as cached standalone PDFs and include those instead."""
+        draft = job.latex.startswith(DRAFT_GRAPHICS)
+        latex = job.latex[len(DRAFT_GRAPHICS):] if draft else job.latex
+        pictures = self.tikz.plan(latex)
+        if not pictures:
+            return job
+
+        slots = asyncio.Semaphore(self.tikz.concurrency)
+
+        async def render(picture: TikzPicture) -> CompileResult:
+            async with slots:
+                return await self.compile(CompileJob(
+                    latex=picture.document,
+                    tex_name="tikz",
+                    assets=job.assets if "\\includegraphics" in picture.source else [],
+                    env=job.env,
+                    timeout=job.timeout,
+                    label=f"{job.label} (tikz)",
+                    user_id=job.user_id,
+                    priority=job.priority,
+                    externalize=False,
+                ))
+
+        results = await asyncio.gather(*(render(picture) for picture in pictures), return_exceptions=True)
+        self.tikz.documents += 1
+        rendered: List[TikzPicture] = []
+        assets = list(job.assets)
+        for picture, result in zip(pictures, results):
+            content = None
+            if not isinstance(result, BaseException) and result.success:
+                # The cache may evict a picture before this job leaves the queue: hold its bytes,
+                # not a path to the cache entry (picture PDFs are small)
+                content = result.content if result.content is not None else await asyncio.to_thread(_read_output, result.path)
+            if content is None:
+                # Typeset in place, as if it had never been externalized
+                self.tikz.inlined += 1
+                continue
+            if result.cache_hit:
+                self.tikz.reused += 1
+            else:
+                self.tikz.compiled += 1
+            assets.append({"filename": picture.filename, "sha256": picture.key, "content": content})
+            rendered.append(picture)
+        if not rendered:
+            return job
+        logger.info(f"{job.label}: {len(rendered)} of {len(pictures)} TikZ picture(s) externalized")
+        latex = self.tikz.assemble(latex, rendered)
+        return replace(job, latex=DRAFT_GRAPHICS + latex if draft else latex, assets=assets)
+
+    async def _run(self, job: CompileJob, timings: Dict[str, float], cache_key: Optional[str]) -> CompileResult:
+        """Prepare, compile and convert one job while holding a scheduler slot."""
+        job_dir: Optional[Path] = None
+        usage: Dict[str, float] = {}
+        _report_stage("running")
+        try:
+            await self.toolchain.ensure_probed()
+            fmt: Optional[PreambleFormat] = None
+            if self.formats is not None:
+                fmt = await self.formats.lookup(job.latex, self._tectonic_env(job))
+
+            if self.images is not None and job.assets and job.quality == "final":
+                # Previews draw graphics as draft boxes and never read the images
+                with _stage(timings, "images"):
+                    job = replace(job, assets=await asyncio.to_thread(self.images.normalize, job.latex, job.assets))
+
+            with _stage(timings, "prepare"):
+                job_dir = await asyncio.to_thread(self._prepare_job_dir, job, fmt)
+
+            with _stage(timings, "tectonic"):
+                tex_name = f"{job.tex_name}.tex"
+                success, error = await self.run_tectonic(job_dir, tex_name, job, fmt.name if fmt else None, usage)
+                if not success and fmt is not None and not _is_timeout(error):
+                    # Never fail on the format's account: compile the full document once. A real error
+                    # then also reports lines of the user's source
+                    format_error = error
+                    await asyncio.to_thread((job_dir / tex_name).write_text, job.latex, "utf-8")
+                    success, error = await self.run_tectonic(job_dir, tex_name, job, usage=usage)
+                    if success or _is_format_error(format_error):
+                        self.formats.invalidate(fmt.key)
+            if not success:
+                return CompileResult(False, error=error, stage="tectonic", timings=timings, usage=usage)
+
+            pdf_file = job_dir / f"{job.tex_name}.pdf"
+            if job.artifact_dir:
+                await asyncio.to_thread(self._retain_artifact, pdf_file, job.artifact_dir, job.label)
+
+            if job.output_format == "pdf":
+                if cache_key is not None:
+                    # Move the PDF into the cache and serve it from there, never reading it into memory
+                    with _stage(timings, "store"):
+                        path = await asyncio.to_thread(self.cache.put_file, cache_key, pdf_file)
+                    if path is not None:
+                        return CompileResult(True, path=path, timings=timings, usage=usage, render_id=cache_key)
+                with _stage(timings, "read"):
+                    content = await asyncio.to_thread(pdf_file.read_bytes)
+            else:
+                _report_stage("rasterizing")
+                try:
+                    content = await self._convert(job, pdf_file, timings, usage)
+                except RasterizeError as e:
+                    return CompileResult(False, error=str(e), stage="rasterize", timings=timings, usage=usage)
+
+            path = render_id = None
+            if cache_key is not None:
+                path = await asyncio.to_thread(self.cache.put, cache_key, content)
+                # Keep the PDF too, so other pages can be rendered later without recompiling
+                render_id = self.render_id(job)
+                if await asyncio.to_thread(self.cache.put_file, render_id, pdf_file) is None:
+                    render_id = None
+            return CompileResult(True, content=content, path=path, timings=timings, usage=usage, render_id=render_id)
+
+        finally:
+            if usage:
+                logger.info(f"{job.label}: resource usage cpu={usage['cpu_seconds']:.2f}s max_rss={usage['max_rss_mb']:.0f}MB")
+            if job_dir is not None:
+                await asyncio.to_thread(shutil.rmtree, job_dir, True)
+
+    async def _convert(self, job: CompileJob, pdf_file: Path, timings: Dict[str, float], usage: Dict[str, float]) -> bytes:
+        """Render `job.page` of a compiled PDF as PNG (at `job.dpi`) or SVG."""
+        if job.output_format == "svg":
+            with _stage(timings, "svg"):
+                return await self.rasterizer.render_svg(pdf_file, job.page, usage)
+        with _stage(timings, "rasterize"):
+            return await self.rasterizer.render_page(pdf_file, job.page, job.dpi, usage)
+
+    def _preview_job(self, job: CompileJob) -> CompileJob:
+        """Cheaper variant of a job for on-screen previews.
+
+        Included graphics become draft placeholders and PNGs are rasterized at
+        COMPILE_PREVIEW_DPI. The changed source also gives previews their own cache
+        entries. Reruns are limited in run_tectonic.
+        """
+        return replace(job, latex=DRAFT_GRAPHICS + job.latex, dpi=min(job.dpi, settings.COMPILE_PREVIEW_DPI))
+
+    def render_id(self, job: CompileJob) -> str:
+        """Cache key of the job's PDF, under which PageRenderer finds it."""
+        return self.cache_key(replace(job, output_format="pdf", exports=()))
+
+    def cache_key(self, job: CompileJob) -> str:
+        """Content address of a job: source, assets, output format, DPI and page."""
+        return CompileCache.make_key(job.latex, job.output_format, job.dpi, job.assets, variant=f"{job.tex_name}:{job.page}")
+
+    async def run_tectonic(
+        self,
+        job_dir: Path,
+        tex_name: str,
+        job: CompileJob,
+        format_name: Optional[str] = None,
+        usage: Optional[Dict[str, float]] = None,
+    ) -> Tuple[bool, Optional[str]]:
+        """Run Tectonic on `tex_name` inside `job_dir`. Returns (success, error_message).
+
+        With `format_name`, the preamble is loaded from that precompiled format.
+        Tectonic runs sandboxed; its CPU time and peak memory are added to `usage`.
+        """
+        await self.toolchain.ensure_probed()
+        tectonic_cmd = self.toolchain.path("tectonic")
+        if not tectonic_cmd:
+            return False, "Tectonic not found"
+
+        argv = [tectonic_cmd, *self.toolchain.tectonic_flags, "--print", "--keep-logs", "--outfmt=pdf"]
+        if format_name:
+            argv.append(f"--format={format_name}")
+        if job.quality == "preview" and self.toolchain.get("tectonic").supports("reruns"):
+            # A single TeX pass: cross-references may show "??" until the final compile
+            argv.extend(["--reruns", "0"])
+        argv.append(tex_name)
+
+        timeout = job.timeout or self.timeout
+        try:
+            run = await run_sandboxed(argv, cwd=job_dir, env=self._tectonic_env(job), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False, f"Tectonic compilation timed out after {timeout} seconds"
+        except Exception as e:
+            return False, f"Tectonic compilation error: {str(e)}"
+        run.add_usage(usage)
+
+        if run.returncode != 0 and self.toolchain.tectonic_flags and _is_cache_miss(run.stderr):
+            # --only-cached and the document needs a bundle file the warm-up did not fetch
+            logger.info(f"{job.label}: Bundle file missing from cache, retrying with network access")
+            argv = [arg for arg in argv if arg not in self.toolchain.tectonic_flags]
+            try:
+                run = await run_sandboxed(argv, cwd=job_dir, env=self._tectonic_env(job), timeout=timeout)
+            except asyncio.TimeoutError:
+                return False, f"Tectonic compilation timed out after {timeout} seconds"
+            run.add_usage(usage)
+
+        if run.limit_error:
+            return False, f"Tectonic {run.limit_error}"
+        if run.returncode != 0:
+            error_msg = f"Tectonic failed with return code {run.returncode}"
+            if run.stderr:
+                error_msg += f": {run.stderr}"
+            if run.stdout:
+                error_msg += f"\nOutput: {run.stdout[-2000:]}"
+            return False, error_msg
+
+        if not (job_dir / tex_name).with_suffix(".pdf").exists():
+            return False, "PDF file was not created by Tectonic"
+        return True, None
+
+    def _tectonic_env(self, job: CompileJob) -> Dict[str, str]:
+        env = os.environ.copy()
+        env.update(TECTONIC_ENV)
+        if settings.TECTONIC_CACHE_DIR:
+            env["TECTONIC_CACHE_DIR"] = settings.TECTONIC_CACHE_DIR
+        env.update(job.env)
+        return env
+
+    def _prepare_job_dir(self, job: CompileJob, fmt: Optional[PreambleFormat] = None) -> Path:
+        """Create the per-job directory and write the document plus linked assets.
+
+        With a precompiled format only the document body is written, next to the format file.
+        """
+        job_dir = Path(tempfile.mkdtemp(prefix=f"{job.tex_name}_", dir=self.temp_dir))
+        for asset in job.assets:
+            target = job_dir / asset["filename"]
+            if "path" in asset:
+                _link_asset(Path(asset["path"]), target)
+            else:
+                target.write_bytes(asset["content"])
+        latex = job.latex
+        if fmt is not None:
+            self.formats.link_into(fmt, job_dir)
+            latex = fmt.body
+        (job_dir / f"{job.tex_name}.tex").write_text(latex, encoding="utf-8")
+        return job_dir
+
+    def _retain_artifact(self, pdf_file: Path, artifact_dir: Path, label: str) -> None:
+        try:
+            artifact_dir.mkdir(parents=True, exist_ok=True)
+            target = artifact_dir / pdf_file.name
+            target.unlink(missing_ok=True)
+            try:
+                os.link(pdf_file, target)
+            except OSError:
+                shutil.copy2(pdf_file, target)
+        except Exception as e:
+            logger.warning(f"{label}: Failed to retain PDF artifact: {str(e)}")
+
+
+def _link_asset(source: Path, target: Path) -> None:
+    """Place a cached asset in a job directory without copying its bytes when possible.
+
+    Raises FileNotFoundError when the asset is gone rather than leaving a dangling symlink.
+    """
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        try:
+            os.symlink(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+
+def _read_output(path: Optional[Path]) -> Optional[bytes]:
+    """Bytes of a cached output, None when it has been evicted."""
+    try:
+        return path.read_bytes() if path is not None else None
+    except FileNotFoundError:
+        return None
+
+
+def _is_format_error(error: Optional[str]) -> bool:
+    """True when Tectonic failed to load a format file rather than on the document itself."""
+    text = (error or "").lower()
+    return "format file" in text or ".fmt" in text
+
+
+def _is_timeout(error: Optional[str]) -> bool:
+    return (error or "").startswith("Tectonic compilation timed out")
+
+
+def _is_cache_miss(stderr: Optional[str]) -> bool:
+    """True when an --only-cached run failed because a bundle file was not cached locally."""
+    text = (stderr or "").lower()
+    return "only-cached" in text or "not in the cache" in text
+
+
+def _report_stage(stage: str) -> None:
+    listener = stage_listener.get()
+    if listener is not None:
+        listener(stage)
+
+
+@contextmanager
+def _stage(timings: Dict[str, float], name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = (time.perf_counter() - started) * 1000
+
+
+def _format_timings(timings: Dict[str, float]) -> str:
+    return " ".join(f"{name}={ms:.0f}" for name, ms in timings.items())
@@ -0,0 +1,379 @@
+"""
+Learned fixes for recurring compile errors.
+
+The same errors come back across users: a missing \\usepackage{amsmath}, an
+OCR'd tabular with a bad column spec. When the LLM repairs a document and the
+repair compiles, FixCache turns the change into a reusable transformation
+(packages added or removed, plus small anchored text replacements) and stores
+it under a signature of the error: its class, the offending command and a
+fingerprint of the tokens around it.
+
+The next document that fails with the same signature gets the stored
+transformation applied and recompiled, with no LLM call. Each reuse that
+compiles raises the fix's confidence; each one that does not lowers it, and
+fixes that fall below COMPILE_FIX_MIN_CONFIDENCE are dropped.
+
+Fixes are learned only from errors the server reproduced by compiling the
+document itself, never from an error message a client sent. A fix is
+replayed for the users who learned it; once COMPILE_FIX_SHARE_MIN_USERS
+distinct users have learned it independently, it is replayed for everyone.
+
+One small JSON file per signature lives under the cache directory, so several
+workers share what they learn.
+"""
+
+import asyncio
+import difflib
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.config import get_settings
+from .engine import CompileJob, CompileResult, LatexCompileEngine
+from .fixer import FixResult, LogError, _add_package, _candidate_lines, _has_package, _remove_package, parse_tectonic_log
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Transformations kept per signature, best first
+MAX_FIXES_PER_SIGNATURE = 3
+# Larger edits are document rewrites, not reusable fixes
+MAX_REPLACEMENTS = 6
+MAX_REPLACEMENT_CHARS = 200
+# Lines on each side of the reported error line that learned replacements may edit
+ERROR_WINDOW = 2
+
+TOKEN = re.compile(r"\\[A-Za-z@]+\*?|\\.|[A-Za-z]+|\d+(?:\.\d+)?|\s+|.", re.S)
+PACKAGE_LINE = re.compile(r"\\usepackage(?:\[[^\]]*\])?\{([^}]*)\}[ \t]*\n?")
+
+
+def error_signature(error: LogError) -> str:
+    """Hash of the error class, the offending command and the shape of the tokens before it."""
+    # Error class: the message with names and numbers masked
+    error_class = re.sub(r"`[^']*'|'[^']*'|\d+", "*", error.message).rstrip(".")
+    named = re.search(r"`([^']*)'|'([^']*)'|Environment (\S+) undefined", error.message)
+    commands = re.findall(r"\\[A-Za-z@]+", error.context)
+    if named is not None:
+        command = next(group for group in named.groups() if group is not None)
+    else:
+        command = commands[-1] if commands else ""
+    # Fingerprint: commands and punctuation kept, words and numbers reduced to their kind
+    fingerprint = []
+    for token in TOKEN.findall(error.context)[-12:]:
+        if token.isspace():
+            continue
+        if token[0].isalpha():
+            fingerprint.append("w")
+        elif token[0].isdigit():
+            fingerprint.append("0")
+        else:
+            fingerprint.append(token)
+    raw = "\0".join((error_class, command, " ".join(fingerprint)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def learn_transform(original: str, fixed: str) -> Optional[dict]:
+    """Describe the change from `original` to `fixed` as a reusable transformation.
+
+    Returns None when there is no change or the change is too large to reuse.
+    """
+    before, after = _packages(original), _packages(fixed)
+    transform = {
+        "add_packages": sorted(after - before),
+        "remove_packages": sorted(before - after),
+        "replacements": [],
+    }
+
+    a = TOKEN.findall(PACKAGE_LINE.sub("", original))
+    b = TOKEN.findall(PACKAGE_LINE.sub("", fixed))
+    opcodes = difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+    for n, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == "equal":
+            continue
+        if _needs_anchor(a[i1:i2]):
+            # Anchor the edit on the nearest non-blank token of the unchanged text on
+            # each side, so insertions and one-character edits have something to find
+            low = opcodes[n - 1][1] if n > 0 else i1
+            while i1 > low:
+                i1, j1 = i1 - 1, j1 - 1
+                if not a[i1].isspace():
+                    break
+            high = opcodes[n + 1][2] if n + 1 < len(opcodes) else i2
+            while i2 < high:
+                i2, j2 = i2 + 1, j2 + 1
+                if not a[i2 - 1].isspace():
+                    break
+        old, new = "".join(a[i1:i2]), "".join(b[j1:j2])
+        if not old.strip() or len(old) > MAX_REPLACEMENT_CHARS or len(new) > MAX_REPLACEMENT_CHARS:
+            return None
+        transform["replacements"].append([old, new])
+
+    if len(transform["replacements"]) > MAX_REPLACEMENTS:
+        return None
+    if not any(transform.values()):
+        return None
+    return transform
+
+
+def apply_transform(latex: str, transform: dict, error: Optional[LogError] = None) -> Optional[str]:
+    """Apply a learned transformation; None when it does not fit this document.
+
+    With `error`, text replacements are limited to the lines around the error.
+    """
+    patched = latex
+    for package in transform.get("remove_packages", []):
+        if not _has_package(patched, package):
+            return None
+        patched = _remove_package(patched, package)
+    for package in transform.get("add_packages", []):
+        if not _has_package(patched, package):
+            patched = _add_package(patched, package)
+    for old, new in transform.get("replacements", []):
+        region = next((r for r in _error_regions(patched, error) if old in patched[r[0]:r[1]]), None)
+        if region is None:
+            return None
+        start, end = region
+        patched = patched[:start] + patched[start:end].replace(old, new) + patched[end:]
+    return patched if patched != latex else None
+
+
+def _needs_anchor(tokens: List[str]) -> bool:
+    """Edits without a command and with under three characters are too common to find unanchored."""
+    text = "".join(tokens).strip()
+    return len(text) < 3 and not any(token.startswith("\\") and token[1:2].isalpha() for token in tokens)
+
+
+def _error_regions(latex: str, error: Optional[LogError]) -> List[Tuple[int, int]]:
+    """Character ranges a replacement may touch: ERROR_WINDOW lines around the error, or everything."""
+    if error is None or error.line is None:
+        return [(0, len(latex))]
+    starts = [0] + [m.end() for m in re.finditer("\n", latex)]
+    regions = []
+    for index in _candidate_lines(latex, error):
+        first = max(index - ERROR_WINDOW, 0)
+        last = min(index + ERROR_WINDOW + 1, len(starts))
+        regions.append((starts[first], starts[last] if last < len(starts) else len(latex)))
+    return regions
+
+
+def _packages(latex: str) -> set:
+    return {name.strip() for names in PACKAGE_LINE.findall(latex) for name in names.split(",") if name.strip()}
+
+
+def _user_key(user_id: Optional[str]) -> str:
+    """What the shared fix files record about a user: a hash, not the id."""
+    return hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:16]
+
+
+def confidence(fix: dict) -> float:
+    """Laplace-smoothed share of reuses that compiled."""
+    return (fix["successes"] + 1) / (fix["successes"] + fix["failures"] + 2)
+
+
+class FixCache:
+    """Disk-backed store of verified fixes keyed by error signature."""
+
+    def __init__(
+        self,
+        engine: LatexCompileEngine,
+        cache_dir: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        min_confidence: Optional[float] = None,
+    ):
+        self.engine = engine
+        self.cache_dir = Path(cache_dir or settings.COMPILE_FIX_CACHE_DIR or Path(tempfile.gettempdir()) / "tizkit_fix_cache")
+        self.max_entries = max_entries if max_entries is not None else settings.COMPILE_FIX_CACHE_MAX_ENTRIES
+        self.min_confidence = min_confidence if min_confidence is not None else settings.COMPILE_FIX_MIN_CONFIDENCE
+        self.share_min_users = settings.COMPILE_FIX_SHARE_MIN_USERS
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+        self.evictions = 0
+        self._index: "OrderedDict[str, float]" = OrderedDict()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    async def reuse(
+        self,
+        latex: str,
+        log: str,
+        user_id: Optional[str] = None,
+        priority: bool = False,
+    ) -> Optional[FixResult]:
+        """Apply the best learned fix for the error in `log` that makes `latex` compile.
+
+        Every fix tried is scored: confidence goes up when it compiles and down when it does not.
+        Raises CompileQueueFull when the scheduler cannot admit a compile.
+        """
+        error = self._error(log)
+        if error is None:
+            return None
+        signature = error_signature(error)
+        fixes = await asyncio.to_thread(self._read, signature, _user_key(user_id))
+        for index, fix in enumerate(fixes):
+            patched = apply_transform(latex, fix["transform"], error)
+            if patched is None:
+                continue
+            result = await self._compile(patched, user_id, priority)
+            await asyncio.to_thread(self._score, signature, fix["transform"], result.success)
+            if result.success:
+                self.hits += 1
+                logger.info(f"FixCache: Reused fix {index + 1} for {signature[:12]} (confidence {confidence(fix):.2f})")
+                return FixResult(patched, fixes=[f"reuse learned fix {signature[:12]}"], rounds=1, result=result)
+        self.misses += 1
+        return None
+
+    async def learn(
+        self,
+        latex: str,
+        fixed_latex: str,
+        user_id: Optional[str] = None,
+        priority: bool = False,
+    ) -> bool:
+        """Store the change from `latex` to `fixed_latex` if it is reusable and compiles.
+
+        The error it is stored under comes from compiling `latex` here, so a
+        client cannot attach a fix to an error of its choosing.
+        Meant to run after the response (FastAPI BackgroundTasks); errors are logged, not raised.
+        """
+        try:
+            transform = learn_transform(latex, fixed_latex) if self.enabled else None
+            if transform is None:
+                return False
+            original = await self._compile(latex, user_id, priority)
+            error = None if original.success else self._error(original.error or "")
+            patched = apply_transform(latex, transform, error) if error else None
+            if patched is None:
+                return False
+            # Learn from the transformation as it will be replayed, not the LLM's full output
+            signature = error_signature(error)
+            result = await self._compile(patched, user_id, priority)
+            if not result.success:
+                return False
+            await asyncio.to_thread(self._score, signature, transform, True, _user_key(user_id))
+            self.learned += 1
+            logger.info(f"FixCache: Learned fix for {signature[:12]}: {transform}")
+            return True
+        except Exception as e:
+            logger.warning(f"FixCache: Failed to learn fix: {str(e)}")
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._load_index()
+            entries = len(self._index)
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "learned": self.learned,
+            "evictions": self.evictions,
+        }
+
+    def _error(self, log: str) -> Optional[LogError]:
+        if not self.enabled:
+            return None
+        errors = parse_tectonic_log(log)
+        # TeX stops at the first error; the rest usually follow from it
+        return errors[0] if errors else None
+
+    async def _compile(self, latex: str, user_id: Optional[str], priority: bool) -> CompileResult:
+        return await self.engine.compile(CompileJob(
+            latex=latex,
+            output_format="pdf",
+            tex_name="document",
+            label="FixCache",
+            user_id=user_id,
+            priority=priority,
+        ))
+
+    def _path(self, signature: str) -> Path:
+        return self.cache_dir / signature[:2] / f"{signature}.json"
+
+    def _read(self, signature: str, user: str) -> List[dict]:
+        """Fixes for `signature` that are still trusted and visible to `user`, best first."""
+        try:
+            fixes = json.loads(self._path(signature).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return []
+        return sorted(
+            (
+                fix for fix in fixes
+                if confidence(fix) >= self.min_confidence
+                and (user in fix.get("users", []) or len(fix.get("users", [])) >= self.share_min_users)
+            ),
+            key=confidence,
+            reverse=True,
+        )
+
+    def _score(self, signature: str, transform: dict, success: bool, learned_by: Optional[str] = None) -> None:
+        """Record one outcome of `transform`, adding it when new and dropping it when distrusted.
+
+        `learned_by` is the key of a user who learned the fix independently.
+        """
+        with self._lock:
+            self._load_index()
+            path = self._path(signature)
+            try:
+                fixes = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                fixes = []
+            fix = next((f for f in fixes if f["transform"] == transform), None)
+            if fix is None:
+                if not success:
+                    return
+                fix = {"transform": transform, "successes": 0, "failures": 0, "created_at": time.time()}
+                fixes.append(fix)
+            fix["successes" if success else "failures"] += 1
+            fix["last_used"] = time.time()
+            if learned_by is not None and learned_by not in fix.setdefault("users", []):
+                fix["users"].append(learned_by)
+            fixes = sorted(
+                (f for f in fixes if confidence(f) >= self.min_confidence),
+                key=confidence,
+                reverse=True,
+            )[:MAX_FIXES_PER_SIGNATURE]
+
+            if not fixes:
+                path.unlink(missing_ok=True)
+                self._index.pop(signature, None)
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(fixes), encoding="utf-8")
+            os.replace(tmp, path)
+            self._index[signature] = time.time()
+            self._index.move_to_end(signature)
+            self._evict()
+
+    def _load_index(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.cache_dir.exists():
+            return
+        entries = sorted(
+            (path.stat().st_mtime, path.stem)
+            for path in self.cache_dir.glob("*/*.json")
+        )
+        for mtime, signature in entries:
+            self._index[signature] = mtime
+
+    def _evict(self) -> None:
+        """Drop the least recently used signatures beyond max_entries."""
+        while len(self._index) > self.max_entries:
+            signature, _ = self._index.popitem(last=False)
+            self._path(signature).unlink(missing_ok=True)
+            self.evictions += 1
@@ -0,0 +1,458 @@
+"""
+Rule-based local repair of failed compiles.
+
+Most compile errors are mechanical: a command whose package is not loaded, a
+stray `&` or `#`, a listings language Tectonic does not ship, coordinates
+that overflow TeX dimensions. LatexFixer parses the Tectonic output into
+errors, applies a deterministic patch for each one it recognises, and
+recompiles, repeating for a few rounds. It answers in the time of a compile,
+so the LLM repair (GeminiService.fix_latex_with_error) is only needed when no
+rule applies or the patched document still fails.
+"""
+
+import logging
+import re
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.config import get_settings
+from .engine import CompileJob, CompileResult, LatexCompileEngine
+from .lint import PACKAGE_ENVIRONMENTS
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Commands whose "Undefined control sequence" is fixed by loading a package
+COMMAND_PACKAGES: Dict[str, str] = {
+    "mathbb": "amssymb", "mathfrak": "amssymb", "varnothing": "amssymb", "leqslant": "amssymb",
+    "geqslant": "amssymb", "therefore": "amssymb", "because": "amssymb", "square": "amssymb",
+    "text": "amsmath", "operatorname": "amsmath", "dfrac": "amsmath", "tfrac": "amsmath", "binom": "amsmath",
+    "eqref": "amsmath", "numberset": "amsmath", "boldsymbol": "amsmath", "iint": "amsmath", "iiint": "amsmath",
+    "coloneqq": "mathtools", "mathscr": "mathrsfs", "bm": "bm", "cancel": "cancel",
+    "includegraphics": "graphicx", "rotatebox": "graphicx", "scalebox": "graphicx", "resizebox": "graphicx",
+    "textcolor": "xcolor", "color": "xcolor", "colorbox": "xcolor", "definecolor": "xcolor",
+    "rowcolor": "colortbl", "cellcolor": "colortbl",
+    "toprule": "booktabs", "midrule": "booktabs", "bottomrule": "booktabs", "cmidrule": "booktabs",
+    "multirow": "multirow", "makecell": "makecell", "url": "url", "href": "hyperref",
+    "SI": "siunitx", "si": "siunitx", "num": "siunitx", "qty": "siunitx", "unit": "siunitx",
+    "tikz": "tikz", "usetikzlibrary": "tikz", "lstinline": "listings", "lstset": "listings",
+    "captionof": "caption", "subcaption": "subcaption", "xspace": "xspace", "ding": "pifont",
+    "checkmark": "amssymb", "euro": "eurosym", "degree": "gensymb", "celsius": "gensymb",
+}
+
+# Environment -> package, from the linter's package map
+ENVIRONMENT_PACKAGES: Dict[str, str] = {
+    env: package for package, envs in PACKAGE_ENVIRONMENTS.items() for env in sorted(envs)
+}
+
+# "! <message>" in the --print transcript; "error: <file>:<line>: <message>" on stderr
+TEX_ERROR = re.compile(r"^(?:Output: )?! (?P<message>.+)$", re.M)
+TECTONIC_ERROR = re.compile(r"^error: [^:\n]+\.tex:(?P<line>\d+): (?P<message>.+)$", re.M)
+CONTEXT_LINE = re.compile(r"^l\.(?P<line>\d+) ?(?P<context>.*)$", re.M)
+# "- line 3, column 5: <message>" from the pre-compile linter
+LINT_ERROR = re.compile(r"^- line (?P<line>\d+), column \d+: (?P<message>.+)$", re.M)
+# Option lists that take listings keys, up to their opening bracket
+LISTINGS_OPTIONS = re.compile(
+    r"\\lstset\s*\{|\\lstdefinestyle\s*\{[^}]*\}\s*\{|\\begin\{lstlisting\}\s*\[|\\lstinline\s*\[|\\lstinputlisting\s*\["
+)
+LISTINGS_LANGUAGE = re.compile(r",?\s*language\s*=\s*(\{[^}]*\}|\[[^\]]*\][^,\]}]*|[^,\]}\s]+)")
+
+
+@dataclass
+class LogError:
+    """One error from a Tectonic log; `context` is the source TeX showed up to the error point."""
+    message: str
+    line: Optional[int] = None
+    context: str = ""
+    resolved: bool = False  # `line` is the line of the source being patched, not TeX's numbering
+
+
+@dataclass
+class FixResult:
+    latex: str
+    fixes: List[str] = field(default_factory=list)  # one description per applied patch
+    rounds: int = 0
+    result: Optional[CompileResult] = None  # the successful compile of `latex`
+
+
+def parse_tectonic_log(log: str) -> List[LogError]:
+    """Extract errors from Tectonic's stderr, its --print transcript and linter output, de-duplicated."""
+    errors: List[LogError] = []
+    for match in TEX_ERROR.finditer(log):
+        error = LogError(match.group("message").strip())
+        # TeX prints "l.<line> <source up to the error>" a few lines further down
+        context = CONTEXT_LINE.search(log, match.end(), match.end() + 2000)
+        if context is not None and not TEX_ERROR.search(log, match.end(), context.start()):
+            error.line = int(context.group("line"))
+            error.context = context.group("context").strip()
+        errors.append(error)
+    for match in TECTONIC_ERROR.finditer(log):
+        line, message = int(match.group("line")), match.group("message").strip().rstrip(".")
+        if not any(e.line == line and e.message.rstrip(".") == message for e in errors):
+            errors.append(LogError(message, line))
+    for match in LINT_ERROR.finditer(log):
+        # The linter reads the source itself, so its lines need no second reading
+        errors.append(LogError(match.group("message").strip(), int(match.group("line")), resolved=True))
+    if "no legal \\end found" in log and not any("end{document}" in e.message for e in errors):
+        errors.append(LogError("Missing \\end{document}"))
+    return errors
+
+
+Rule = Callable[[str, LogError], Optional[Tuple[str, str]]]
+
+
+class LatexFixer:
+    """Patches common compile errors locally and recompiles to confirm the fix."""
+
+    def __init__(self, engine: LatexCompileEngine, max_rounds: Optional[int] = None):
+        self.engine = engine
+        self.max_rounds = max_rounds if max_rounds is not None else settings.COMPILE_FIX_MAX_ROUNDS
+        self.rules: List[Rule] = [
+            _add_package_for_command,
+            _add_package_for_environment,
+            _drop_missing_package,
+            _escape_on_error_line,
+            _drop_listings_language,
+            _scale_tikz_dimensions,
+            _close_document,
+        ]
+        self.attempts = 0
+        self.fixed = 0
+
+    def patch(self, latex: str, log: str) -> Tuple[str, List[str]]:
+        """Apply every rule that matches an error in `log`. Returns the patched source and what changed."""
+        fixes: List[str] = []
+        # Read the log's line numbers against the source the log came from; edits move them later
+        pending = [_resolve_line(latex, error) for error in parse_tectonic_log(log)]
+        while pending:
+            error = pending.pop(0)
+            for rule in self.rules:
+                patched = rule(latex, error)
+                if patched is not None and patched[0] != latex:
+                    pending = _rebase(pending, latex, patched[0])
+                    latex = patched[0]
+                    fixes.append(patched[1])
+                    break
+        return latex, fixes
+
+    async def diagnose(
+        self,
+        latex: str,
+        log: str,
+        user_id: Optional[str] = None,
+        priority: bool = False,
+    ) -> Tuple[str, Optional[CompileResult]]:
+        """Return a log with parseable errors for `latex`, and the compile result if it compiled.
+
+        `log` is the error the caller saw. When it has no parseable errors (e.g.
+        it was shortened for display), the document is compiled once for the full log.
+        Raises CompileQueueFull when the scheduler cannot admit a compile.
+        """
+        if parse_tectonic_log(log):
+            return log, None
+        result = await self._compile(latex, user_id, priority)
+        return (result.error or ""), (result if result.success else None)
+
+    async def repair(
+        self,
+        latex: str,
+        log: str,
+        user_id: Optional[str] = None,
+        priority: bool = False,
+    ) -> Optional[FixResult]:
+        """Patch and recompile until the document compiles; None when the rules cannot fix it.
+
+        `log` is the full Tectonic output (see diagnose).
+        Raises CompileQueueFull when the scheduler cannot admit a compile.
+        """
+        self.attempts += 1
+        fixes: List[str] = []
+        patched, applied = self.patch(latex, log)
+        for round_no in range(1, self.max_rounds + 1):
+            if not applied:
+                return None
+            fixes.extend(applied)
+            logger.info(f"LatexFixer: Round {round_no} applied {', '.join(applied)}")
+            result = await self._compile(patched, user_id, priority)
+            if result.success:
+                self.fixed += 1
+                return FixResult(patched, fixes=fixes, rounds=round_no, result=result)
+            patched, applied = self.patch(patched, result.error or "")
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {"attempts": self.attempts, "fixed": self.fixed}
+
+    async def _compile(self, latex: str, user_id: Optional[str], priority: bool) -> CompileResult:
+        return await self.engine.compile(CompileJob(
+            latex=latex,
+            output_format="pdf",
+            tex_name="document",
+            label="LatexFixer",
+            user_id=user_id,
+            priority=priority,
+        ))
+
+
+def scale_tikz_dimensions(content: str, max_coord: float = 50) -> str:
+    """Scale down TikZ coordinates and cap node sizes to prevent 'Dimension too large' errors."""
+    # Pattern to match coordinates like (x,y) or at (x,y)
+    coord_pattern = r'(\(|at\s*\()\s*([+-]?\d+\.?\d*)\s*,\s*([+-]?\d+\.?\d*)\s*(\))'
+
+    def scale_coordinate(match):
+        prefix = match.group(1)  # '(' or 'at ('
+        x = float(match.group(2))
+        y = float(match.group(3))
+        suffix = match.group(4)  # ')'
+
+        largest = max(abs(x), abs(y))
+        if largest > max_coord:
+            scale_factor = max_coord / largest
+            x *= scale_factor
+            y *= scale_factor
+            logger.info(f"LatexFixer: Scaled coordinates ({match.group(2)}, {match.group(3)}) -> ({x:.2f}, {y:.2f})")
+
+        return f"{prefix}{x:.2f},{y:.2f}{suffix}"
+
+    sanitized_content = re.sub(coord_pattern, scale_coordinate, content)
+
+    # Also sanitize node distances and dimensions
+    dimension_patterns = [
+        (r'(node\s+distance\s*=\s*)([+-]?\d+\.?\d*)(cm|mm|pt|in)', 'node distance'),
+        (r'(minimum\s+width\s*=\s*)([+-]?\d+\.?\d*)(cm|mm|pt|in)', 'minimum width'),
+        (r'(minimum\s+height\s*=\s*)([+-]?\d+\.?\d*)(cm|mm|pt|in)', 'minimum height')
+    ]
+
+    for pattern, desc in dimension_patterns:
+        def scale_dimension(match):
+            prefix = match.group(1)
+            value = float(match.group(2))
+            unit = match.group(3)
+
+            # Apply conservative limits based on unit
+            if unit == 'cm' and value > 8:
+                value = min(value, 8)
+                logger.info(f"LatexFixer: Limited {desc} to {value}cm")
+            elif unit == 'mm' and value > 80:
+                value = min(value, 80)
+                logger.info(f"LatexFixer: Limited {desc} to {value}mm")
+            elif unit in ['pt', 'in'] and value > 200:
+                value = min(value, 200)
+                logger.info(f"LatexFixer: Limited {desc} to {value}{unit}")
+
+            return f"{prefix}{value}{unit}"
+
+        sanitized_content = re.sub(pattern, scale_dimension, sanitized_content)
+
+    return sanitized_content
+
+
+# --- Rules: (latex, error) -> (patched latex, description) or None ---
+
+def _add_package_for_command(latex: str, error: LogError) -> Optional[Tuple[str, str]]:
+    if "Undefined control sequence" not in error.message:
+        return None
+    # The undefined command is the last one TeX read before stopping
+    commands = re.findall(r"\\([A-Za-z]+)", error.context)
+    if not commands and error.line is not None:
+        lines = latex.split("\n")
+        commands = [c for index in _candidate_lines(latex, error) for c in re.findall(r"\\([A-Za-z]+)", lines[index])]
+    for command in reversed(commands):
+        package = COMMAND_PACKAGES.get(command)
+        if package and not _has_package(latex, package):
+            return _add_package(latex, package), f"load {package} for \\{command}"
+    return None
+
+
+def _add_package_for_environment(latex: str, error: LogError) -> Optional[Tuple[str, str]]:
+    match = re.search(r"Environment (\S+) undefined|Unknown environment '([^']+)'", error.message)
+    if match is None:
+        return None
+    env = match.group(1) or match.group(2)
+    package = ENVIRONMENT_PACKAGES.get(env)
+    if package is None or _has_package(latex, package):
+        return None
+    return _add_package(latex, package), f"load {package} for the {env} environment"
+
+
+def _drop_missing_package(latex: str, error: LogError) -> Optional[Tuple[str, str]]:
+    match = re.search(r"File `([^']+)\.sty' not found", error.message)
+    if match is None:
+        return None
+    package = match.group(1)
+    return _remove_package(latex, package), f"remove unavailable package {package}"
+
+
+# Error message -> characters to escape on the offending line
+ESCAPES = (
+    ("Misplaced alignment tab character &", "&"),
+    ("macro parameter character #", "#"),
+    ("Illegal parameter number in definition", "#"),
+    ("Missing $ inserted", "_^"),
+)
+
+
+def _escape_on_error_line(latex: str, error: LogError) -> Optional[Tuple[str, str]]:
+    chars = next((chars for message, chars in ESCAPES if message in error.message), None)
+    if chars is None or error.line is None:
+        return None
+    lines = latex.split("\n")
+    index = _source_line_index(latex, error)
+    if index is None:
+        return None
+    line = lines[index]
+    if chars == "_^" and re.search(r"\$|\\\(|\\\[", line):
+        return None  # math on this line: the missing $ is somewhere else
+    fixed = line
+    for char in chars:
+        replacement = "\\^{}" if char == "^" else f"\\{char}"
+        fixed = re.sub(rf"(?<!\\){re.escape(char)}", lambda _: replacement, fixed)
+    if fixed == line:
+        return None
+    lines[index] = fixed
+    return "\n".join(lines), f"escape {' '.join(chars)} on line {index + 1}"
+
+
+def _drop_listings_language(latex: str, error: LogError) -> Optional[Tuple[str, str]]:
+    if "Couldn't load requested language" not in error.message:
+        return None
+    # Only inside listings option lists: language= elsewhere (babel, minted, text) is not ours
+    spans = []
+    for match in LISTINGS_OPTIONS.finditer(latex):
+        end = _options_end(latex, match.end(), "}" if match.group(0).endswith("{") else "]")
+        if end is not None:
+            spans.append((match.end(), end))
+    if not spans:
+        return None
+    patched, last = [], 0
+    for start, end in spans:
+        # Leave empty option lists valid: \begin{lstlisting}[] and \lstset{} compile fine
+        patched += [latex[last:start], LISTINGS_LANGUAGE.sub("", latex[start:end])]
+        last = end
+    patched.append(latex[last:])
+    return "".join(patched), "remove unsupported listings language"
+
+
+def _options_end(latex: str, start: int, close: str) -> Optional[int]:
+    """Index of the `close` bracket ending the option list opened just before `start`, skipping nested groups."""
+    depth = 0
+    for index in range(start, len(latex)):
+        char = latex[index]
+        if char in "{[":
+            depth += 1
+        elif char in "}]":
+            if depth == 0:
+                return index if char == close else None
+            depth -= 1
+    return None
+
+
+def _scale_tikz_dimensions(latex: str, error: LogError) -> Optional[Tuple[str, str]]:
+    if "Dimension too large" not in error.message:
+        return None
+    return scale_tikz_dimensions(latex), "scale TikZ coordinates"
+
+
+def _close_document(latex: str, error: LogError) -> Optional[Tuple[str, str]]:
+    if "Missing \\end{document}" not in error.message or "\\end{document}" in latex:
+        return None
+    return latex.rstrip() + "\n\\end{document}\n", "add missing \\end{document}"
+
+
+# --- Helpers ---
+
+def _has_package(latex: str, package: str) -> bool:
+    return any(
+        package in (name.strip() for name in names.split(","))
+        for names in re.findall(r"\\(?:usepackage|RequirePackage)(?:\[[^\]]*\])?\{([^}]*)\}", latex)
+    )
+
+
+def _remove_package(latex: str, package: str) -> str:
+    """Drop `package` from every \\usepackage line, removing lines left empty."""
+    def drop(m: re.Match) -> str:
+        names = [name.strip() for name in m.group(2).split(",")]
+        kept = [name for name in names if name != package]
+        if len(kept) == len(names):
+            return m.group(0)
+        return f"\\usepackage{m.group(1) or ''}{{{','.join(kept)}}}{m.group(3)}" if kept else ""
+
+    return re.sub(r"\\usepackage(\[[^\]]*\])?\{([^}]*)\}([ \t]*\n?)", drop, latex)
+
+
+def _add_package(latex: str, package: str) -> str:
+    """Insert \\usepackage{package} at the end of the preamble (or before a snippet)."""
+    line = f"\\usepackage{{{package}}}\n"
+    begin = latex.find("\\begin{document}")
+    if begin >= 0:
+        return latex[:begin] + line + latex[begin:]
+    match = re.search(r"\\documentclass(\[[^\]]*\])?\{[^}]*\}[^\n]*\n", latex)
+    if match is not None:
+        return latex[:match.end()] + line + latex[match.end():]
+    return line + latex
+
+
+def _candidate_lines(latex: str, error: LogError) -> List[int]:
+    """0-based indexes the error's line number can refer to.
+
+    With a precompiled preamble format TeX numbers lines from \\begin{document},
+    so a line number has two readings until it is resolved.
+    """
+    count = latex.count("\n") + 1
+    if error.resolved:
+        return [error.line - 1] if 0 <= error.line - 1 < count else []
+    begin = latex.find("\\begin{document}")
+    offset = latex.count("\n", 0, begin) if begin >= 0 else 0
+    candidates = [error.line - 1, error.line - 1 + offset] if offset else [error.line - 1]
+    return [index for index in candidates if 0 <= index < count]
+
+
+def _source_line_index(latex: str, error: LogError) -> Optional[int]:
+    """0-based index of the line the error refers to, decided by the context TeX printed.
+
+    None when the context matches no reading, or when there is no context to
+    choose between two readings: patching a guessed line breaks correct source.
+    """
+    candidates = _candidate_lines(latex, error)
+    if error.resolved:
+        return candidates[0] if candidates else None
+    if not error.context:
+        return candidates[0] if len(candidates) == 1 else None
+    lines = latex.split("\n")
+    return next((index for index in candidates if error.context in lines[index]), None)
+
+
+def _resolve_line(latex: str, error: LogError) -> LogError:
+    """Pin the error's line to the line of `latex` it refers to (None when that cannot be told)."""
+    if error.line is None:
+        return error
+    index = _source_line_index(latex, error)
+    return replace(error, line=None if index is None else index + 1, resolved=True)
+
+
+def _rebase(errors: List[LogError], before: str, after: str) -> List[LogError]:
+    """Move the resolved lines of `errors` across an edit that turned `before` into `after`.
+
+    Lines before the edited region keep their number, lines after it shift,
+    and errors inside it lose their line.
+    """
+    old, new = before.split("\n"), after.split("\n")
+    delta = len(new) - len(old)
+    if delta == 0:
+        return errors
+    shortest = min(len(old), len(new))
+    prefix = 0
+    while prefix < shortest and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    rebased = []
+    for error in errors:
+        if error.line is None or error.line - 1 < prefix:
+            rebased.append(error)
+        elif error.line - 1 >= len(old) - suffix:
+            rebased.append(replace(error, line=error.line + delta))
+        else:
+            rebased.append(replace(error, line=None))
+    return rebased
@@ -0,0 +1,179 @@
+"""
+Precompiled preamble formats.
+
+The generator templates (diagram, table, flowchart) and project preambles are
+the same across thousands of compiles, yet TeX re-parses tikz, xcolor and the
+colour definitions every time. For each distinct preamble we dump a format
+file once, in the background, with `tectonic --outfmt=fmt`. Later compiles of
+documents with that preamble load the format with `--format` and only
+typeset the body.
+
+Format files are stored in a CompileCache of their own, keyed by the
+normalized preamble and the Tectonic version. A format is only published
+after a trivial document compiled against it. Preambles that cannot be dumped
+(native fonts, \\input of job files, ...) and formats that fail a compile
+the full document passes are remembered and always compiled normally.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from src.config import get_settings
+from .cache import CompileCache, normalize_source
+from .sandbox import run_sandboxed
+from .toolchain import ToolchainRegistry
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+BEGIN_DOCUMENT = re.compile(r"^[ \t]*\\begin\{document\}", re.MULTILINE)
+# Compiled against a freshly dumped format before it is published
+PROBE_BODY = "\\begin{document}\nx\n\\end{document}\n"
+
+
+def split_preamble(latex: str) -> Optional[Tuple[str, str]]:
+    """Split a full document into (preamble, body), the body starting at \\begin{document}."""
+    match = BEGIN_DOCUMENT.search(latex)
+    if not match or "\\documentclass" not in latex[:match.start()]:
+        return None
+    return latex[:match.start()], latex[match.start():]
+
+
+@dataclass
+class PreambleFormat:
+    """A dumped format that can replace the preamble of a document."""
+    key: str
+    name: str
+    path: Path
+    body: str
+
+
+class PreambleFormatCache:
+    """Builds and serves one Tectonic format file per distinct preamble."""
+
+    def __init__(
+        self,
+        toolchain: ToolchainRegistry,
+        cache_dir: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.toolchain = toolchain
+        self.store = CompileCache(
+            cache_dir=cache_dir or settings.COMPILE_FORMAT_CACHE_DIR or str(Path(tempfile.gettempdir()) / "tizkit_format_cache"),
+            max_bytes=max_bytes if max_bytes is not None else settings.COMPILE_FORMAT_CACHE_MAX_MB * 1024 * 1024,
+        )
+        self.builds = 0
+        self.build_failures = 0
+        self._failed: Set[str] = set()
+        self._building: Dict[str, asyncio.Task] = {}
+        self._build_slot = asyncio.Semaphore(1)
+
+    @property
+    def enabled(self) -> bool:
+        if not self.store.enabled:
+            return False
+        tectonic = self.toolchain.get("tectonic")
+        return tectonic.supports("outfmt") and tectonic.supports("format")
+
+    def key(self, preamble: str) -> str:
+        version = self.toolchain.get("tectonic").version or ""
+        return hashlib.sha256(f"{version}\0{normalize_source(preamble)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def format_name(key: str) -> str:
+        return f"tizkit-{key[:16]}"
+
+    async def lookup(self, latex: str, env: Dict[str, str]) -> Optional[PreambleFormat]:
+        """Return the format for `latex`'s preamble, scheduling a build the first time it is seen."""
+        if not self.enabled:
+            return None
+        parts = split_preamble(latex)
+        if parts is None:
+            return None
+        preamble, body = parts
+        key = self.key(preamble)
+        if key in self._failed:
+            return None
+
+        path = await asyncio.to_thread(self.store.get_path, key)
+        if path is not None:
+            return PreambleFormat(key=key, name=self.format_name(key), path=path, body=body)
+
+        if key not in self._building:
+            task = asyncio.create_task(self._build(key, preamble, env))
+            self._building[key] = task
+            task.add_done_callback(lambda _: self._building.pop(key, None))
+        return None
+
+    def invalidate(self, key: str) -> None:
+        """Forget a format that failed to load and stop rebuilding it."""
+        logger.warning(f"PreambleFormatCache: Discarding unusable format {key[:12]}")
+        self._failed.add(key)
+        self.store.discard(key)
+
+    def link_into(self, fmt: PreambleFormat, job_dir: Path) -> None:
+        """Expose the format file inside a job directory, where Tectonic looks it up by name."""
+        target = job_dir / f"{fmt.name}.fmt"
+        try:
+            os.link(fmt.path, target)
+        except OSError:
+            shutil.copyfile(fmt.path, target)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.store.stats(),
+            "builds": self.builds,
+            "build_failures": self.build_failures,
+            "unsupported_preambles": len(self._failed),
+        }
+
+    async def _build(self, key: str, preamble: str, env: Dict[str, str]) -> None:
+        name = self.format_name(key)
+        async with self._build_slot:
+            build_dir = Path(tempfile.mkdtemp(prefix="format_", dir=settings.COMPILE_WORK_DIR or None))
+            try:
+                source = f"\\input latex.ltx\n{preamble.rstrip()}\n\\dump\n"
+                (build_dir / f"{name}.tex").write_text(source, encoding="utf-8")
+                run = await run_sandboxed(
+                    [self.toolchain.path("tectonic"), *self.toolchain.tectonic_flags, "--keep-logs", "--outfmt=fmt", f"{name}.tex"],
+                    cwd=build_dir,
+                    env=env,
+                    timeout=settings.LATEX_TIMEOUT,
+                )
+                fmt_file = build_dir / f"{name}.fmt"
+                if run.returncode != 0 or not fmt_file.exists():
+                    self.build_failures += 1
+                    self._failed.add(key)
+                    logger.info(f"PreambleFormatCache: Preamble {key[:12]} cannot be dumped (rc={run.returncode}): {run.stderr[-500:]}")
+                    return
+                # A dump can succeed and still not load (fonts, \special state, bundle mismatch)
+                (build_dir / "probe.tex").write_text(PROBE_BODY, encoding="utf-8")
+                probe = await run_sandboxed(
+                    [self.toolchain.path("tectonic"), *self.toolchain.tectonic_flags, "--outfmt=pdf", f"--format={name}", "probe.tex"],
+                    cwd=build_dir,
+                    env=env,
+                    timeout=settings.LATEX_TIMEOUT,
+                )
+                if probe.returncode != 0 or not (build_dir / "probe.pdf").exists():
+                    self.build_failures += 1
+                    self._failed.add(key)
+                    logger.info(f"PreambleFormatCache: Format {name} does not compile a document (rc={probe.returncode}): {probe.stderr[-500:]}")
+                    return
+                content = await asyncio.to_thread(fmt_file.read_bytes)
+                await asyncio.to_thread(self.store.put, key, content)
+                self.builds += 1
+                logger.info(f"PreambleFormatCache: Built format {name} ({len(content)} bytes)")
+            except Exception as e:
+                self.build_failures += 1
+                self._failed.add(key)
+                logger.warning(f"PreambleFormatCache: Format build for {key[:12]} failed: {str(e)}")
+            finally:
+                await asyncio.to_thread(shutil.rmtree, build_dir, True)
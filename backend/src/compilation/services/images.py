@@ -0,0 +1,295 @@
+"""
+Print-resolution versions of linked images.
+
+Users link full-size phone photos and include them at a few centimetres, so
+TeX embeds 12-megapixel JPEGs, PDFs bloat and rasterizing a page crawls.
+Before a job directory is prepared, every linked PNG/JPEG whose uses in the
+document can be measured is downscaled to COMPILE_IMAGE_DPI at the largest
+size it is printed at, and recompressed with Pillow:
+- JPEGs are re-encoded at COMPILE_IMAGE_JPEG_QUALITY
+- PNGs are optimized losslessly; photographic, opaque PNGs referenced without
+  their extension become JPEGs (graphicx finds them by name either way)
+
+The printed size is read from `width`, `height` and `scale` of each
+\\includegraphics, with \\textwidth-like lengths bounded by the paper size.
+Images used any other way (macros, \\graphicspath, rotation, trimming,
+\\resizebox) are left untouched, and the DPI recorded in the file is scaled
+with the pixels, so the document lays out exactly as before.
+
+Derived images are stored in a CompileCache keyed by the source digest, the
+target size and the encoding; an empty entry records that an image is
+already as small as it gets.
+"""
+
+import hashlib
+import io
+import logging
+import math
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.config import get_settings
+from .cache import CompileCache
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow ships with the backend requirements
+    Image = None
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Bumped when the encoding changes, so stale derived images are not reused
+VERSION = "1"
+# Only images that shrink by more than this are re-encoded
+MIN_REDUCTION = 0.9
+# Largest letter/A4 dimensions (pt): an upper bound for \textwidth and friends
+PAPER_SHORT_PT = 614.295
+PAPER_LONG_PT = 845.047
+UNITS_PT = {"pt": 1.0, "bp": 72.27 / 72, "in": 72.27, "cm": 72.27 / 2.54, "mm": 72.27 / 25.4, "pc": 12.0}
+WIDTH_LENGTHS = ("textwidth", "linewidth", "columnwidth", "hsize", "paperwidth")
+HEIGHT_LENGTHS = ("textheight", "vsize", "paperheight")
+# Options that change which part of the image is shown or how it is oriented
+UNSUPPORTED_KEYS = {"angle", "origin", "trim", "viewport", "bb", "natwidth", "natheight", "page"}
+
+INCLUDEGRAPHICS = re.compile(r"\\includegraphics\*?\s*(?:\[([^\]]*)\])?\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}")
+LENGTH = re.compile(r"^([0-9]*\.?[0-9]+)?\s*(?:(pt|bp|in|cm|mm|pc)|\\([a-z]+))$")
+COMMENT = re.compile(r"(?<!\\)%.*")
+# Wrappers and settings that scale graphics beyond what \includegraphics says
+GLOBAL_SCALING = re.compile(r"\\(?:resizebox|scalebox|adjustbox|setkeys\s*\{Gin\})")
+CUSTOM_PAPER = re.compile(r"paper(?:width|height|size)\s*=|\b[ab][0-3]paper\b|\\setlength\s*\{?\\paper")
+# Image format graphicx expects behind each extension
+FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG"}
+
+
+@dataclass
+class ImageUse:
+    """How one \\includegraphics sizes an image: TeX points or a scale factor, None when not given."""
+    width: Optional[float] = None
+    height: Optional[float] = None
+    scale: Optional[float] = None
+    extension: bool = True  # referenced with its file extension
+
+
+def find_image_uses(latex: str) -> Optional[Dict[str, List[Optional[ImageUse]]]]:
+    """Map each \\includegraphics reference to its uses; None for a use that cannot be measured.
+
+    Returns None when something in the document may scale graphics further.
+    """
+    source = COMMENT.sub("", latex)
+    if GLOBAL_SCALING.search(source):
+        return None
+    paper = None if CUSTOM_PAPER.search(source) else _paper_size(source)
+    uses: Dict[str, List[Optional[ImageUse]]] = {}
+    for match in INCLUDEGRAPHICS.finditer(source):
+        reference = match.group(2).strip()
+        if reference.startswith("./"):
+            reference = reference[2:]
+        uses.setdefault(reference, []).append(_parse_options(match.group(1) or "", paper))
+    return uses
+
+
+def _paper_size(source: str) -> Tuple[float, float]:
+    if re.search(r"\blandscape\b", source):
+        return PAPER_LONG_PT, PAPER_LONG_PT
+    return PAPER_SHORT_PT, PAPER_LONG_PT
+
+
+def _parse_options(options: str, paper: Optional[Tuple[float, float]]) -> Optional[ImageUse]:
+    use = ImageUse()
+    for option in filter(None, (part.strip() for part in options.split(","))):
+        key, _, value = (s.strip() for s in option.partition("="))
+        value = value.strip("{}").strip()
+        if key in UNSUPPORTED_KEYS:
+            return None
+        if key == "width":
+            use.width = _length(value, paper)
+            if use.width is None:
+                return None
+        elif key in ("height", "totalheight"):
+            use.height = _length(value, paper)
+            if use.height is None:
+                return None
+        elif key == "scale":
+            try:
+                use.scale = float(value)
+            except ValueError:
+                return None
+    return use
+
+
+def _length(value: str, paper: Optional[Tuple[float, float]]) -> Optional[float]:
+    """A length in pt; \\textwidth-like lengths as their paper-size upper bound."""
+    match = LENGTH.match(value)
+    if not match:
+        return None
+    factor = float(match.group(1)) if match.group(1) else 1.0
+    if match.group(2):
+        return factor * UNITS_PT[match.group(2)]
+    if paper is None:
+        return None
+    if match.group(3) in WIDTH_LENGTHS:
+        return factor * paper[0]
+    if match.group(3) in HEIGHT_LENGTHS:
+        return factor * paper[1]
+    return None
+
+
+class ImageNormalizer:
+    """Downscales and recompresses linked images to what the document prints."""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None, dpi: Optional[int] = None):
+        self.cache = CompileCache(
+            cache_dir=cache_dir or settings.COMPILE_IMAGE_CACHE_DIR or str(Path(tempfile.gettempdir()) / "tizkit_image_cache"),
+            max_bytes=max_bytes if max_bytes is not None else settings.COMPILE_IMAGE_CACHE_MAX_MB * 1024 * 1024,
+        )
+        self.dpi = dpi or settings.COMPILE_IMAGE_DPI
+        self.normalized = 0
+        self.bytes_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None and self.cache.enabled
+
+    def normalize(self, latex: str, assets: List[dict]) -> List[dict]:
+        """Return `assets` with oversized images replaced by cached print-resolution versions.
+
+        Synchronous (Pillow decodes on the calling thread); run it off the event loop.
+        """
+        if not self.enabled or not assets:
+            return assets
+        uses = find_image_uses(latex)
+        if uses is None:
+            return assets
+        source = COMMENT.sub("", latex)
+        taken = {asset["filename"] for asset in assets}
+        normalized = []
+        for asset in assets:
+            try:
+                derived = self._normalize_asset(asset, source, uses, taken)
+            except Exception as e:
+                logger.warning(f"ImageNormalizer: Keeping {asset['filename']} as is: {str(e)}")
+                derived = None
+            normalized.append(derived or asset)
+        return normalized
+
+    def _normalize_asset(
+        self, asset: dict, source: str, uses: Dict[str, List[Optional[ImageUse]]], taken: set
+    ) -> Optional[dict]:
+        filename = asset["filename"]
+        name = Path(filename)
+        if name.suffix.lower() not in FORMATS or name.parent != Path("."):
+            return None
+        matched = uses.get(filename, []) + [
+            None if use is None else ImageUse(use.width, use.height, use.scale, extension=False)
+            for use in uses.get(name.stem, [])
+        ]
+        # Every mention of the name must be one of the measured uses (not a macro argument)
+        mentions = len(re.findall(rf"(?<![\w/.-]){re.escape(name.stem)}(?![\w-])", source))
+        if not matched or mentions != len(matched) or any(use is None for use in matched):
+            return None
+
+        data = asset.get("content")
+        source_path = Path(asset["path"]) if data is None else None
+        with Image.open(source_path or io.BytesIO(data)) as image:
+            if image.format != FORMATS[name.suffix.lower()]:
+                return None
+            width, height = image.size
+            dpi_x, dpi_y = _image_dpi(image)
+            factor = min(1.0, max(self._required_scale(use, width, height, dpi_x, dpi_y) for use in matched))
+            # Files store whole DPI values: round up to one so the natural size stays put
+            factor = min(1.0, math.ceil(dpi_x * factor) / dpi_x)
+            size = (max(1, math.ceil(width * factor)), max(1, math.ceil(height * factor)))
+            sha = asset.get("sha256") or hashlib.sha256(data).hexdigest()
+
+            def cache_key(to_jpeg: bool) -> str:
+                quality = settings.COMPILE_IMAGE_JPEG_QUALITY
+                return hashlib.sha256(f"{VERSION}:{sha}:{size[0]}x{size[1]}:{to_jpeg}:{quality}".encode("utf-8")).hexdigest()
+
+            to_jpeg = False
+            if image.format == "PNG" and not any(use.extension for use in matched) and name.with_suffix(".jpg").name not in taken:
+                # A cached conversion answers the question without decoding the PNG
+                converted = self.cache.get_path(cache_key(True))
+                to_jpeg = converted.stat().st_size > 0 if converted is not None else _is_photo(image)
+            if factor >= MIN_REDUCTION and not to_jpeg:
+                return None
+            key = cache_key(to_jpeg)
+            target = name.with_suffix(".jpg") if to_jpeg else name
+
+            cached = self.cache.get_path(key)
+            if cached is None:
+                encoded = self._encode(image, size, (dpi_x * size[0] / width, dpi_y * size[1] / height), to_jpeg)
+                original = len(data) if data is not None else source_path.stat().st_size
+                if len(encoded) >= original:
+                    # Already as small as it gets: remember that with an empty entry
+                    self.cache.put(key, b"")
+                    return None
+                cached = self.cache.put(key, encoded)
+                if cached is None:
+                    return None
+                self.normalized += 1
+                self.bytes_saved += original - len(encoded)
+                logger.info(
+                    f"ImageNormalizer: {filename} {width}x{height} -> {target.name} {size[0]}x{size[1]}, "
+                    f"{original // 1024}KB -> {len(encoded) // 1024}KB"
+                )
+            elif cached.stat().st_size == 0:
+                return None
+
+        return {"filename": target.name, "path": cached, "sha256": key}
+
+    def _required_scale(self, use: ImageUse, width: int, height: int, dpi_x: float, dpi_y: float) -> float:
+        """Fraction of the source pixels needed to print `use` at self.dpi."""
+        scales = []
+        if use.width is not None:
+            scales.append(use.width / 72.27 * self.dpi / width)
+        if use.height is not None:
+            scales.append(use.height / 72.27 * self.dpi / height)
+        if use.scale is not None and not scales:
+            scales.append(use.scale * self.dpi / dpi_x)
+        if not scales:
+            # Natural size, from the resolution recorded in the file
+            scales.append(self.dpi / min(dpi_x, dpi_y))
+        return max(scales)
+
+    def _encode(self, image, size: Tuple[int, int], dpi: Tuple[float, float], to_jpeg: bool) -> bytes:
+        """Resize and re-encode, recording the DPI that keeps the image's natural size unchanged."""
+        if image.format == "JPEG":
+            # Lets the JPEG decoder scale while decoding instead of expanding every pixel
+            image.draft(image.mode, size)
+        resized = image.resize(size, Image.LANCZOS)
+        out = io.BytesIO()
+        if image.format == "JPEG" or to_jpeg:
+            if resized.mode not in ("RGB", "L", "CMYK"):
+                resized = resized.convert("RGB")
+            resized.save(out, "JPEG", quality=settings.COMPILE_IMAGE_JPEG_QUALITY, optimize=True, dpi=dpi)
+        else:
+            resized.save(out, "PNG", optimize=True, dpi=dpi)
+        return out.getvalue()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.cache.stats(), "normalized": self.normalized, "bytes_saved": self.bytes_saved}
+
+
+def _image_dpi(image) -> Tuple[float, float]:
+    """Resolution recorded in the file; TeX assumes 72 dpi when there is none."""
+    dpi = image.info.get("dpi")
+    try:
+        dpi_x, dpi_y = float(dpi[0]), float(dpi[1])
+    except (TypeError, ValueError, IndexError):
+        return 72.0, 72.0
+    return (dpi_x if dpi_x > 0 else 72.0), (dpi_y if dpi_y > 0 else 72.0)
+
+
+def _is_photo(image) -> bool:
+    """True for photographic PNGs without transparency, which JPEG encodes far smaller."""
+    if image.mode not in ("RGB", "RGBA"):
+        return False
+    if image.mode == "RGBA" and image.getchannel("A").getextrema() != (255, 255):
+        return False
+    sample = image.copy()
+    sample.thumbnail((128, 128))
+    return sample.getcolors(maxcolors=4096) is None
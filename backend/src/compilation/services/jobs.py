@@ -0,0 +1,156 @@
+"""
+In-memory registry of asynchronous compile jobs.
+
+`POST /compile/jobs` hands the compile to a background task and returns an id
+straight away; clients then poll the status, follow the stage events over SSE
+and download the result by id. Finished jobs are kept for `COMPILE_JOB_TTL`
+seconds.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from src.config import get_settings
+from .engine import CompileResult, stage_listener
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Job lifecycle: queued -> running -> rasterizing (PNG/SVG only) -> done | failed
+TERMINAL_STATES = ("done", "failed")
+
+
+@dataclass
+class CompileJobRecord:
+    """State of one asynchronous compile, including the stage events emitted so far."""
+    id: str
+    kind: str
+    user_id: str
+    output_format: str
+    status: str = "queued"
+    error: Optional[str] = None
+    result: Optional[CompileResult] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    events: List[dict] = field(default_factory=list)
+    _changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    def describe(self) -> dict:
+        result = self.result
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "output_format": self.output_format,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "cache_hit": result.cache_hit if result else False,
+            "timings": result.timings if result else {},
+            "usage": result.usage if result else {},
+            "lint_errors": [e.as_dict() for e in result.lint_errors] if result else [],
+        }
+
+
+class CompileJobManager:
+    """Runs compiles in background tasks and tracks their progress by id."""
+
+    def __init__(self, ttl: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else settings.COMPILE_JOB_TTL
+        self.jobs: Dict[str, CompileJobRecord] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(
+        self,
+        kind: str,
+        user_id: str,
+        output_format: str,
+        compile_fn: Callable[[], Awaitable[CompileResult]],
+    ) -> CompileJobRecord:
+        """Register a job and start `compile_fn` in the background."""
+        self._purge_expired()
+        record = CompileJobRecord(id=uuid.uuid4().hex, kind=kind, user_id=str(user_id), output_format=output_format)
+        record.events.append(self._event(record))
+        self.jobs[record.id] = record
+
+        task = asyncio.create_task(self._run(record, compile_fn))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return record
+
+    def get(self, job_id: str, user_id: str) -> Optional[CompileJobRecord]:
+        """Return the job if it exists and belongs to `user_id`."""
+        record = self.jobs.get(job_id)
+        if record is None or record.user_id != str(user_id):
+            return None
+        return record
+
+    async def events(self, record: CompileJobRecord) -> AsyncIterator[dict]:
+        """Yield every stage event of `record`, replaying past ones first, until it finishes."""
+        seen = 0
+        while True:
+            async with record._changed:
+                await record._changed.wait_for(lambda: len(record.events) > seen)
+                pending = record.events[seen:]
+            seen += len(pending)
+            for event in pending:
+                yield event
+            if pending[-1]["status"] in TERMINAL_STATES:
+                return
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "jobs": len(self.jobs),
+            "active": sum(1 for record in self.jobs.values() if not record.finished),
+        }
+
+    async def _run(self, record: CompileJobRecord, compile_fn: Callable[[], Awaitable[CompileResult]]) -> None:
+        stage_listener.set(lambda stage: self._set_status(record, stage))
+        try:
+            result = await compile_fn()
+            record.result = result
+            if result.success:
+                self._set_status(record, "done")
+            else:
+                self._set_status(record, "failed", result.error)
+        except Exception as e:
+            logger.error(f"CompileJobManager: Job {record.id} failed: {str(e)}")
+            detail = getattr(e, "detail", None)
+            self._set_status(record, "failed", str(detail or e))
+
+    def _set_status(self, record: CompileJobRecord, status: str, error: Optional[str] = None) -> None:
+        # Flowchart fallbacks compile several times; only report actual transitions
+        if record.finished or record.status == status:
+            return
+        record.status = status
+        record.error = error
+        if status in TERMINAL_STATES:
+            record.finished_at = time.time()
+        record.events.append(self._event(record))
+        # Referenced until done, like the jobs themselves: the loop keeps only weak references
+        task = asyncio.create_task(self._notify(record))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _notify(self, record: CompileJobRecord) -> None:
+        async with record._changed:
+            record._changed.notify_all()
+
+    def _event(self, record: CompileJobRecord) -> dict:
+        event = {"job_id": record.id, "status": record.status, "at": time.time()}
+        if record.error:
+            event["error"] = record.error
+        return event
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, record in self.jobs.items() if record.finished and record.finished_at < cutoff]:
+            del self.jobs[job_id]
@@ -0,0 +1,363 @@
+"""
+Pre-compile LaTeX linter.
+
+A single pass over the source that catches documents which can only fail in
+Tectonic, so they never take a compile slot: unbalanced braces, mismatched
+\\begin/\\end, missing \\begin{document}/\\end{document} and environments that
+no loaded package defines. It runs in well under a millisecond per kilobyte
+and reports (line, column, message, severity) for each problem.
+
+The linter is conservative. Anything it cannot judge (custom packages, macros
+that expand to \\begin) is left to TeX. Only problems that are certain are
+errors and reject the document; the rest (unknown environments, problems in
+documents that change catcodes or branch on TeX conditionals) are warnings.
+"""
+
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+# Environments whose body is not LaTeX and must not be scanned
+VERBATIM_ENVIRONMENTS = {"verbatim", "verbatim*", "Verbatim", "lstlisting", "minted", "comment", "filecontents", "filecontents*"}
+
+BASE_ENVIRONMENTS = {
+    "document", "abstract", "center", "flushleft", "flushright", "quote", "quotation", "verse",
+    "itemize", "enumerate", "description", "list", "trivlist", "tabular", "tabular*", "array",
+    "tabbing", "table", "table*", "figure", "figure*", "minipage", "picture", "math", "displaymath",
+    "equation", "eqnarray", "eqnarray*", "thebibliography", "theindex", "titlepage", "appendix",
+    "letter", "filecontents", "filecontents*", "small", "footnotesize", "scriptsize", "tiny",
+    "large", "Large", "LARGE", "huge", "Huge", "normalsize", "bfseries", "itshape", "ttfamily",
+    "sffamily", "rmfamily", "em", "sloppypar", "lrbox", "verbatim", "verbatim*",
+}
+
+# Environments provided by the packages our generators and users load most.
+# Documents that load any package outside this map skip the unknown-environment check.
+PACKAGE_ENVIRONMENTS: Dict[str, Set[str]] = {
+    "amsmath": {"equation*", "align", "align*", "alignat", "alignat*", "gather", "gather*", "multline",
+                "multline*", "flalign", "flalign*", "split", "aligned", "alignedat", "gathered", "cases",
+                "matrix", "pmatrix", "bmatrix", "Bmatrix", "vmatrix", "Vmatrix", "smallmatrix", "subequations"},
+    "amssymb": set(), "amsfonts": set(), "amsthm": {"proof"}, "mathtools": {"dcases", "dcases*", "rcases", "multlined"},
+    "graphicx": set(), "graphics": set(), "xcolor": set(), "color": set(), "geometry": set(), "hyperref": set(),
+    "inputenc": set(), "fontenc": set(), "lmodern": set(), "babel": set(), "microtype": set(), "float": set(),
+    "booktabs": set(), "array": set(), "multirow": set(), "makecell": set(), "colortbl": set(), "siunitx": set(),
+    "caption": set(), "subcaption": {"subfigure", "subtable"}, "enumitem": set(), "xspace": set(), "url": set(),
+    "tikz": {"tikzpicture", "scope", "pgfonlayer"}, "pgfplots": {"axis", "semilogxaxis", "semilogyaxis", "loglogaxis", "groupplot"},
+    "longtable": {"longtable"}, "tabularx": {"tabularx"}, "multicol": {"multicols", "multicols*"},
+    "listings": {"lstlisting"}, "fancyvrb": {"Verbatim", "BVerbatim", "LVerbatim"}, "verbatim": {"comment"},
+    "wrapfig": {"wrapfigure", "wraptable"}, "adjustbox": {"adjustbox"}, "tcolorbox": {"tcolorbox"},
+    "algorithm": {"algorithm"}, "algorithmic": {"algorithmic"}, "algpseudocode": {"algorithmic"},
+    "circuitikz": {"circuitikz"}, "forest": {"forest"}, "standalone": set(), "varwidth": {"varwidth"},
+    "fancyhdr": set(), "titlesec": set(), "parskip": set(), "setspace": {"singlespace", "doublespace", "onehalfspace", "spacing"},
+}
+
+# Packages (and class options) that load other packages, whose environments they bring along
+PACKAGE_IMPLIES: Dict[str, Set[str]] = {
+    "mathtools": {"amsmath"}, "amsthm": set(), "amssymb": {"amsfonts"},
+    "pgfplots": {"tikz"}, "circuitikz": {"tikz"}, "forest": {"tikz"}, "tcolorbox": {"tikz"},
+    "algpseudocode": {"algorithmic"},
+}
+CLASS_OPTION_PACKAGES = {"tikz": "tikz", "varwidth": "varwidth"}
+
+DOCUMENT_CLASS_ENVIRONMENTS = {"beamer": {"frame", "block", "alertblock", "exampleblock", "columns", "column", "itemize"}}
+
+COMMAND = re.compile(r"\\([A-Za-z@]+\*?|.)")
+GROUP_ARG = re.compile(r"\s*(\[[^\]]*\]\s*)?\{([^{}]*)\}")
+OPTIONAL_ARG = re.compile(r"\s*(\[[^\]]*\])?\s*")
+# Commands whose argument is read verbatim: % and unbalanced braces inside are text
+VERBATIM_ARGUMENTS = {"url", "nolinkurl", "href", "lstinline", "mintinline", "Verb"}
+# After these the (optional) language argument comes before the verbatim one
+LANGUAGE_ARGUMENT = {"mintinline"}
+# Commands that change category codes, so braces and % may not mean what they seem
+CATCODE_CHANGES = {"catcode", "DefineShortVerb", "MakeShortVerb", "lstMakeShortInline"}
+# \if-prefixed commands that are not TeX conditionals (no matching \fi)
+NOT_CONDITIONAL = {
+    "iff", "ifthenelse", "ifdef", "ifundef", "ifdefempty", "ifdefvoid", "ifdefstring", "ifcsdef", "ifcsundef",
+    "ifcsstring", "ifbool", "iftoggle", "ifblank", "ifstrequal", "ifstrempty", "ifnumcomp", "ifnumequal",
+    "ifdimcomp", "ifboolexpr", "ifdefmacro",
+}
+# Another argument group follows (optional arguments skipped), so a definition is not over yet
+NEXT_GROUP = re.compile(r"\s*(\[[^\]]*\]\s*)*\{")
+# Bodies of these may hold half an environment (\newcommand{\bi}{\begin{itemize}})
+DEFINES_MACRO = {"newcommand", "renewcommand", "providecommand", "newcommand*", "renewcommand*", "providecommand*",
+                 "def", "gdef", "edef", "xdef", "NewDocumentCommand", "RenewDocumentCommand", "DeclareRobustCommand"}
+DEFINES_ENVIRONMENT = {"newenvironment", "renewenvironment", "NewDocumentEnvironment", "RenewDocumentEnvironment",
+                       "DeclareDocumentEnvironment", "newtheorem", "newtheorem*", "declaretheorem", "newtcolorbox",
+                       "newfloat", "DeclareFloatingEnvironment", "lstnewenvironment", "newmdenv", "newtcbtheorem",
+                       "surroundwithmdframed", "NewEnviron"}
+
+
+@dataclass
+class LintError:
+    line: int
+    column: int
+    message: str
+    severity: str = "error"  # error: the compile would fail | warning: it may
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+    def __str__(self) -> str:
+        return f"line {self.line}, column {self.column}: {self.message}"
+
+
+def lint_latex(latex: str, max_errors: int = 20) -> List[LintError]:
+    """Return structural problems, in source order. Those with severity "error" would make Tectonic fail."""
+    return _Linter(latex).run()[:max_errors]
+
+
+def lint_failures(errors: List[LintError]) -> List[LintError]:
+    """The problems certain to fail the compile."""
+    return [error for error in errors if error.severity == "error"]
+
+
+def format_lint_errors(errors: List[LintError]) -> str:
+    return "LaTeX check failed before compilation:\n" + "\n".join(f"- {error}" for error in errors)
+
+
+class _Linter:
+    def __init__(self, latex: str):
+        self.src = latex
+        self.errors: List[LintError] = []
+        self.line_starts = [0] + [i + 1 for i, ch in enumerate(latex) if ch == "\n"]
+        self.braces: List[int] = []
+        self.environments: List[Tuple[str, int]] = []
+        self.used: List[Tuple[str, int]] = []
+        self.defined: Set[str] = set()
+        self.packages: Set[str] = set()
+        self.document_class: Optional[str] = None
+        self.document_class_options: Set[str] = set()
+        self.document_class_at: Optional[int] = None
+        self.begin_document: Optional[int] = None
+        self.end_document: Optional[int] = None
+        self.defining: Optional[int] = None  # brace depth of the definition being skipped
+        self.uncertain = False  # structure depends on catcodes or conditionals we do not evaluate
+        self.branches: List[str] = []  # open TeX conditionals: "iftrue", or "if" when the branch is unknown
+
+    def run(self) -> List[LintError]:
+        src, i, n = self.src, 0, len(self.src)
+        while i < n:
+            ch = src[i]
+            if ch == "%":
+                newline = src.find("\n", i)
+                i = n if newline < 0 else newline + 1
+            elif ch == "{":
+                self.braces.append(i)
+                i += 1
+            elif ch == "}":
+                if self.braces:
+                    self.braces.pop()
+                else:
+                    self.error(i, "Unmatched closing brace '}'")
+                i += 1
+                if self.defining == len(self.braces) and not NEXT_GROUP.match(src, i):
+                    self.defining = None
+            elif ch == "\\":
+                i = self.command(i)
+            else:
+                i += 1
+        self.finish()
+        self.errors.sort(key=lambda e: (e.line, e.column))
+        return self.errors
+
+    def command(self, i: int) -> int:
+        match = COMMAND.match(self.src, i)
+        if match is None:
+            return i + 1
+        name, end = match.group(1), match.end()
+        if name == "verb" or name == "verb*":
+            return self.skip_verb(end)
+        if name in VERBATIM_ARGUMENTS:
+            return self.skip_verbatim_argument(name, end)
+        if name in CATCODE_CHANGES:
+            self.uncertain = True
+            return end
+        if name == "newif":
+            # \newif\iffoo defines the conditional, it does not open one
+            following = COMMAND.match(self.src, OPTIONAL_ARG.match(self.src, end).end())
+            return following.end() if following else end
+        if self.defining is None:
+            # Conditionals in a definition only run where the macro is used
+            if name.startswith("if") and name not in NOT_CONDITIONAL:
+                return self.conditional(name, end)
+            if name == "else" and self.branches and self.branches[-1] == "iftrue":
+                self.branches.pop()
+                return self.skip_branch(end, ("fi",))[1]
+            if name == "fi" and self.branches:
+                self.branches.pop()
+                return end
+        if name in DEFINES_MACRO and self.defining is None:
+            self.defining = len(self.braces)
+            return end
+        if self.defining is not None and name in ("begin", "end"):
+            return end
+        if name in ("begin", "end", "documentclass", "usepackage", "RequirePackage") or name in DEFINES_ENVIRONMENT:
+            arg = GROUP_ARG.match(self.src, end)
+            if arg is None:
+                return end
+            value = arg.group(2).strip()
+            if name == "begin":
+                return self.begin(i, value, arg.end())
+            if name == "end":
+                self.end(i, value)
+            elif name == "documentclass":
+                self.document_class, self.document_class_at = value, i
+                if arg.group(1):
+                    options = arg.group(1).strip()[1:-1]
+                    self.document_class_options = {o.strip() for o in options.split(",") if o.strip()}
+            elif name in ("usepackage", "RequirePackage"):
+                self.packages.update(p.strip() for p in value.split(",") if p.strip())
+            else:
+                self.defined.add(value)
+                if self.defining is None and NEXT_GROUP.match(self.src, arg.end()):
+                    self.defining = len(self.braces)
+            return arg.end()
+        return end
+
+    def begin(self, at: int, env: str, after: int) -> int:
+        if env == "document":
+            if self.begin_document is not None:
+                self.error(at, "\\begin{document} appears more than once")
+            self.begin_document = at
+        self.environments.append((env, at))
+        self.used.append((env, at))
+        if env in VERBATIM_ENVIRONMENTS:
+            close = self.src.find(f"\\end{{{env}}}", after)
+            if close < 0:
+                return len(self.src)  # reported as unclosed in finish()
+            return close
+        return after
+
+    def end(self, at: int, env: str) -> None:
+        if env == "document":
+            self.end_document = at
+        if not self.environments:
+            self.error(at, f"\\end{{{env}}} without a matching \\begin{{{env}}}")
+            return
+        open_env, open_at = self.environments[-1]
+        if open_env == env:
+            self.environments.pop()
+            return
+        if any(name == env for name, _ in self.environments):
+            # Close the inner environments that were left open
+            while self.environments and self.environments[-1][0] != env:
+                name, begin_at = self.environments.pop()
+                self.error(begin_at, f"\\begin{{{name}}} is closed by \\end{{{env}}} (missing \\end{{{name}}})")
+            self.environments.pop()
+        else:
+            line, _ = self.position(open_at)
+            self.error(at, f"\\end{{{env}}} does not match \\begin{{{open_env}}} on line {line}")
+
+    def skip_verb(self, i: int) -> int:
+        if i >= len(self.src):
+            return i
+        delimiter = self.src[i]
+        close = self.src.find(delimiter, i + 1)
+        newline = self.src.find("\n", i + 1)
+        if close < 0 or (0 <= newline < close):
+            self.error(i, "\\verb is not closed on the same line")
+            return i + 1
+        return close + 1
+
+    def skip_verbatim_argument(self, name: str, i: int) -> int:
+        """Skip the verbatim argument of \\url{...}, \\lstinline|...| and the like."""
+        i = OPTIONAL_ARG.match(self.src, i).end()
+        if name in LANGUAGE_ARGUMENT:
+            language = GROUP_ARG.match(self.src, i)
+            if language is None:
+                return i
+            i = language.end()
+        if i >= len(self.src) or self.src[i] in "\n%\\":
+            return i
+        if self.src[i] != "{":
+            close = self.src.find(self.src[i], i + 1)
+            return len(self.src) if close < 0 else close + 1
+        depth = 0
+        for j in range(i, len(self.src)):
+            if self.src[j] == "{":
+                depth += 1
+            elif self.src[j] == "}":
+                depth -= 1
+                if depth == 0:
+                    return j + 1
+        return len(self.src)
+
+    def conditional(self, name: str, i: int) -> int:
+        """Skip what \\iffalse and \\iftrue skip; any other conditional makes the result uncertain."""
+        if name == "iffalse":
+            word, after = self.skip_branch(i, ("else", "fi"))
+            if word == "else":
+                self.branches.append("if")  # its \fi is still ahead
+            return after
+        if name != "iftrue":
+            self.uncertain = True
+        self.branches.append("iftrue" if name == "iftrue" else "if")
+        return i
+
+    def skip_branch(self, i: int, stop: Tuple[str, ...]) -> Tuple[Optional[str], int]:
+        """Skip to the first command in `stop` outside nested conditionals; return it and the offset after it."""
+        depth = 0
+        for match in COMMAND.finditer(self.src, i):
+            word = match.group(1)
+            if word.startswith("if") and word not in NOT_CONDITIONAL:
+                depth += 1
+            elif word == "fi" and depth:
+                depth -= 1
+            elif depth == 0 and word in stop:
+                return word, match.end()
+        return None, len(self.src)
+
+    def finish(self) -> None:
+        for env, at in self.environments:
+            if env == "document" and self.document_class is not None:
+                continue  # reported as a missing \\end{document} below
+            self.error(at, f"\\begin{{{env}}} is never closed")
+        for at in self.braces:
+            self.error(at, "Unclosed brace '{'")
+
+        if self.document_class is not None:
+            if self.begin_document is None:
+                self.error(self.document_class_at, "Missing \\begin{document}")
+            elif self.end_document is None:
+                self.error(len(self.src), "Missing \\end{document}")
+
+        known = self.known_environments()
+        if known is not None:
+            for env, at in self.used:
+                if env not in known and env not in self.defined:
+                    self.error(at, f"Unknown environment '{env}'", severity="warning")
+
+    def known_environments(self) -> Optional[Set[str]]:
+        """Environments the document can use, or None when a package we do not know is loaded."""
+        if self.document_class is None or any(p not in PACKAGE_ENVIRONMENTS for p in self.packages):
+            return None
+        known = set(BASE_ENVIRONMENTS) | DOCUMENT_CLASS_ENVIRONMENTS.get(self.document_class, set())
+        if self.document_class not in ("article", "report", "book", "letter", "standalone", "minimal") \
+                and self.document_class not in DOCUMENT_CLASS_ENVIRONMENTS:
+            return None
+        packages = set(self.packages)
+        packages.update(CLASS_OPTION_PACKAGES[o] for o in self.document_class_options if o in CLASS_OPTION_PACKAGES)
+        pending = list(packages)
+        while pending:
+            for implied in PACKAGE_IMPLIES.get(pending.pop(), ()):
+                if implied not in packages:
+                    packages.add(implied)
+                    pending.append(implied)
+        for package in packages:
+            known |= PACKAGE_ENVIRONMENTS[package]
+        return known
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        lo, hi = 0, len(self.line_starts) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.line_starts[mid] <= offset:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo + 1, offset - self.line_starts[lo] + 1
+
+    def error(self, offset: int, message: str, severity: str = "error") -> None:
+        if self.uncertain:
+            severity = "warning"
+        line, column = self.position(offset)
+        self.errors.append(LintError(line, column, message, severity))
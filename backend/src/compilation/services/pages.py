@@ -0,0 +1,87 @@
+"""
+Lazy per-page rendering of compiled PDFs.
+
+Compiled PDFs are kept in the compile cache under their render id (the cache
+key of the PDF compile). A client scrolling a long document asks for single
+pages at the DPI it needs. Each page is rasterized on first request and then
+served from a page cache of its own, so browsing pages never evicts compiled
+documents.
+"""
+
+import asyncio
+import hashlib
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.config import get_settings
+from .cache import CompileCache
+from .engine import CompileResult
+from .rasterizer import PdfRasterizer
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+MIN_DPI = 36
+MAX_DPI = 600
+
+
+class PageRenderer:
+    """Rasterizes single pages of cached PDFs on demand and caches the PNGs."""
+
+    def __init__(
+        self,
+        documents: CompileCache,
+        rasterizer: PdfRasterizer,
+        cache_dir: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.documents = documents
+        self.rasterizer = rasterizer
+        self.pages = CompileCache(
+            cache_dir=cache_dir or settings.COMPILE_PAGE_CACHE_DIR or str(Path(tempfile.gettempdir()) / "tizkit_page_cache"),
+            max_bytes=max_bytes if max_bytes is not None else settings.COMPILE_PAGE_CACHE_MAX_MB * 1024 * 1024,
+        )
+        self.renders = 0
+        self._rendering: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def page_key(render_id: str, page: int, dpi: int) -> str:
+        return hashlib.sha256(f"{render_id}\0{page}\0{dpi}".encode("utf-8")).hexdigest()
+
+    async def render(self, render_id: str, page: int, dpi: int) -> Optional[CompileResult]:
+        """Return the PNG of `page` (1-based) of a cached PDF, or None when the PDF is gone.
+
+        Raises RasterizeError when the page cannot be rendered (e.g. past the last page).
+        """
+        key = self.page_key(render_id, page, dpi)
+        path = await asyncio.to_thread(self.pages.get_path, key)
+        if path is not None:
+            return CompileResult(True, path=path, cache_hit=True)
+
+        pdf_file = await asyncio.to_thread(self.documents.get_path, render_id)
+        if pdf_file is None:
+            return None
+
+        # Concurrent requests for the same page share one poppler run
+        task = self._rendering.get(key)
+        if task is None:
+            task = asyncio.create_task(self._render(key, pdf_file, page, dpi))
+            self._rendering[key] = task
+            task.add_done_callback(lambda _: self._rendering.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.pages.stats(), "renders": self.renders}
+
+    async def _render(self, key: str, pdf_file: Path, page: int, dpi: int) -> CompileResult:
+        timings: Dict[str, float] = {}
+        usage: Dict[str, float] = {}
+        started = time.perf_counter()
+        content = await self.rasterizer.render_page(pdf_file, page, dpi, usage)
+        timings["rasterize"] = (time.perf_counter() - started) * 1000
+        self.renders += 1
+        path = await asyncio.to_thread(self.pages.put, key, content)
+        return CompileResult(True, content=content, path=path, timings=timings, usage=usage)
@@ -0,0 +1,83 @@
+"""
+Latest-wins live preview sessions.
+
+The diagram and table editors send a new revision of the source on every
+edit. A PreviewSession debounces those revisions and compiles only the newest
+one. When a newer revision arrives, the compile of the older one is
+cancelled, which kills its Tectonic process unless another request shares
+that compile. Only results for the newest revision are published, so a slow
+stale compile never overwrites a fresher preview.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from src.config import get_settings
+from .engine import CompileResult
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CompileFn = Callable[[str], Awaitable[CompileResult]]
+PublishFn = Callable[[int, CompileResult], Awaitable[None]]
+
+
+class PreviewSession:
+    """Debounces source revisions and compiles only the newest one."""
+
+    def __init__(self, compile_fn: CompileFn, publish: PublishFn, debounce: Optional[float] = None):
+        self.compile_fn = compile_fn
+        self.publish = publish
+        self.debounce = settings.COMPILE_PREVIEW_DEBOUNCE_MS / 1000 if debounce is None else debounce
+        self.revision = 0
+        self.compiled = 0
+        self.superseded = 0
+        self._task: Optional[asyncio.Task] = None
+        self._compiling: Optional[int] = None  # revision whose compile is running
+        self._publish_lock = asyncio.Lock()
+
+    def submit(self, revision: int, latex: str) -> None:
+        """Queue a revision, cancelling the pending or running compile of an older one."""
+        if revision <= self.revision:
+            logger.debug(f"PreviewSession: Ignoring out-of-order revision {revision}")
+            return
+        self.revision = revision
+        if self._task is not None and not self._task.done():
+            if self._compiling is not None:
+                self.superseded += 1
+            self._task.cancel()
+        self._task = asyncio.create_task(self._compile(revision, latex))
+
+    async def close(self) -> None:
+        """Cancel whatever is still pending; called when the client disconnects."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"revision": self.revision, "compiled": self.compiled, "superseded": self.superseded}
+
+    async def _compile(self, revision: int, latex: str) -> None:
+        await asyncio.sleep(self.debounce)
+        self._compiling = revision
+        try:
+            result = await self.compile_fn(latex)
+        finally:
+            if self._compiling == revision:
+                self._compiling = None
+        self.compiled += 1
+        if revision != self.revision:
+            return
+        # Shielded so a newer revision cannot cut a message in half; it waits for the lock instead
+        await asyncio.shield(self._publish(revision, result))
+
+    async def _publish(self, revision: int, result: CompileResult) -> None:
+        async with self._publish_lock:
+            try:
+                await self.publish(revision, result)
+            except Exception as e:
+                logger.warning(f"PreviewSession: Failed to publish revision {revision}: {str(e)}")
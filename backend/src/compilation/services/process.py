@@ -0,0 +1,58 @@
+"""
+Non-blocking subprocess helper shared by the compile engine and toolchain probes.
+"""
+
+import asyncio
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+Output = Union[str, bytes]
+
+
+async def run_process(
+    argv: List[str],
+    cwd: Optional[Path] = None,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+    text: bool = True,
+) -> Tuple[int, Output, str]:
+    """Run a command without blocking the event loop. Returns (returncode, stdout, stderr).
+
+    With `text=False` stdout is returned as raw bytes (e.g. a PNG written to stdout).
+
+    Raises asyncio.TimeoutError on timeout; the child is killed on timeout and
+    on cancellation. Event loops without subprocess support (the selector loop
+    uvicorn uses on Windows with --reload) fall back to a worker thread.
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            cwd=str(cwd) if cwd else None,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except NotImplementedError:
+        return await asyncio.to_thread(_run_process_blocking, argv, cwd, env, timeout, text)
+
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    return proc.returncode, _decode(stdout, text), stderr.decode("utf-8", errors="replace")
+
+
+def _run_process_blocking(argv, cwd, env, timeout, text) -> Tuple[int, Output, str]:
+    try:
+        result = subprocess.run(argv, cwd=cwd, env=env, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise asyncio.TimeoutError()
+    return result.returncode, _decode(result.stdout, text), result.stderr.decode("utf-8", errors="replace")
+
+
+def _decode(output: bytes, text: bool) -> Output:
+    return output.decode("utf-8", errors="replace") if text else output
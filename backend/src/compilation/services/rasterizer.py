@@ -0,0 +1,104 @@
+"""
+PDF to PNG rasterization (and SVG vectorization) through poppler's command-line tools.
+
+pdftoppm (or pdftocairo when only that is installed) renders exactly the
+requested pages at the requested DPI and writes the encoded PNG to stdout, so
+no intermediate PIL image is built and no page beyond the requested ones is
+rendered. The tools run sandboxed (see sandbox.py), off the event loop.
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from src.config import get_settings
+from .sandbox import run_sandboxed
+from .toolchain import ToolchainRegistry
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Preferred order: pdftoppm (splash) is the faster of the two for PNG output
+RASTER_TOOLS = ("pdftoppm", "pdftocairo")
+
+
+class RasterizeError(Exception):
+    """Raised when a page cannot be rasterized."""
+
+
+class PdfRasterizer:
+    """Renders selected PDF pages to PNG bytes with pdftoppm/pdftocairo."""
+
+    def __init__(self, toolchain: ToolchainRegistry, timeout: Optional[int] = None):
+        self.toolchain = toolchain
+        self.timeout = timeout or settings.LATEX_TIMEOUT
+
+    def tool(self) -> Optional[str]:
+        for name in RASTER_TOOLS:
+            if self.toolchain.get(name).available:
+                return name
+        return None
+
+    async def render_page(
+        self,
+        pdf_file: Path,
+        page: int = 1,
+        dpi: int = 150,
+        usage: Optional[Dict[str, float]] = None,
+    ) -> bytes:
+        """Render one page (1-based) of `pdf_file` and return the PNG bytes.
+
+        The tool runs sandboxed; its CPU time and peak memory are added to `usage`.
+        """
+        await self.toolchain.ensure_probed()
+        tool = self.tool()
+        if tool is None:
+            raise RasterizeError("Conversion tool not found. Please install poppler-utils.")
+
+        return await self._convert(self._argv(tool, pdf_file, page, dpi), page, "PNG", usage)
+
+    async def render_svg(self, pdf_file: Path, page: int = 1, usage: Optional[Dict[str, float]] = None) -> bytes:
+        """Vectorize one page (1-based) of `pdf_file` with pdftocairo and return the SVG bytes."""
+        await self.toolchain.ensure_probed()
+        tool = self.toolchain.get("pdftocairo")
+        if not tool.supports("svg"):
+            raise RasterizeError("SVG conversion needs pdftocairo. Please install poppler-utils.")
+        argv = [tool.path, "-svg", "-f", str(page), "-l", str(page), str(pdf_file), "-"]
+        return await self._convert(argv, page, "SVG", usage)
+
+    async def _convert(self, argv: List[str], page: int, label: str, usage: Optional[Dict[str, float]]) -> bytes:
+        try:
+            run = await run_sandboxed(argv, timeout=self.timeout, text=False)
+        except asyncio.TimeoutError:
+            raise RasterizeError(f"{label} conversion timed out")
+        run.add_usage(usage)
+
+        if run.limit_error:
+            raise RasterizeError(f"PDF to {label} conversion {run.limit_error}")
+        if run.returncode != 0:
+            raise RasterizeError(f"PDF to {label} conversion failed: {run.stderr.strip()}")
+        if not run.stdout:
+            raise RasterizeError(f"No {label} produced for page {page}")
+        return run.stdout
+
+    async def render_pages(self, pdf_file: Path, pages: Iterable[int], dpi: int = 150) -> Dict[int, bytes]:
+        """Render several pages concurrently, one poppler process per page."""
+        pages = sorted(set(pages))
+        images = await asyncio.gather(*(self.render_page(pdf_file, page, dpi) for page in pages))
+        return dict(zip(pages, images))
+
+    def _argv(self, tool: str, pdf_file: Path, page: int, dpi: int) -> List[str]:
+        argv = [
+            self.toolchain.path(tool),
+            "-png",
+            "-f", str(page),
+            "-l", str(page),
+            "-r", str(dpi),
+            "-singlefile",
+            str(pdf_file),
+        ]
+        if tool == "pdftocairo":
+            # pdftocairo needs an explicit "-" to write to stdout; pdftoppm does so without an output root
+            argv.append("-")
+        return argv
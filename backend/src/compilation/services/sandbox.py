@@ -0,0 +1,199 @@
+"""
+Resource-limited subprocesses for compile jobs.
+
+A runaway `\\loop` or a huge TikZ picture can take gigabytes of memory and
+minutes of CPU. Compile tools therefore run:
+- in their own session and process group, so a timeout or cancellation kills
+  the whole group (Tectonic and anything it spawned), not just the direct child
+- under RLIMIT_AS and RLIMIT_CPU, set by a `/bin/sh` wrapper with `ulimit`
+  that then execs the tool, so no Python code runs between fork and exec
+  (preexec_fn is not safe in a threaded server)
+- with stdout/stderr in anonymous temp files and reaped with wait4(), which
+  reports that process's own max RSS and CPU seconds
+
+Spawning and reaping happen on worker threads, never on the event loop.
+Platforms without the `resource` module (Windows) fall back to run_process
+without limits or usage.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from src.config import get_settings
+from .process import Output, _decode, run_process
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Threads that spawn sandboxed children and block in wait4() for them; kept apart from
+# the default executor so long compiles never starve asyncio.to_thread file I/O
+_reaper = ThreadPoolExecutor(max_workers=64, thread_name_prefix="compile-reaper")
+
+SHELL = "/bin/sh"
+# Sets the limits given as $1 (KB of address space) and $2 (CPU seconds), then becomes the tool.
+# ulimit only fails to raise a limit, and then the lower one the worker already has stays in force
+LIMIT_WRAPPER = (
+    'if [ "$1" != 0 ]; then ulimit -v "$1" 2>/dev/null; fi; '
+    'if [ "$2" != 0 ]; then ulimit -S -t "$2" 2>/dev/null; ulimit -H -t $(($2 + 1)) 2>/dev/null; fi; '
+    'shift 2; exec "$@"'
+)
+
+
+@dataclass
+class ResourceLimits:
+    """Per-process limits; 0 means unlimited."""
+    memory_mb: int = 0
+    cpu_seconds: int = 0
+
+    @classmethod
+    def from_settings(cls) -> "ResourceLimits":
+        return cls(memory_mb=settings.COMPILE_MEMORY_LIMIT_MB, cpu_seconds=settings.COMPILE_CPU_LIMIT_SECONDS)
+
+    def wrap(self, argv: List[str]) -> List[str]:
+        """`argv` behind the shell wrapper that applies these limits.
+
+        The CPU limit sends SIGXCPU, and SIGKILL one second later.
+        """
+        if self.memory_mb <= 0 and self.cpu_seconds <= 0:
+            return argv
+        return [SHELL, "-c", LIMIT_WRAPPER, "sandbox", str(max(self.memory_mb, 0) * 1024), str(max(self.cpu_seconds, 0)), *argv]
+
+
+@dataclass
+class SandboxResult:
+    returncode: int
+    stdout: Output
+    stderr: str
+    max_rss_mb: float = 0.0
+    cpu_seconds: float = 0.0
+    limit_error: Optional[str] = None  # set when the run failed on a resource limit
+
+    def add_usage(self, usage: Optional[Dict[str, float]]) -> None:
+        """Accumulate this run into a job's usage dict (CPU seconds add up, max RSS is the peak)."""
+        if usage is None:
+            return
+        usage["cpu_seconds"] = usage.get("cpu_seconds", 0.0) + self.cpu_seconds
+        usage["max_rss_mb"] = max(usage.get("max_rss_mb", 0.0), self.max_rss_mb)
+
+
+async def run_sandboxed(
+    argv: List[str],
+    cwd: Optional[Path] = None,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+    text: bool = True,
+    limits: Optional[ResourceLimits] = None,
+) -> SandboxResult:
+    """Run a command in its own process group under `limits` (defaults from settings).
+
+    Raises asyncio.TimeoutError on timeout. On timeout and on cancellation the
+    whole process group is killed before returning.
+    """
+    if resource is None:
+        returncode, stdout, stderr = await run_process(argv, cwd=cwd, env=env, timeout=timeout, text=text)
+        return SandboxResult(returncode, stdout, stderr)
+
+    limits = limits or ResourceLimits.from_settings()
+    loop = asyncio.get_running_loop()
+    spawned = loop.run_in_executor(_reaper, _spawn, limits.wrap(argv), cwd, env)
+    try:
+        proc, out, err = await asyncio.shield(spawned)
+    except asyncio.CancelledError:
+        # The child may be running already: wait for the spawn, then kill it
+        proc, out, err = await spawned
+        _kill_group(proc.pid)
+        await loop.run_in_executor(_reaper, _collect, proc, out, err)
+        raise
+
+    reaped = loop.run_in_executor(_reaper, _collect, proc, out, err)
+    try:
+        status, rusage, stdout, stderr = await asyncio.wait_for(asyncio.shield(reaped), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # Still running, so the group id cannot have been reused yet
+        _kill_group(proc.pid)
+        await asyncio.shield(reaped)
+        raise
+
+    result = SandboxResult(
+        returncode=os.waitstatus_to_exitcode(status),
+        stdout=_decode(stdout, text),
+        stderr=stderr.decode("utf-8", errors="replace"),
+        max_rss_mb=_rss_mb(rusage.ru_maxrss),
+        cpu_seconds=rusage.ru_utime + rusage.ru_stime,
+    )
+    result.limit_error = _limit_error(result, limits)
+    if result.limit_error:
+        logger.warning(f"Sandbox: {os.path.basename(argv[0])} {result.limit_error}")
+    return result
+
+
+def _spawn(argv: List[str], cwd: Optional[Path], env: Optional[Dict[str, str]]) -> Tuple[subprocess.Popen, IO[bytes], IO[bytes]]:
+    """Start `argv` in a new session with its output going to anonymous temp files."""
+    out, err = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    try:
+        proc = subprocess.Popen(
+            argv,
+            cwd=str(cwd) if cwd else None,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=out,
+            stderr=err,
+            start_new_session=True,
+        )
+    except BaseException:
+        out.close()
+        err.close()
+        raise
+    return proc, out, err
+
+
+def _collect(proc: subprocess.Popen, out: IO[bytes], err: IO[bytes]):
+    """Reap `proc` with wait4() and read its output: (status, rusage, stdout, stderr)."""
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        return status, rusage, out.read(), err.read()
+    finally:
+        out.close()
+        err.close()
+
+
+def _limit_error(result: SandboxResult, limits: ResourceLimits) -> Optional[str]:
+    if result.returncode == 0:
+        return None
+    if limits.cpu_seconds > 0 and (
+        result.returncode == -signal.SIGXCPU
+        or (result.returncode == -signal.SIGKILL and result.cpu_seconds >= limits.cpu_seconds)
+    ):
+        return f"exceeded the CPU limit of {limits.cpu_seconds} seconds"
+    text = result.stderr.lower()
+    if limits.memory_mb > 0 and ("memory allocation" in text or "out of memory" in text or "cannot allocate" in text):
+        return f"exceeded the memory limit of {limits.memory_mb} MB"
+    return None
+
+
+def _kill_group(pgid: int) -> None:
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _rss_mb(maxrss: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return maxrss / (1024 * 1024) if os.uname().sysname == "Darwin" else maxrss / 1024
@@ -0,0 +1,223 @@
+"""
+Admission control in front of the compile engine.
+
+At most `max_concurrent` compiles run at once. Further jobs wait in a bounded
+queue that is served fairly: PRO/TEAM jobs go to a priority lane that is always
+drained first, and inside each lane users take turns so one user's burst cannot
+starve everyone else. When the queue is full the caller gets an immediate
+429 with a Retry-After estimate instead of piling up more Tectonic processes.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlmodel import Session, select
+
+from src.config import get_settings
+from src.auth.models.credits import PlanType, UserSubscription
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Plans whose compiles are served from the priority lane
+PRIORITY_PLANS = (PlanType.PRO, PlanType.TEAM)
+
+ANONYMOUS = "anonymous"
+
+
+class CompileQueueFull(HTTPException):
+    """Raised when a compile cannot be admitted; rendered as 429 with Retry-After."""
+
+    def __init__(self, retry_after: int, reason: str = "Compile queue is full"):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={"error": reason, "retry_after": retry_after},
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.retry_after = retry_after
+
+
+def is_priority_user(session: Session, user_id: Optional[UUID]) -> bool:
+    """Return True when the user has an active PRO or TEAM subscription."""
+    if user_id is None:
+        return False
+    subscription = session.exec(
+        select(UserSubscription)
+        .where(UserSubscription.user_id == user_id)
+        .where(UserSubscription.is_active == True)
+    ).first()
+    return bool(subscription and subscription.plan_type in PRIORITY_PLANS)
+
+
+class _Lane:
+    """Per-user FIFO queues served round-robin."""
+
+    def __init__(self):
+        self.users: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return sum(len(waiters) for waiters in self.users.values())
+
+    def push(self, user: str, waiter: asyncio.Future) -> None:
+        self.users.setdefault(user, deque()).append(waiter)
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """Take the oldest waiter of the next user in turn, then move that user to the back."""
+        while self.users:
+            user, waiters = next(iter(self.users.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self.users.move_to_end(user)
+            else:
+                del self.users[user]
+            if not waiter.done():
+                return waiter
+        return None
+
+    def remove(self, user: str, waiter: asyncio.Future) -> None:
+        waiters = self.users.get(user)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self.users[user]
+
+    def queued_for(self, user: str) -> int:
+        return len(self.users.get(user, ()))
+
+
+class CompileScheduler:
+    """Bounded worker pool with per-user fair queuing and a PRO/TEAM priority lane."""
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queue_per_user: Optional[int] = None,
+    ):
+        self.max_concurrent = max(1, max_concurrent or settings.COMPILE_MAX_CONCURRENCY)
+        self.max_queue = max_queue if max_queue is not None else settings.COMPILE_QUEUE_SIZE
+        self.max_queue_per_user = max_queue_per_user if max_queue_per_user is not None else settings.COMPILE_QUEUE_PER_USER
+        self.running = 0
+        self.rejected = 0
+        self.accepting = True
+        self._priority = _Lane()
+        self._standard = _Lane()
+        self._avg_seconds = 5.0  # moving average of slot hold time, seeds Retry-After
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def queued(self) -> int:
+        return len(self._priority) + len(self._standard)
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a slot frees up for a newly queued job."""
+        backlog = self.queued + 1
+        return max(1, math.ceil(backlog * self._avg_seconds / self.max_concurrent))
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str] = None, priority: bool = False):
+        """Hold one compile slot for the duration of the block.
+
+        Raises CompileQueueFull when the job cannot be admitted.
+        """
+        user = str(user_id) if user_id else ANONYMOUS
+        await self._acquire(user, priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+            self._release()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Stop admitting jobs and wait for queued and running compiles to finish."""
+        self.accepting = False
+        logger.info(f"CompileScheduler: draining {self.running} running and {self.queued} queued compiles")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"CompileScheduler: drain timed out after {timeout}s, rejecting {self.queued} queued compiles")
+            for lane in (self._priority, self._standard):
+                while (waiter := lane.pop()) is not None:
+                    waiter.set_exception(CompileQueueFull(self.retry_after(), "Server is shutting down"))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "queued_priority": len(self._priority),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+    def check_admission(self, user_id: Optional[str] = None, priority: bool = False) -> None:
+        """Raise CompileQueueFull now if a job for this user would be rejected.
+
+        Lets callers that run the compile later (the job API) fail fast at submit time.
+        """
+        self._admit(str(user_id) if user_id else ANONYMOUS, priority)
+
+    def _admit(self, user: str, priority: bool) -> bool:
+        """Return True when a slot is free right away, False when the job must queue."""
+        if not self.accepting:
+            self.rejected += 1
+            raise CompileQueueFull(self.retry_after(), "Server is shutting down")
+        if self.running < self.max_concurrent and self.queued == 0:
+            return True
+
+        lane = self._priority if priority else self._standard
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise CompileQueueFull(self.retry_after())
+        if lane.queued_for(user) >= self.max_queue_per_user:
+            self.rejected += 1
+            raise CompileQueueFull(self.retry_after(), "Too many queued compiles for this user")
+        return False
+
+    async def _acquire(self, user: str, priority: bool) -> None:
+        if self._admit(user, priority):
+            self._start()
+            return
+
+        lane = self._priority if priority else self._standard
+        waiter = asyncio.get_running_loop().create_future()
+        lane.push(user, waiter)
+        self._idle.clear()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # The slot was handed over just as we were cancelled: pass it on
+                self._release()
+            else:
+                lane.remove(user, waiter)
+                self._update_idle()
+            raise
+
+    def _start(self) -> None:
+        self.running += 1
+        self._idle.clear()
+
+    def _release(self) -> None:
+        self.running -= 1
+        for lane in (self._priority, self._standard):
+            waiter = lane.pop()
+            if waiter is not None:
+                self._start()
+                waiter.set_result(None)
+                return
+        self._update_idle()
+
+    def _update_idle(self) -> None:
+        if self.running == 0 and self.queued == 0:
+            self._idle.set()
@@ -0,0 +1,47 @@
+"""
+Tight-bounding-box ("standalone") document layout for previews.
+
+Diagram and table previews are otherwise full letter pages with 0.5in margins,
+so a small TikZ picture becomes an 8 megapixel PNG of mostly white space. The
+standalone class crops the page to the content plus a small border. Using
+`varwidth`, it still accepts paragraphs, `center` and `table[H]`
+environments. Options of the original class (e.g. `12pt`) are passed on, so
+the cropped preview is set like the page.
+"""
+
+import re
+from typing import Optional
+
+# Border around the content and the widest content the varwidth box accepts
+STANDALONE_LAYOUT = "border=8pt, varwidth=60cm"
+
+DOCUMENTCLASS = re.compile(r"\\documentclass(\[[^\]]*\])?\{article\}")
+GEOMETRY = re.compile(r"^[ \t]*\\(usepackage(\[[^\]]*\])?\{geometry\}|geometry\{[^}]*\})[ \t]*\n?", re.MULTILINE)
+PAGE_COMMANDS = re.compile(r"^[ \t]*\\(maketitle|tableofcontents|newpage|clearpage)[ \t]*\n?", re.MULTILINE)
+
+# Environments that need the main vertical list and cannot live in a standalone box:
+# page-breaking tables and real floats (float's non-floating [H] placement is fine)
+UNSUPPORTED = re.compile(r"\\begin\{(longtable|multicols\*?)\}|\\begin\{(figure|table)\*?\}(?!\[H\])")
+
+
+def standalone_class(options: str = "", layout: str = STANDALONE_LAYOUT) -> str:
+    """The standalone \\documentclass line; `options` of the original class follow the layout."""
+    return f"\\documentclass[{', '.join(part for part in (layout, options) if part)}]{{standalone}}"
+
+
+def class_options(match: Optional[re.Match]) -> str:
+    """Options of a DOCUMENTCLASS match, without brackets ("" when it has none)."""
+    return match.group(1)[1:-1].strip() if match and match.group(1) else ""
+
+
+def to_standalone(latex: str) -> Optional[str]:
+    """Convert a complete article document into a tight-box standalone document.
+
+    Returns None when the document cannot be cropped this way (another document
+    class, or page-level environments such as longtable); callers then keep the
+    regular page layout.
+    """
+    if not DOCUMENTCLASS.search(latex) or UNSUPPORTED.search(latex):
+        return None
+    latex = DOCUMENTCLASS.sub(lambda match: standalone_class(class_options(match)), latex, count=1)
+    return PAGE_COMMANDS.sub("", GEOMETRY.sub("", latex))
@@ -0,0 +1,151 @@
+"""
+TikZ picture externalization.
+
+Project documents carry many tikzpicture environments (diagrams from
+DiagramLatexGenerator, flowcharts from LatexFlowchartGenerator), and every
+compile typesets all of them again even when only one changed.
+
+Before a document with at least COMPILE_TIKZ_EXTERNALIZE_MIN pictures is
+compiled, each self-contained top-level picture is compiled on its own: the
+document's preamble under the standalone class plus the picture. Those
+compiles go through the compile engine, so their PDFs are cached under a key
+covering both preamble and picture, share the preamble's format file and join
+identical pictures already compiling. The document itself is then compiled
+with \\includegraphics of the cached PDFs, so only changed pictures are
+recompiled.
+
+Pictures whose rendering depends on their surroundings stay inline:
+overlays and `remember picture`, custom baselines, references and counters,
+macro parameters, and any picture after a definition or font/colour switch in
+the document body. A picture that fails to compile on its own also stays
+inline. Replacements keep the line count, so Tectonic's error lines still
+point into the user's source.
+"""
+
+import hashlib
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.config import get_settings
+from .formats import split_preamble
+from .standalone import DOCUMENTCLASS, GEOMETRY, class_options, standalone_class
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PICTURE_BOUNDARY = re.compile(r"\\(begin|end)\{tikzpicture\}")
+# Inside a picture: output that depends on where the picture sits in the document
+CONTEXTUAL = re.compile(
+    r"remember picture|overlay|baseline|#|\\(?:ref|pageref|eqref|cref|Cref|autoref|cite\w*|label|arabic|roman|alph|"
+    r"the(?:page|part|chapter|section|subsection|figure|table|equation|enumi|footnote))\b",
+)
+# In the body: definitions and switches that change how later pictures render
+BODY_CONTEXT = re.compile(
+    r"\\(?:(?:re)?newcommand|providecommand|def|edef|gdef|let|(?:re)?newenvironment|tikzset|tikzstyle|pgfkeys|"
+    r"usetikzlibrary|definecolor|colorlet|color|setlength|addtolength|newlength|pgfmathsetmacro|"
+    r"tiny|scriptsize|footnotesize|small|normalsize|large|Large|LARGE|huge|Huge|"
+    r"(?:rm|sf|tt)family|(?:bf|md)series|(?:it|sl|sc|up)shape|selectfont)\b"
+)
+COMMENT = re.compile(r"(?<!\\)%")
+
+
+@dataclass
+class TikzPicture:
+    """One externalizable picture: its span in the document and the standalone document rendering it."""
+    start: int
+    end: int
+    source: str
+    document: str
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(self.document.encode("utf-8")).hexdigest()
+
+    @property
+    def filename(self) -> str:
+        return f"tikz-{self.key[:16]}.pdf"
+
+
+class TikzExternalizer:
+    """Finds the pictures of a document worth compiling separately and assembles the result."""
+
+    def __init__(self, min_pictures: Optional[int] = None):
+        self.min_pictures = min_pictures if min_pictures is not None else settings.COMPILE_TIKZ_EXTERNALIZE_MIN
+        # Leave room in the user's queue for their other compiles
+        self.concurrency = max(1, settings.COMPILE_QUEUE_PER_USER // 2)
+        self.documents = 0
+        self.compiled = 0
+        self.reused = 0
+        self.inlined = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_pictures > 0
+
+    def plan(self, latex: str) -> List[TikzPicture]:
+        """Pictures of `latex` to compile separately; empty when externalizing is not worth it."""
+        if not self.enabled or latex.count("\\begin{tikzpicture}") < self.min_pictures:
+            return []
+        parts = split_preamble(latex)
+        if parts is None:
+            return []
+        preamble, _ = parts
+        match = DOCUMENTCLASS.search(preamble)
+        if not match:
+            return []
+        picture_preamble = GEOMETRY.sub("", DOCUMENTCLASS.sub(
+            lambda _: standalone_class(class_options(match), layout="border=0pt"), preamble, count=1
+        ))
+
+        pictures = []
+        previous_end = len(preamble)
+        for start, end in _top_level_pictures(latex, len(preamble)):
+            # Switches inside earlier pictures stay inside them; those between pictures do not
+            if BODY_CONTEXT.search(latex, previous_end, start):
+                break
+            previous_end = end
+            source = latex[start:end]
+            if CONTEXTUAL.search(source) or COMMENT.search(latex, latex.rfind("\n", 0, start) + 1, start):
+                continue
+            document = f"{picture_preamble}\\begin{{document}}\n{source}\n\\end{{document}}\n"
+            pictures.append(TikzPicture(start, end, source, document))
+        if len(pictures) < self.min_pictures:
+            return []
+        return pictures
+
+    def assemble(self, latex: str, rendered: List[TikzPicture]) -> str:
+        """Replace each rendered picture with an \\includegraphics of its PDF."""
+        for picture in sorted(rendered, key=lambda picture: picture.start, reverse=True):
+            # draft=false: previews turn graphics into draft boxes, but these are the document's own content
+            include = f"\\includegraphics[draft=false]{{{picture.filename}}}" + "%\n" * picture.source.count("\n")
+            latex = latex[:picture.start] + include + latex[picture.end:]
+        if "{graphicx}" not in latex[:latex.find("\\begin{document}")]:
+            # On the \documentclass line, so the document keeps its line numbers
+            end = DOCUMENTCLASS.search(latex).end()
+            latex = latex[:end] + "\\usepackage{graphicx}" + latex[end:]
+        return latex
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "documents": self.documents,
+            "compiled": self.compiled,
+            "reused": self.reused,
+            "inlined": self.inlined,
+        }
+
+
+def _top_level_pictures(latex: str, offset: int):
+    """Yield (start, end) of tikzpicture environments that are not nested in another one."""
+    depth = 0
+    start = 0
+    for match in PICTURE_BOUNDARY.finditer(latex, offset):
+        if match.group(1) == "begin":
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                yield start, match.end()
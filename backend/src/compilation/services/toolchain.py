@@ -0,0 +1,144 @@
+"""
+Registry of the external tools used by the compile path.
+
+Tectonic, pdftoppm and pdftocairo are located and probed once (from the
+FastAPI lifespan), and every compiler reads the resolved paths, versions and
+capabilities from here instead of spawning `--version` checks per request.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from src.config import get_settings
+from .process import run_process
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Command-line flags whose presence in `--help` output marks a capability
+CAPABILITY_FLAGS = {
+    "tectonic": {"only_cached": "--only-cached", "untrusted": "--untrusted", "outfmt": "--outfmt", "format": "--format", "reruns": "--reruns"},
+    "pdftoppm": {"singlefile": "-singlefile", "png": "-png"},
+    "pdftocairo": {"singlefile": "-singlefile", "png": "-png", "svg": "-svg"},
+}
+
+
+@dataclass
+class Tool:
+    """A resolved external executable."""
+    name: str
+    path: Optional[str] = None
+    version: Optional[str] = None
+    capabilities: Set[str] = field(default_factory=set)
+
+    @property
+    def available(self) -> bool:
+        return self.path is not None
+
+    def supports(self, capability: str) -> bool:
+        return capability in self.capabilities
+
+    def describe(self) -> dict:
+        return {
+            "path": self.path,
+            "version": self.version,
+            "capabilities": sorted(self.capabilities),
+        }
+
+
+class ToolchainRegistry:
+    """Resolves tectonic, pdftoppm and pdftocairo once and shares the result."""
+
+    TOOLS = ("tectonic", "pdftoppm", "pdftocairo")
+
+    def __init__(self):
+        self.tools: Dict[str, Tool] = {name: Tool(name) for name in self.TOOLS}
+        # Extra flags for every Tectonic run; `--only-cached` once the bundle cache is warm
+        self.tectonic_flags: List[str] = []
+        self._probed = False
+        self._lock = asyncio.Lock()
+
+    async def probe(self) -> Dict[str, Tool]:
+        """Locate every tool and record its version and capabilities."""
+        async with self._lock:
+            async def resolve(name: str) -> Tool:
+                for candidate in self._candidates(name):
+                    tool = await self._probe_tool(name, candidate)
+                    if tool:
+                        return tool
+                return Tool(name)
+
+            tools = await asyncio.gather(*(resolve(name) for name in self.TOOLS))
+            self.tools = {tool.name: tool for tool in tools}
+            self._probed = True
+
+        for tool in self.tools.values():
+            if tool.available:
+                logger.info(f"Toolchain: {tool.name} {tool.version or ''} at {tool.path} capabilities={sorted(tool.capabilities)}")
+            else:
+                logger.warning(f"Toolchain: {tool.name} not found")
+        return self.tools
+
+    async def ensure_probed(self) -> None:
+        """Probe lazily when the lifespan hook did not run (scripts, workers)."""
+        if not self._probed:
+            await self.probe()
+
+    def get(self, name: str) -> Tool:
+        return self.tools[name]
+
+    def path(self, name: str) -> Optional[str]:
+        return self.tools[name].path
+
+    def describe(self) -> dict:
+        return {name: tool.describe() for name, tool in self.tools.items()}
+
+    def _candidates(self, name: str) -> List[str]:
+        if name == "tectonic":
+            candidates = list(settings.get_tectonic_paths())
+        else:
+            candidates = []
+            for directory in settings.get_poppler_paths():
+                candidates.append(os.path.join(directory, f"{name}.exe"))
+                candidates.append(os.path.join(directory, name))
+            candidates.append(name)
+
+        resolved = []
+        for candidate in candidates:
+            path = shutil.which(candidate) or (candidate if os.path.isfile(candidate) else None)
+            if path and path not in resolved:
+                resolved.append(path)
+        return resolved
+
+    async def _probe_tool(self, name: str, path: str) -> Optional[Tool]:
+        version_flag = "--version" if name == "tectonic" else "-v"
+        help_flag = "--help" if name == "tectonic" else "-h"
+        try:
+            returncode, stdout, stderr = await run_process([path, version_flag], timeout=10)
+            if name == "tectonic" and returncode != 0:
+                return None
+            version_output = (stdout or stderr).strip()
+            if not version_output:
+                return None
+            _, help_stdout, help_stderr = await run_process([path, help_flag], timeout=10)
+        except Exception as e:
+            logger.debug(f"Toolchain: {name} not usable at {path}: {e}")
+            return None
+
+        help_text = help_stdout + help_stderr
+        capabilities = {
+            capability
+            for capability, flag in CAPABILITY_FLAGS.get(name, {}).items()
+            if flag in help_text
+        }
+        return Tool(
+            name=name,
+            path=str(Path(path).resolve()),
+            version=version_output.splitlines()[0],
+            capabilities=capabilities,
+        )
@@ -0,0 +1,102 @@
+"""
+Tectonic bundle warm-up, run once from the FastAPI lifespan.
+
+Tectonic fetches bundle files lazily, so the first compiles on a fresh worker
+or container are slow and fail outright without network access. At startup we
+compile one representative document per generator with the bundle cache in
+`TECTONIC_CACHE_DIR` (shared between workers). Once every document compiles,
+later runs use `--only-cached` and never touch the network.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from jinja2 import Template
+
+from src.config import get_settings
+from src.compilation.services import CompileJob, compile_engine, toolchain
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+IMAGE_TO_LATEX_SAMPLE = r"""\documentclass{article}
+\usepackage{amsmath}
+\usepackage{amssymb}
+\usepackage{graphicx}
+\begin{document}
+\section*{Warm-up}
+\[ \int_0^1 x^2 \, dx = \frac{1}{3}, \qquad \sum_{n=1}^{\infty} \frac{1}{n^2} = \frac{\pi^2}{6} \]
+\end{document}
+"""
+
+
+def representative_documents() -> Dict[str, str]:
+    """One document per generator, built with the same templates the compilers use."""
+    from src.Diagram.services.compiler import diagram_compiler
+    from src.Table.services.compiler import table_compiler
+    from src.HandWrittenFlowChartToLatex.services.latex_flowchart_generator import ENHANCED_LATEX_TEMPLATE
+
+    return {
+        "diagram": diagram_compiler._create_complete_document(
+            "\\begin{tikzpicture}\n"
+            "\\node[draw, fill=lightblue, rounded corners] (a) {A};\n"
+            "\\node[draw, fill=lightgreen, right=of a] (b) {B};\n"
+            "\\draw[->] (a) -- (b);\n"
+            "\\end{tikzpicture}"
+        ),
+        "table": table_compiler._create_complete_document(
+            "\\begin{tabular}{lr}\n\\toprule\nItem & Value \\\\\n\\midrule\nA & 1 \\\\\n\\bottomrule\n\\end{tabular}"
+        ),
+        "flowchart": Template(ENHANCED_LATEX_TEMPLATE).render(
+            nodes_block="\\node (start) [startstop] {Start};\n\\node (step) [process, below of=start] {Step};",
+            edges_block="\\draw [arrow] (start) -- (step);",
+            title=None,
+        ),
+        "imagetolatex": IMAGE_TO_LATEX_SAMPLE,
+    }
+
+
+async def warm_up_bundle(timeout: Optional[float] = None) -> bool:
+    """Compile the representative documents; switch Tectonic to --only-cached when all succeed."""
+    timeout = settings.TECTONIC_WARMUP_TIMEOUT if timeout is None else timeout
+    if timeout <= 0:
+        logger.info("Bundle warm-up disabled")
+        return False
+
+    await toolchain.ensure_probed()
+    if not toolchain.get("tectonic").available:
+        logger.warning("Bundle warm-up skipped: tectonic not found")
+        return False
+
+    started = time.perf_counter()
+    documents = representative_documents()
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*(
+                compile_engine.compile(CompileJob(
+                    latex=latex,
+                    tex_name=f"warmup_{name}",
+                    use_cache=False,
+                    label=f"Warmup[{name}]",
+                ))
+                for name, latex in documents.items()
+            )),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Bundle warm-up timed out after {timeout}s, Tectonic keeps fetching on demand")
+        return False
+
+    failed = [name for name, result in zip(documents, results) if not result.success]
+    elapsed = time.perf_counter() - started
+    if failed:
+        logger.warning(f"Bundle warm-up failed for {failed} after {elapsed:.1f}s, Tectonic keeps fetching on demand")
+        return False
+
+    logger.info(f"Bundle warm-up compiled {len(documents)} documents in {elapsed:.1f}s")
+    if settings.TECTONIC_ONLY_CACHED and toolchain.get("tectonic").supports("only_cached"):
+        toolchain.tectonic_flags = ["--only-cached"]
+        logger.info("Tectonic now runs with --only-cached")
+    return True
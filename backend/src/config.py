@@ -56,6 +56,42 @@ class Settings:
     TECTONIC_PATH: str = os.getenv("TECTONIC_PATH", "../tectonic")
     POPPLER_PATH: str = os.getenv("POPPLER_PATH", "../poppler-23.01.0")
     LATEX_TIMEOUT: int = int(os.getenv("LATEX_TIMEOUT", "60"))
+    TECTONIC_CACHE_DIR: Optional[str] = os.getenv("TECTONIC_CACHE_DIR")  # Bundle cache shared by all workers
+    TECTONIC_WARMUP_TIMEOUT: int = int(os.getenv("TECTONIC_WARMUP_TIMEOUT", "300"))  # 0 skips the startup warm-up
+    TECTONIC_ONLY_CACHED: bool = os.getenv("TECTONIC_ONLY_CACHED", "True").lower() == "true"  # --only-cached after warm-up
+    COMPILE_WORK_DIR: Optional[str] = os.getenv("COMPILE_WORK_DIR")  # Per-job compile directories live here
+    COMPILE_CACHE_DIR: Optional[str] = os.getenv("COMPILE_CACHE_DIR")
+    COMPILE_CACHE_MAX_MB: int = int(os.getenv("COMPILE_CACHE_MAX_MB", "512"))  # 0 disables the compile cache
+    COMPILE_ASSET_CACHE_DIR: Optional[str] = os.getenv("COMPILE_ASSET_CACHE_DIR")  # Linked project files from storage
+    COMPILE_ASSET_CACHE_MAX_MB: int = int(os.getenv("COMPILE_ASSET_CACHE_MAX_MB", "1024"))  # 0 disables the asset cache
+    COMPILE_ASSET_FETCH_CONCURRENCY: int = int(os.getenv("COMPILE_ASSET_FETCH_CONCURRENCY", "8"))  # Parallel downloads per compile
+    COMPILE_ASSET_FETCH_BUDGET_SECONDS: float = float(os.getenv("COMPILE_ASSET_FETCH_BUDGET_SECONDS", "15"))  # Then compile without the rest
+    COMPILE_IMAGE_CACHE_DIR: Optional[str] = os.getenv("COMPILE_IMAGE_CACHE_DIR")  # Linked images downscaled for print
+    COMPILE_IMAGE_CACHE_MAX_MB: int = int(os.getenv("COMPILE_IMAGE_CACHE_MAX_MB", "512"))  # 0 disables image normalization
+    COMPILE_IMAGE_DPI: int = int(os.getenv("COMPILE_IMAGE_DPI", "300"))  # Resolution linked images are downscaled to
+    COMPILE_IMAGE_JPEG_QUALITY: int = int(os.getenv("COMPILE_IMAGE_JPEG_QUALITY", "85"))
+    COMPILE_TIKZ_EXTERNALIZE_MIN: int = int(os.getenv("COMPILE_TIKZ_EXTERNALIZE_MIN", "2"))  # Pictures before a document's TikZ is externalized, 0 = off
+    COMPILE_PROJECT_CONCURRENCY: int = int(os.getenv("COMPILE_PROJECT_CONCURRENCY", "4"))  # Sub-project fragments compiled at once per project, <= COMPILE_QUEUE_PER_USER
+    COMPILE_PAGE_CACHE_DIR: Optional[str] = os.getenv("COMPILE_PAGE_CACHE_DIR")  # Lazily rendered PDF pages
+    COMPILE_PAGE_CACHE_MAX_MB: int = int(os.getenv("COMPILE_PAGE_CACHE_MAX_MB", "512"))  # 0 disables the page cache
+    COMPILE_FORMAT_CACHE_DIR: Optional[str] = os.getenv("COMPILE_FORMAT_CACHE_DIR")  # Dumped preamble formats
+    COMPILE_FORMAT_CACHE_MAX_MB: int = int(os.getenv("COMPILE_FORMAT_CACHE_MAX_MB", "1024"))  # 0 disables preamble formats
+    COMPILE_MAX_CONCURRENCY: int = int(os.getenv("COMPILE_MAX_CONCURRENCY") or os.cpu_count() or 2)
+    COMPILE_QUEUE_SIZE: int = int(os.getenv("COMPILE_QUEUE_SIZE", "32"))  # Waiting compiles before 429
+    COMPILE_QUEUE_PER_USER: int = int(os.getenv("COMPILE_QUEUE_PER_USER", "4"))
+    COMPILE_JOB_TTL: int = int(os.getenv("COMPILE_JOB_TTL", "600"))  # Seconds finished async compile jobs are kept
+    COMPILE_DRAIN_TIMEOUT: int = int(os.getenv("COMPILE_DRAIN_TIMEOUT", "30"))  # Seconds to finish compiles on shutdown
+    COMPILE_ARTIFACT_DIR: Optional[str] = os.getenv("COMPILE_ARTIFACT_DIR")  # Retain compiled PDFs here for debugging; unset = off
+    COMPILE_MEMORY_LIMIT_MB: int = int(os.getenv("COMPILE_MEMORY_LIMIT_MB", "2048"))  # RLIMIT_AS per compile process, 0 = unlimited
+    COMPILE_CPU_LIMIT_SECONDS: int = int(os.getenv("COMPILE_CPU_LIMIT_SECONDS", "60"))  # RLIMIT_CPU per compile process, 0 = unlimited
+    COMPILE_PREVIEW_DPI: int = int(os.getenv("COMPILE_PREVIEW_DPI", "96"))  # PNG DPI for output_quality="preview"
+    COMPILE_PREVIEW_DEBOUNCE_MS: int = int(os.getenv("COMPILE_PREVIEW_DEBOUNCE_MS", "300"))  # Live preview quiet period
+    COMPILE_FIX_MAX_ROUNDS: int = int(os.getenv("COMPILE_FIX_MAX_ROUNDS", "3"))  # Local fix-and-recompile rounds before the LLM
+    COMPILE_FIX_CACHE_DIR: Optional[str] = os.getenv("COMPILE_FIX_CACHE_DIR")  # Learned fixes, one file per error signature
+    COMPILE_FIX_CACHE_MAX_ENTRIES: int = int(os.getenv("COMPILE_FIX_CACHE_MAX_ENTRIES", "5000"))  # 0 disables learned fixes
+    COMPILE_FIX_MIN_CONFIDENCE: float = float(os.getenv("COMPILE_FIX_MIN_CONFIDENCE", "0.5"))  # Learned fixes below this are dropped
+    COMPILE_FIX_SHARE_MIN_USERS: int = int(os.getenv("COMPILE_FIX_SHARE_MIN_USERS", "3"))  # Distinct users who learned a fix before all get it
+    COMPILE_LINT: bool = os.getenv("COMPILE_LINT", "True").lower() == "true"  # Reject broken documents before Tectonic
 
     # File Uploads
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", 10485760))  # Default to 10 MB
@@ -104,7 +140,7 @@ class Settings:
     def get_poppler_paths(self) -> list[str]:
         """Return candidate directories that contain poppler binaries (pdftoppm, etc.).
 
-        The `pdf2image` library expects a directory containing `pdftoppm`. Use
+        The toolchain registry looks for `pdftoppm` and `pdftocairo` here. Use
         configured `POPPLER_PATH` if set, plus some common locations.
         """
         candidates = []
@@ -2,9 +2,11 @@
 Supabase Storage Service for handling file uploads/downloads
 """
 
+import asyncio
 import os
 import uuid
-from typing import Optional, BinaryIO
+from pathlib import Path
+from typing import Optional, BinaryIO, Tuple
 from datetime import datetime, timezone
 import httpx
 from src.config import settings
@@ -14,6 +16,7 @@ class SupabaseStorageService:
     """Service for interacting with Supabase Storage"""
     
     BUCKET_NAME = "project-files"
+    WRITE_BUFFER_BYTES = 1024 * 1024  # streamed downloads hit the disk in chunks this large
     
     def __init__(self):
         self.supabase_url = settings.SUPABASE_URL
@@ -203,6 +206,42 @@ class SupabaseStorageService:
                 return response.content
             return None
 
+    async def download_to_file_if_changed(
+        self, file_path: str, target: Path, etag: Optional[str] = None
+    ) -> Tuple[bool, Optional[str], bool]:
+        """Stream a file to `target` unless it still matches `etag`.
+
+        Returns (downloaded, etag, not_modified). The body is written in
+        buffered chunks from a worker thread, so large images never sit in
+        memory and disk writes never block the event loop.
+        """
+        headers = self._get_headers()
+        if etag:
+            headers["If-None-Match"] = etag
+        async with httpx.AsyncClient() as client:
+            async with client.stream(
+                "GET",
+                f"{self.storage_url}/object/{self.BUCKET_NAME}/{file_path}",
+                headers=headers
+            ) as response:
+                if response.status_code == 304:
+                    return False, etag, True
+                if response.status_code != 200:
+                    return False, None, False
+                f = await asyncio.to_thread(open, target, "wb")
+                try:
+                    buffer = bytearray()
+                    async for chunk in response.aiter_bytes(64 * 1024):
+                        buffer += chunk
+                        if len(buffer) >= self.WRITE_BUFFER_BYTES:
+                            await asyncio.to_thread(f.write, buffer)
+                            buffer.clear()
+                    if buffer:
+                        await asyncio.to_thread(f.write, buffer)
+                finally:
+                    await asyncio.to_thread(f.close)
+                return True, response.headers.get("etag"), False
+
 
 # Singleton instance
 storage_service = SupabaseStorageService()
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from src.compilation.services.assembly import (
+    MISSING,
+    Fragment,
+    ProjectAssembler,
+    fragment_document,
+    place_fragments,
+    project_document,
+)
+from src.compilation.services.engine import CompileResult, LatexCompileEngine
+from src.compilation.services.scheduler import CompileQueueFull
+
+
+class StubEngine:
+    """Records compile jobs; fragments whose source contains BUSY are not admitted, FAIL ones fail."""
+
+    cache_key = LatexCompileEngine.cache_key
+
+    def __init__(self):
+        self.jobs = []
+        self.cancelled = 0
+
+    async def compile(self, job):
+        self.jobs.append(job)
+        if "BUSY" in job.latex:
+            await asyncio.sleep(0.01)
+            raise CompileQueueFull(retry_after=1)
+        try:
+            await asyncio.sleep(0.05 if job.tex_name == "fragment" else 0)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if "FAIL" in job.latex:
+            return CompileResult(False, error="! Undefined control sequence.", stage="tectonic")
+        if job.tex_name == "fragment" and job.assets:
+            # A cached fragment: the assembler must read it
+            path = self.tmp_path / self.cache_key(job)
+            path.write_bytes(b"%PDF fragment")
+            return CompileResult(True, path=path, cache_hit=True)
+        return CompileResult(True, content=b"%PDF " + job.tex_name.encode())
+
+
+def test_project_document_wraps_content_in_preamble():
+    document = project_document("Hello", "\\usepackage{amsmath}")
+    assert document.startswith("\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\nHello\n")
+    complete = "\\documentclass{book}\n\\begin{document}x\\end{document}"
+    assert project_document(complete, "\\usepackage{tikz}") == complete
+
+
+def test_fragment_document_uses_project_packages_under_standalone():
+    document = fragment_document("\\begin{tabular}{l}x\\end{tabular}", "\\documentclass[12pt]{report}\n\\usepackage{booktabs}")
+    assert "{report}" not in document
+    assert "\\usepackage{booktabs}" in document
+    assert "\\documentclass" in document and "standalone" in document
+
+
+def test_place_fragments_substitutes_markers():
+    document = "\\documentclass{article}\n\\begin{document}\nA \\subproject[width=3cm]{one} B \\subproject{ two } C \\subproject{gone}\n\\end{document}"
+    placed = place_fragments(document, {"one": "one.pdf", "two": "two.pdf"})
+    assert "\\includegraphics[draft=false, width=3cm]{one.pdf}" in placed
+    assert "\\includegraphics[draft=false]{two.pdf}" in placed
+    assert MISSING in placed
+    assert placed.startswith("\\documentclass{article}\n\\usepackage{graphicx}")
+
+
+def test_place_fragments_appends_without_markers():
+    document = "\\documentclass{article}\n\\usepackage{graphicx}\n\\begin{document}\nText\n\\end{document}"
+    placed = place_fragments(document, {"one": "one.pdf", "two": "two.pdf"})
+    assert placed.index("{one.pdf}") < placed.index("{two.pdf}") < placed.index("\\end{document}")
+    assert placed.count("\\usepackage{graphicx}") == 1
+
+
+def test_compile_assembles_placed_fragments():
+    engine = StubEngine()
+    assembler = ProjectAssembler(engine, concurrency=2)
+    fragments = [Fragment("a", "Table", "x"), Fragment("b", "Unplaced", "y"), Fragment("c", "Same", "x")]
+    result = asyncio.run(assembler.compile("\\subproject{a} and \\subproject{c}", "", fragments))
+    assert result.success
+    assert [job.tex_name for job in engine.jobs] == ["fragment", "fragment", "project"]
+    project = engine.jobs[-1]
+    # Identical fragments share one PDF
+    assert len(project.assets) == 1
+    assert project.latex.count(project.assets[0]["filename"]) == 2
+    assert "fragments" in result.timings
+
+
+def test_failed_fragment_is_reported():
+    assembler = ProjectAssembler(StubEngine())
+    result = asyncio.run(assembler.compile("", "", [Fragment("a", "Broken table", "FAIL")]))
+    assert not result.success
+    assert result.stage == "fragment"
+    assert "Broken table" in result.error
+
+
+def test_unadmitted_fragment_cancels_its_siblings():
+    engine = StubEngine()
+    assembler = ProjectAssembler(engine, concurrency=4)
+    fragments = [Fragment("a", "A", "slow one"), Fragment("b", "B", "BUSY"), Fragment("c", "C", "slow two")]
+    with pytest.raises(CompileQueueFull):
+        asyncio.run(assembler.compile("", "", fragments))
+    assert engine.cancelled == 2
+
+
+def test_fragment_assets_are_part_of_the_project_key(tmp_path):
+    engine = StubEngine()
+    engine.tmp_path = tmp_path
+    assembler = ProjectAssembler(engine)
+
+    def project_key(image: bytes) -> str:
+        fragments = [Fragment("a", "Figure", "\\includegraphics{x.png}", [{"filename": "x.png", "content": image}])]
+        assert asyncio.run(assembler.compile("\\subproject{a}", "", fragments)).success
+        project = engine.jobs[-1]
+        # Held by content: the cache entry may be evicted before the project compiles
+        assert project.assets[0]["content"] == b"%PDF fragment"
+        assert "path" not in project.assets[0]
+        return LatexCompileEngine.cache_key(engine, project)
+
+    assert project_key(b"old image") != project_key(b"new image")
+
+
+def test_same_source_with_different_assets_stays_apart(tmp_path):
+    engine = StubEngine()
+    engine.tmp_path = tmp_path
+    fragments = [
+        Fragment("a", "One", "\\includegraphics{x.png}", [{"filename": "x.png", "content": b"1"}]),
+        Fragment("b", "Two", "\\includegraphics{x.png}", [{"filename": "x.png", "content": b"2"}]),
+    ]
+    assert asyncio.run(ProjectAssembler(engine).compile("\\subproject{a} \\subproject{b}", "", fragments)).success
+    assert len(engine.jobs[-1].assets) == 2
@@ -0,0 +1,54 @@
+import asyncio
+import functools
+from datetime import datetime, timezone
+
+import httpx
+
+from src.compilation.services.assets import AssetCache
+from src.utils import supabase_storage
+from src.utils.supabase_storage import SupabaseStorageService
+
+BODY = bytes(range(256)) * 10000  # several write buffers
+
+
+class FakeStorage:
+    def __init__(self):
+        self.calls = []
+
+    async def download_to_file_if_changed(self, file_path, target, etag=None):
+        self.calls.append(etag)
+        if etag == "v1":
+            return False, etag, True
+        target.write_bytes(BODY)
+        return True, "v1", False
+
+
+def test_assets_are_downloaded_once_then_revalidated(tmp_path):
+    storage = FakeStorage()
+    cache = AssetCache(storage, cache_dir=str(tmp_path), max_bytes=10 * 1024 * 1024)
+    first, second = datetime(2026, 1, 1, tzinfo=timezone.utc), datetime(2026, 1, 2, tzinfo=timezone.utc)
+
+    asset = asyncio.run(cache.get("p/a.png", "a.png", first))
+    assert asset["path"].read_bytes() == BODY
+    assert asyncio.run(cache.get("p/a.png", "a.png", first))["path"] == asset["path"]
+    assert asyncio.run(cache.get("p/a.png", "a.png", second))["sha256"] == asset["sha256"]
+    assert storage.calls == [None, "v1"]
+    assert list((tmp_path / "incoming").iterdir()) == []
+
+
+def test_storage_streams_the_body_to_disk(tmp_path, monkeypatch):
+    def respond(request):
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=BODY, headers={"etag": '"v1"'})
+
+    monkeypatch.setattr(
+        supabase_storage.httpx, "AsyncClient",
+        functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(respond)),
+    )
+    storage = SupabaseStorageService()
+    storage.storage_url, storage.service_key = "https://storage.test/storage/v1", "key"
+    target = tmp_path / "download"
+    assert asyncio.run(storage.download_to_file_if_changed("p/a.png", target)) == (True, '"v1"', False)
+    assert target.read_bytes() == BODY
+    assert asyncio.run(storage.download_to_file_if_changed("p/a.png", target, '"v1"')) == (False, '"v1"', True)
@@ -0,0 +1,42 @@
+import os
+
+from src.compilation.services.cache import CompileCache
+
+
+def test_cosmetic_edits_share_a_key():
+    key = CompileCache.make_key("a  \r\nb\n", "pdf", 300)
+    assert key == CompileCache.make_key("a\nb", "pdf", 300)
+    assert key != CompileCache.make_key("a\nb", "png", 300)
+    assets = [{"filename": "x.png", "content": b"1"}, {"filename": "y.png", "content": b"2"}]
+    assert CompileCache.make_key("a", "pdf", 300, assets) == CompileCache.make_key("a", "pdf", 300, assets[::-1])
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = CompileCache(cache_dir=str(tmp_path), max_bytes=10)
+    cache.put("a" * 64, b"1234")
+    cache.put("b" * 64, b"1234")
+    assert cache.get("a" * 64) == b"1234"
+    cache.put("c" * 64, b"1234")
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) == b"1234"
+    assert cache.put("d" * 64, b"x" * 11) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    cache = CompileCache(cache_dir=str(tmp_path), max_bytes=100)
+    old = cache.put("a" * 64, b"old")
+    cache.put("b" * 64, b"new")
+    os.utime(old, (1, 1))
+    # Another worker with a smaller cap evicts the oldest entry first
+    other = CompileCache(cache_dir=str(tmp_path), max_bytes=4)
+    assert other.get_path("a" * 64) is None
+    assert other.get("b" * 64) == b"new"
+
+
+def test_put_file_moves_the_file(tmp_path):
+    cache = CompileCache(cache_dir=str(tmp_path / "cache"), max_bytes=100)
+    source = tmp_path / "out.pdf"
+    source.write_bytes(b"%PDF")
+    path = cache.put_file("a" * 64, source)
+    assert path.read_bytes() == b"%PDF" and not source.exists()
@@ -0,0 +1,50 @@
+import asyncio
+
+from src.compilation.services.cache import CompileCache
+from src.compilation.services.engine import CompileJob, LatexCompileEngine
+
+DOCUMENT = "\\documentclass{article}\n\\begin{document}\n{body}\n\\end{document}\n"
+
+
+def document(body: str) -> str:
+    return DOCUMENT.replace("{body}", body)
+
+
+def make_engine(toolchain, tmp_path):
+    cache = CompileCache(cache_dir=str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+    return LatexCompileEngine(toolchain, temp_dir=str(tmp_path), cache=cache)
+
+
+def test_second_compile_is_a_cache_hit(toolchain, tectonic_calls, tmp_path):
+    engine = make_engine(toolchain, tmp_path)
+    first = asyncio.run(engine.compile(CompileJob(latex=document("hi"))))
+    second = asyncio.run(engine.compile(CompileJob(latex=document("hi") + "\n\n")))
+    assert first.success and not first.cache_hit
+    assert second.cache_hit and second.path == first.path
+    assert len(tectonic_calls()) == 1
+
+
+def test_identical_compiles_share_one_run(toolchain, tectonic_calls, tmp_path):
+    async def scenario():
+        engine = make_engine(toolchain, tmp_path)
+        return await asyncio.gather(*(engine.compile(CompileJob(latex=document("same"))) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert all(result.success for result in results)
+    assert sum(result.shared for result in results) == 2
+    assert len(tectonic_calls()) == 1
+
+
+def test_broken_documents_are_rejected_before_tectonic(toolchain, tectonic_calls, tmp_path):
+    engine = make_engine(toolchain, tmp_path)
+    result = asyncio.run(engine.compile(CompileJob(latex=document("\\begin{itemize}"))))
+    assert not result.success and result.stage == "lint"
+    assert result.lint_errors
+    assert tectonic_calls() == []
+
+
+def test_tectonic_errors_are_reported(toolchain, tmp_path):
+    engine = make_engine(toolchain, tmp_path)
+    result = asyncio.run(engine.compile(CompileJob(latex=document("FAIL"))))
+    assert not result.success
+    assert "Undefined control sequence" in result.error
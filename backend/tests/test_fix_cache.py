@@ -0,0 +1,66 @@
+import asyncio
+
+from src.compilation.services.engine import LatexCompileEngine
+from src.compilation.services.fix_cache import FixCache, apply_transform, error_signature, learn_transform
+from src.compilation.services.fixer import LogError
+
+BROKEN = "\\documentclass{article}\n\\begin{document}\nFAIL here\n\\end{document}\n"
+FIXED = BROKEN.replace("FAIL", "PASS")
+
+
+def test_learn_transform_records_packages_and_replacements():
+    original = "\\documentclass{article}\n\\begin{document}\n$\\mathbb{R}$ \\begin{tabular}{ll} a & b & c\\end{tabular}\n"
+    fixed = original.replace("\\begin{document}", "\\usepackage{amssymb}\n\\begin{document}").replace("{ll}", "{lll}")
+    transform = learn_transform(original, fixed)
+    assert transform["add_packages"] == ["amssymb"]
+    assert transform["remove_packages"] == []
+    assert len(transform["replacements"]) == 1
+    assert apply_transform(original, transform) == fixed
+
+
+def test_learn_transform_rejects_rewrites_and_no_ops():
+    assert learn_transform(BROKEN, BROKEN) is None
+    assert learn_transform(BROKEN, BROKEN.replace("FAIL here", "x" * 500)) is None
+
+
+def test_apply_transform_needs_the_text_near_the_error():
+    transform = {"add_packages": [], "remove_packages": [], "replacements": [["FAIL", "PASS"]]}
+    far = "\n" * 20 + "FAIL\n"
+    assert apply_transform(far, transform, LogError("Undefined control sequence.", 21, resolved=True)) == "\n" * 20 + "PASS\n"
+    assert apply_transform(far, transform, LogError("Undefined control sequence.", 2, resolved=True)) is None
+    assert apply_transform("nothing to change", transform) is None
+
+
+def test_signature_ignores_words_and_numbers():
+    one = LogError("Undefined control sequence.", 3, "$x = \\foo{12}")
+    two = LogError("Undefined control sequence.", 9, "$y = \\foo{7}")
+    other = LogError("Undefined control sequence.", 3, "$x = \\bar{12}")
+    assert error_signature(one) == error_signature(two) != error_signature(other)
+
+
+def make_cache(toolchain, tmp_path, share_min_users=2):
+    engine = LatexCompileEngine(toolchain, temp_dir=str(tmp_path))
+    cache = FixCache(engine, cache_dir=str(tmp_path / "fixes"), max_entries=100, min_confidence=0.5)
+    cache.share_min_users = share_min_users
+    return cache
+
+
+def test_learned_fix_is_replayed_for_its_user_until_shared(toolchain, tmp_path):
+    cache = make_cache(toolchain, tmp_path)
+    log = "! Undefined control sequence.\nl.1 FAIL\n"
+
+    async def run():
+        assert await cache.learn(BROKEN, FIXED, user_id="alice")
+        assert (await cache.reuse(BROKEN, log, user_id="alice")).latex == FIXED
+        assert await cache.reuse(BROKEN, log, user_id="bob") is None
+        assert await cache.learn(BROKEN, FIXED, user_id="carol")
+        assert (await cache.reuse(BROKEN, log, user_id="bob")).latex == FIXED
+
+    asyncio.run(run())
+
+
+def test_nothing_is_learned_when_the_server_cannot_reproduce_the_error(toolchain, tmp_path):
+    cache = make_cache(toolchain, tmp_path)
+    compiles = "\\documentclass{article}\n\\begin{document}\nfine\n\\end{document}\n"
+    assert not asyncio.run(cache.learn(compiles, compiles.replace("fine", "changed"), user_id="mallory"))
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,112 @@
+from src.compilation.services.fixer import LatexFixer, LogError, _source_line_index, parse_tectonic_log
+
+
+def tex_log(*errors):
+    """A --print transcript with one "! message" / "l.<line> context" pair per error."""
+    return "\n".join(f"! {message}.\n<recently read> \\foo\n\nl.{line} {context}\n" for message, line, context in errors)
+
+
+def fixer():
+    return LatexFixer(engine=None, max_rounds=1)
+
+
+def test_parse_reads_message_line_and_context():
+    errors = parse_tectonic_log(tex_log(("Undefined control sequence", 3, "$\\mathbb")))
+    assert errors == [LogError("Undefined control sequence.", 3, "$\\mathbb")]
+
+
+def test_loads_package_for_undefined_command():
+    latex = "\\documentclass{article}\n\\begin{document}\n$\\mathbb{R}$\n\\end{document}\n"
+    patched, fixes = fixer().patch(latex, tex_log(("Undefined control sequence", 3, "$\\mathbb")))
+    assert "\\usepackage{amssymb}\n\\begin{document}" in patched
+    assert fixes == ["load amssymb for \\mathbb"]
+
+
+def test_preamble_insertion_does_not_shift_later_line_fixes():
+    latex = (
+        "\\documentclass{article}\n"
+        "\\begin{document}\n"
+        "$\\mathbb{R}$\n"
+        "\\begin{tabular}{cc} x & y \\end{tabular}\n"
+        "Profit & loss\n"
+        "\\end{document}\n"
+    )
+    log = tex_log(
+        ("Undefined control sequence", 3, "$\\mathbb"),
+        ("Misplaced alignment tab character &", 5, "Profit &"),
+    )
+    patched, fixes = fixer().patch(latex, log)
+    lines = patched.split("\n")
+    assert "\\usepackage{amssymb}" in lines
+    assert "\\begin{tabular}{cc} x & y \\end{tabular}" in lines
+    assert "Profit \\& loss" in lines
+    assert fixes == ["load amssymb for \\mathbb", "escape & on line 6"]
+
+
+def test_line_fix_before_preamble_insertion():
+    latex = "\\documentclass{article}\n\\begin{document}\nProfit & loss\n$\\mathbb{R}$\n\\end{document}\n"
+    log = tex_log(
+        ("Misplaced alignment tab character &", 3, "Profit &"),
+        ("Undefined control sequence", 4, "$\\mathbb"),
+    )
+    patched, _ = fixer().patch(latex, log)
+    assert "Profit \\& loss" in patched
+    assert "\\usepackage{amssymb}" in patched
+
+
+def test_format_numbering_is_resolved_by_context():
+    # With a preamble format TeX counts lines from \begin{document}
+    latex = "\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\nx & y\n\\end{document}\n"
+    patched, _ = fixer().patch(latex, tex_log(("Misplaced alignment tab character &", 2, "x &")))
+    assert "x \\& y" in patched
+
+
+def test_unmatched_context_patches_nothing():
+    latex = "\\documentclass{article}\n\\begin{document}\na & b\nc & d\n\\end{document}\n"
+    assert _source_line_index(latex, LogError("Misplaced alignment tab character &", 3, "zzz &")) is None
+    patched, fixes = fixer().patch(latex, tex_log(("Misplaced alignment tab character &", 3, "zzz &")))
+    assert (patched, fixes) == (latex, [])
+
+
+def test_ambiguous_line_without_context_is_left_alone():
+    latex = "\\documentclass{article}\n\\begin{document}\na & b\nc & d\n\\end{document}\n"
+    assert _source_line_index(latex, LogError("Misplaced alignment tab character &", 3)) is None
+
+
+def test_closes_document_and_drops_missing_package():
+    latex = "\\documentclass{article}\n\\usepackage{amsmath,nosuchpkg}\n\\begin{document}\ntext\n"
+    log = "! LaTeX Error: File `nosuchpkg.sty' not found.\n\n*** (job aborted, no legal \\end found)\n"
+    patched, fixes = fixer().patch(latex, log)
+    assert "\\usepackage{amsmath}" in patched and "nosuchpkg" not in patched
+    assert patched.endswith("\\end{document}\n")
+    assert fixes == ["remove unavailable package nosuchpkg", "add missing \\end{document}"]
+
+
+def test_drops_unsupported_listings_language():
+    latex = "\\begin{lstlisting}[language=Brainfuck, numbers=left]\n+\n\\end{lstlisting}"
+    patched, _ = fixer().patch(latex, "! Package Listings Error: Couldn't load requested language.\n")
+    assert "language" not in patched and "numbers=left" in patched
+
+
+def test_listings_language_fix_leaves_other_language_keys():
+    latex = (
+        "\\usepackage[language=german]{foo}\n"
+        "\\lstset{basicstyle=\\ttfamily, language={[LaTeX]TeX}}\n"
+        "\\begin{document}\nThe language=C key.\n"
+        "\\lstinline[language=Brainfuck]|+|\n"
+        "\\lstinputlisting[numbers=left, language=[x86masm]Assembler]{a.asm}\n"
+        "\\begin{tabular}{l}language=Python\\end{tabular}\n"
+    )
+    patched, _ = fixer().patch(latex, "! Package Listings Error: Couldn't load requested language.\n")
+    assert patched.count("language=") == 3
+    assert "\\usepackage[language=german]{foo}" in patched and "The language=C key." in patched
+    assert "\\lstset{basicstyle=\\ttfamily}" in patched
+    assert "\\lstinline[]|+|" in patched
+    assert "\\lstinputlisting[numbers=left]{a.asm}" in patched
+
+
+def test_scales_tikz_dimensions():
+    latex = "\\draw (0,0) -- (1000,10);"
+    patched, fixes = fixer().patch(latex, "! Dimension too large.\n")
+    assert "(50.00,0.50)" in patched
+    assert fixes == ["scale TikZ coordinates"]
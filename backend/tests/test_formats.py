@@ -0,0 +1,60 @@
+import asyncio
+
+from src.compilation.services.engine import CompileJob, LatexCompileEngine
+from src.compilation.services.formats import PreambleFormatCache, split_preamble
+
+PREAMBLE = "\\documentclass{article}\n\\usepackage{tikz}\n"
+
+
+def document(body: str, preamble: str = PREAMBLE) -> str:
+    return f"{preamble}\\begin{{document}}\n{body}\n\\end{{document}}\n"
+
+
+def make_engine(toolchain, tmp_path):
+    formats = PreambleFormatCache(toolchain, cache_dir=str(tmp_path / "formats"), max_bytes=10 * 1024 * 1024)
+    return LatexCompileEngine(toolchain, temp_dir=str(tmp_path), formats=formats), formats
+
+
+async def compile_twice(engine, formats, first: str, second: str):
+    """Compile `first` (scheduling the format build), wait for the build, then compile `second`."""
+    await engine.compile(CompileJob(latex=first))
+    await asyncio.gather(*formats._building.values())
+    return await engine.compile(CompileJob(latex=second))
+
+
+def test_split_preamble():
+    assert split_preamble(document("hi")) == (PREAMBLE, "\\begin{document}\nhi\n\\end{document}\n")
+    assert split_preamble("\\begin{document}x\\end{document}") is None
+
+
+def test_format_is_used_after_build(toolchain, tectonic_calls, tmp_path):
+    engine, formats = make_engine(toolchain, tmp_path)
+    result = asyncio.run(compile_twice(engine, formats, document("one"), document("two")))
+    assert result.success
+    assert formats.stats()["builds"] == 1
+    assert any("--format=" in call and "probe.tex" not in call for call in tectonic_calls())
+
+
+def test_format_failing_the_probe_is_never_published(toolchain, tmp_path):
+    engine, formats = make_engine(toolchain, tmp_path)
+    preamble = PREAMBLE + "% BADFORMAT\n"
+    result = asyncio.run(compile_twice(engine, formats, document("one", preamble), document("two", preamble)))
+    assert result.success
+    stats = formats.stats()
+    assert (stats["builds"], stats["build_failures"], stats["unsupported_preambles"]) == (0, 1, 1)
+
+
+def test_failure_with_format_retries_full_document_and_drops_format(toolchain, tectonic_calls, tmp_path):
+    engine, formats = make_engine(toolchain, tmp_path)
+    result = asyncio.run(compile_twice(engine, formats, document("one"), document("NEEDSFULL")))
+    assert result.success
+    assert formats.key(PREAMBLE) in formats._failed
+    assert not any("--format=" in call for call in tectonic_calls()[-1:])
+
+
+def test_document_error_keeps_format(toolchain, tmp_path):
+    engine, formats = make_engine(toolchain, tmp_path)
+    result = asyncio.run(compile_twice(engine, formats, document("one"), document("FAIL")))
+    assert not result.success
+    assert "Undefined control sequence" in result.error
+    assert formats._failed == set()
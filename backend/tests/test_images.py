@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+from src.compilation.services.images import PAPER_SHORT_PT, ImageNormalizer, ImageUse, find_image_uses
+
+
+def test_printed_sizes_are_read_from_includegraphics():
+    uses = find_image_uses(
+        "\\includegraphics[width=5cm]{photo.jpg}\n"
+        "\\includegraphics[width=0.5\\textwidth]{./photo.jpg}\n"
+        "\\includegraphics[scale=0.25]{plot}\n"
+        "\\includegraphics[angle=90]{rotated.png}\n"
+        "% \\includegraphics{commented.png}\n"
+    )
+    assert uses["photo.jpg"][0].width == pytest.approx(5 * 72.27 / 2.54)
+    assert uses["photo.jpg"][1].width == pytest.approx(0.5 * PAPER_SHORT_PT)
+    assert uses["plot"] == [ImageUse(scale=0.25)]
+    assert uses["rotated.png"] == [None]
+    assert "commented.png" not in uses
+
+
+def test_documents_that_scale_graphics_are_left_alone():
+    assert find_image_uses("\\resizebox{\\linewidth}{!}{\\includegraphics{a.png}}") is None
+    # Paper lengths cannot be bounded on custom paper
+    assert find_image_uses("\\usepackage[a0paper]{geometry}\\includegraphics[width=\\textwidth]{a.png}") == {"a.png": [None]}
+
+
+def test_required_scale(tmp_path):
+    normalizer = ImageNormalizer(cache_dir=str(tmp_path), dpi=300)
+    # 2 inches wide at 300 DPI out of a 4000 px wide photo
+    assert normalizer._required_scale(ImageUse(width=2 * 72.27), 4000, 3000, 72, 72) == pytest.approx(600 / 4000)
+    # Both dimensions given: the larger need wins
+    assert normalizer._required_scale(ImageUse(width=72.27, height=72.27), 1000, 500, 72, 72) == pytest.approx(0.6)
+    # Natural size at the file's DPI
+    assert normalizer._required_scale(ImageUse(), 1000, 1000, 600, 600) == pytest.approx(0.5)
+    assert normalizer._required_scale(ImageUse(scale=0.5), 1000, 1000, 600, 600) == pytest.approx(0.25)
+
+
+def test_oversized_photo_is_downscaled(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    # At 300 DPI the scale (1/10) keeps a whole DPI value, so no rounding up
+    Image.new("RGB", (3000, 2000), (200, 30, 30)).save(buffer, "JPEG", dpi=(300, 300))
+    normalizer = ImageNormalizer(cache_dir=str(tmp_path / "images"), dpi=150)
+    [asset] = normalizer.normalize(
+        "\\includegraphics[width=2in]{photo.jpg}", [{"filename": "photo.jpg", "content": buffer.getvalue()}]
+    )
+    with Image.open(asset["path"]) as image:
+        assert image.size == (300, 200)
@@ -0,0 +1,44 @@
+import asyncio
+
+from src.compilation.services.engine import CompileResult, _report_stage
+from src.compilation.services.jobs import CompileJobManager
+
+
+def test_events_follow_stages_until_done():
+    manager = CompileJobManager(ttl=60)
+
+    async def compile_fn():
+        _report_stage("running")
+        await asyncio.sleep(0)
+        _report_stage("rasterizing")
+        return CompileResult(True, content=b"png")
+
+    async def run():
+        record = manager.submit("diagram", "user-1", "png", compile_fn)
+        statuses = [event["status"] async for event in manager.events(record)]
+        await asyncio.sleep(0)
+        return record, statuses
+
+    record, statuses = asyncio.run(run())
+    assert statuses == ["queued", "running", "rasterizing", "done"]
+    assert record.finished and record.result.content == b"png"
+    # Notification tasks are tracked while pending and released once done
+    assert manager._tasks == set()
+
+
+def test_failed_job_and_ownership():
+    manager = CompileJobManager(ttl=60)
+
+    async def compile_fn():
+        return CompileResult(False, error="! Undefined control sequence.")
+
+    async def run():
+        record = manager.submit("table", "user-1", "pdf", compile_fn)
+        events = [event async for event in manager.events(record)]
+        return record, events
+
+    record, events = asyncio.run(run())
+    assert events[-1]["status"] == "failed"
+    assert events[-1]["error"] == "! Undefined control sequence."
+    assert manager.get(record.id, "user-1") is record
+    assert manager.get(record.id, "user-2") is None
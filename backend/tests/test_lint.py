@@ -0,0 +1,98 @@
+from src.compilation.services.lint import lint_failures, lint_latex
+
+
+def document(preamble: str, body: str, document_class: str = "\\documentclass{article}") -> str:
+    return f"{document_class}\n{preamble}\n\\begin{{document}}\n{body}\n\\end{{document}}\n"
+
+
+def test_valid_document_has_no_problems():
+    latex = document(
+        "\\usepackage{amsmath}\n\\usepackage{tikz}",
+        "% comment with { and \\begin{itemize}\n"
+        "Text \\{ escaped \\} and \\verb|{| plus $a_{1}$.\n"
+        "\\begin{verbatim}\n{ \\begin{foo}\n\\end{verbatim}\n"
+        "\\begin{align} a &= b \\end{align}\n"
+        "\\begin{tikzpicture}\\draw (0,0) -- (1,1);\\end{tikzpicture}",
+    )
+    assert lint_latex(latex) == []
+
+
+def test_structural_errors_are_failures():
+    latex = "\\documentclass{article}\n\\begin{document}\n\\begin{itemize}\n\\item {unclosed\n\\end{enumerate}\n"
+    failures = lint_failures(lint_latex(latex))
+    messages = [error.message for error in failures]
+    assert "Missing \\end{document}" in messages
+    assert "Unclosed brace '{'" in messages
+    assert any("\\end{enumerate}" in message for message in messages)
+    assert failures[0].line == 3
+
+
+def test_unknown_environment_is_only_a_warning():
+    problems = lint_latex(document("", "\\begin{foobar}\\end{foobar}"))
+    assert [(error.message, error.severity) for error in problems] == [("Unknown environment 'foobar'", "warning")]
+    assert lint_failures(problems) == []
+
+
+def test_unknown_package_skips_environment_check():
+    assert lint_latex(document("\\usepackage{mypackage}", "\\begin{mything}\\end{mything}")) == []
+
+
+def test_mathtools_implies_amsmath():
+    assert lint_latex(document("\\usepackage{mathtools}", "\\begin{align} a &= b \\end{align}")) == []
+
+
+def test_tikz_class_option_provides_tikzpicture():
+    latex = document("", "\\begin{tikzpicture}\\draw (0,0) -- (1,1);\\end{tikzpicture}",
+                     document_class="\\documentclass[tikz]{standalone}")
+    assert lint_latex(latex) == []
+
+
+def test_packages_loading_tikz_provide_tikzpicture():
+    for package in ("circuitikz", "forest", "pgfplots", "tcolorbox"):
+        latex = document(f"\\usepackage{{{package}}}", "\\begin{tikzpicture}\\draw (0,0) -- (1,1);\\end{tikzpicture}")
+        assert lint_latex(latex) == [], package
+
+
+def test_verbatim_arguments_are_not_scanned():
+    assert lint_latex(document("\\usepackage{url}", "\\url{a%20b} and \\url|x{y|")) == []
+    assert lint_latex(document("\\usepackage{listings}", "\\lstinline|a{b| and \\lstinline[language=C]{c%d}")) == []
+    assert lint_latex(document("\\usepackage{hyperref}", "\\href{http://x.org/a%20b}{link}")) == []
+
+
+def test_iffalse_block_is_skipped():
+    assert lint_latex(document("", "\\iffalse\\begin{foo}\\fi")) == []
+    assert lint_latex(document("", "\\iffalse \\begin{foo} \\else text \\fi")) == []
+    assert lint_latex(document("", "\\iffalse \\iftrue { \\fi \\fi done")) == []
+
+
+def test_iftrue_else_branch_is_skipped():
+    assert lint_latex(document("", "\\iftrue ok \\else \\begin{foo} \\fi")) == []
+    # The taken branch is still checked
+    assert lint_failures(lint_latex(document("", "\\iftrue \\begin{itemize} \\else \\fi")))
+
+
+def test_unknown_conditionals_downgrade_to_warnings():
+    latex = document("", "\\ifdefined\\foo \\begin{itemize} \\else \\begin{enumerate} \\fi\n\\end{itemize}")
+    problems = lint_latex(latex)
+    assert problems
+    assert lint_failures(problems) == []
+
+
+def test_conditionals_in_definitions_are_ignored():
+    latex = document("\\newcommand{\\x}[1]{\\ifx#1\\relax a\\else b\\fi}\n\\newif\\ifdraft", "\\begin{itemize}\n")
+    assert lint_failures(lint_latex(latex))
+
+
+def test_iff_is_not_a_conditional():
+    assert lint_failures(lint_latex(document("", "$a \\iff b$ {"))) != []
+
+
+def test_catcode_changes_downgrade_to_warnings():
+    problems = lint_latex(document("\\catcode`\\[=1 \\catcode`\\]=2", "[text}"))
+    assert problems
+    assert lint_failures(problems) == []
+
+
+def test_tikz_path_is_not_a_verbatim_argument():
+    latex = document("\\usepackage{tikz}", "\\begin{tikzpicture}\\path (0,0) node {a};\n\\end{tikzpicture} {")
+    assert lint_failures(lint_latex(latex))
@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from src.compilation import routes
+from src.compilation.responses import stored_format
+from src.compilation.services.cache import CompileCache
+from src.compilation.services.engine import CompileJob, CompileResult, LatexCompileEngine
+
+DOCUMENT = "\\documentclass{article}\n\\begin{document}\nhi\n\\end{document}\n"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompileCache(cache_dir=str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+
+
+def compile_for(engine, user_id, latex=DOCUMENT):
+    return asyncio.run(engine.compile(CompileJob(latex=latex, user_id=user_id)))
+
+
+def test_outputs_are_granted_to_the_user_who_compiled_them(toolchain, cache, tmp_path):
+    engine = LatexCompileEngine(toolchain, temp_dir=str(tmp_path), cache=cache)
+    result = compile_for(engine, "alice")
+    assert result.success and result.path is not None
+    assert cache.granted(result.path.name, "alice")
+    assert cache.granted(result.render_id, "alice")
+    assert not cache.granted(result.path.name, "bob")
+
+    # A cache hit is a compile too: bob gets the shared entry
+    hit = compile_for(engine, "bob")
+    assert hit.cache_hit
+    assert cache.granted(hit.path.name, "bob")
+
+
+def test_owners_go_with_their_entry(cache):
+    path = cache.put("a" * 64, b"%PDF-1.4")
+    cache.grant("a" * 64, "alice")
+    cache.grant("b" * 64, "alice")  # not stored: nothing recorded
+    assert cache.granted("a" * 64, "alice")
+    assert not cache.granted("b" * 64, "alice")
+    # Another worker's index does not count owners files as entries
+    fresh = CompileCache(cache_dir=str(cache.cache_dir), max_bytes=cache.max_bytes)
+    assert fresh.get_path("a" * 64) == path
+    assert fresh.stats()["entries"] == 1
+
+    cache.discard("a" * 64)
+    assert not path.exists()
+    assert not cache.granted("a" * 64, "alice")
+
+
+def test_stored_format_reads_the_bytes(tmp_path):
+    svg = tmp_path / "out"
+    svg.write_bytes(b'<?xml version="1.0" encoding="UTF-8"?>\n<svg xmlns="http://www.w3.org/2000/svg"/>')
+    assert stored_format(CompileResult(True, path=svg)) == "svg"
+    assert stored_format(CompileResult(True, content=b"%PDF-1.5\n")) == "pdf"
+    assert stored_format(CompileResult(True, content=b"\x89PNG\r\n\x1a\n....")) == "png"
+    assert stored_format(CompileResult(True, content=b"<html><script>")) is None
+
+
+def test_output_route_checks_owner_and_format(cache, monkeypatch):
+    monkeypatch.setattr(routes, "compile_cache", cache)
+    key = "c" * 64
+    cache.put(key, b"%PDF-1.4 x")
+    cache.grant(key, "alice")
+    alice, bob = SimpleNamespace(id="alice"), SimpleNamespace(id="bob")
+
+    response = asyncio.run(routes.get_compiled_output(f"{key}.pdf", current_user=alice))
+    assert response.media_type == "application/pdf"
+    for name, user in ((f"{key}.pdf", bob), (f"{key}.svg", alice), (f"{key}.png", alice)):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(routes.get_compiled_output(name, current_user=user))
+        assert error.value.status_code == 404
+
+
+def test_render_route_checks_owner(cache, monkeypatch):
+    monkeypatch.setattr(routes, "compile_cache", cache)
+    key = "d" * 64
+    cache.put(key, b"%PDF-1.4 x")
+    cache.grant(key, "alice")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(routes.get_rendered_page(key, 1, dpi=150, current_user=SimpleNamespace(id="bob")))
+    assert error.value.status_code == 404
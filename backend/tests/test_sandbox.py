@@ -0,0 +1,58 @@
+import asyncio
+import signal
+import sys
+import time
+
+import pytest
+
+from src.compilation.services.sandbox import ResourceLimits, run_sandboxed
+
+
+def test_runs_in_cwd_with_output_and_usage(tmp_path):
+    result = asyncio.run(run_sandboxed(["/bin/sh", "-c", "pwd; echo oops >&2; exit 3"], cwd=tmp_path))
+    assert result.returncode == 3
+    assert result.stdout.strip() == str(tmp_path)
+    assert result.stderr.strip() == "oops"
+    assert result.max_rss_mb > 0
+    assert result.limit_error is None
+
+
+def test_cpu_limit():
+    limits = ResourceLimits(cpu_seconds=1)
+    result = asyncio.run(run_sandboxed(["/bin/sh", "-c", "while :; do :; done"], timeout=20, limits=limits))
+    assert result.returncode in (-signal.SIGXCPU, -signal.SIGKILL)
+    assert result.limit_error == "exceeded the CPU limit of 1 seconds"
+
+
+def test_memory_limit():
+    limits = ResourceLimits(memory_mb=200)
+    result = asyncio.run(run_sandboxed([sys.executable, "-c", "b = bytearray(400 * 1024 * 1024)"], limits=limits))
+    assert result.returncode != 0
+    assert "MemoryError" in result.stderr
+
+
+def test_timeout_kills_the_process_group(tmp_path):
+    marker = tmp_path / "survived"
+    # The grandchild would create the marker if it outlived the timeout
+    argv = ["/bin/sh", "-c", f"(sleep 1; touch {marker}) & sleep 30"]
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run_sandboxed(argv, timeout=0.3))
+    assert time.monotonic() - started < 5
+    time.sleep(1.5)
+    assert not marker.exists()
+
+
+def test_cancellation_kills_the_process(tmp_path):
+    marker = tmp_path / "survived"
+
+    async def run():
+        task = asyncio.create_task(run_sandboxed(["/bin/sh", "-c", f"sleep 1; touch {marker}"]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    time.sleep(1.5)
+    assert not marker.exists()
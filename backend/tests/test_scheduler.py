@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from src.compilation.services.scheduler import CompileQueueFull, CompileScheduler
+
+
+async def run_in_order(scheduler, jobs):
+    """Hold the only slot while `jobs` ((user, priority) pairs) queue; return the order they ran in."""
+    order = []
+    release = asyncio.Event()
+
+    async def job(name, user, priority=False):
+        async with scheduler.slot(user, priority):
+            order.append(name)
+            if name == "first":
+                await release.wait()
+
+    tasks = [asyncio.create_task(job("first", "x"))]
+    await asyncio.sleep(0)
+    for index, (user, priority) in enumerate(jobs):
+        tasks.append(asyncio.create_task(job(f"{user}{index}", user, priority)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+    return order[1:]
+
+
+def test_users_are_served_round_robin():
+    scheduler = CompileScheduler(max_concurrent=1, max_queue=10, max_queue_per_user=5)
+    jobs = [("a", False), ("a", False), ("a", False), ("b", False), ("c", False)]
+    assert asyncio.run(run_in_order(scheduler, jobs)) == ["a0", "b3", "c4", "a1", "a2"]
+
+
+def test_priority_lane_goes_first():
+    scheduler = CompileScheduler(max_concurrent=1, max_queue=10, max_queue_per_user=5)
+    assert asyncio.run(run_in_order(scheduler, [("a", False), ("b", True)])) == ["b1", "a0"]
+
+
+def test_queue_limits_reject_with_retry_after():
+    async def scenario():
+        scheduler = CompileScheduler(max_concurrent=1, max_queue=2, max_queue_per_user=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot("x"):
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(CompileQueueFull, match="for this user"):
+            scheduler.check_admission("x")
+        scheduler.check_admission("y")
+
+        # A cancelled waiter leaves the queue
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert scheduler.queued == 0
+        release.set()
+        await holder
+        assert scheduler.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
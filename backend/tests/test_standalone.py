@@ -0,0 +1,31 @@
+from src.compilation.services.assembly import fragment_document
+from src.compilation.services.standalone import to_standalone
+from src.compilation.services.tikz import TikzExternalizer
+from src.Table.services.latex_generator import TableLatexGenerator
+
+PICTURE = "\\begin{tikzpicture}\\draw (0,0) -- (1,1);\\end{tikzpicture}"
+
+
+def test_class_options_carry_over():
+    document = "\\documentclass[12pt,a4paper]{article}\n\\usepackage{geometry}\n\\begin{document}\nhi\n\\end{document}"
+    assert to_standalone(document).startswith("\\documentclass[border=8pt, varwidth=60cm, 12pt,a4paper]{standalone}\n")
+    assert to_standalone(document.replace("[12pt,a4paper]", "")).startswith("\\documentclass[border=8pt, varwidth=60cm]{standalone}\n")
+
+
+def test_fragments_keep_the_project_class_options():
+    document = fragment_document("hi", "\\documentclass[11pt]{article}\n\\usepackage{amsmath}\n")
+    assert document.startswith("\\documentclass[border=8pt, varwidth=60cm, 11pt]{standalone}\n")
+    assert document.count("\\documentclass") == 1
+
+
+def test_pictures_keep_the_class_options():
+    latex = f"\\documentclass[10pt]{{article}}\n\\usepackage{{tikz}}\n\\begin{{document}}\n{PICTURE}\n{PICTURE}\n\\end{{document}}\n"
+    pictures = TikzExternalizer(min_pictures=2).plan(latex)
+    assert pictures
+    assert pictures[0].document.startswith("\\documentclass[border=0pt, 10pt]{standalone}\n")
+
+
+def test_standalone_table_has_no_heading():
+    document = TableLatexGenerator()._create_complete_document("\\begin{tabular}{c}x\\end{tabular}", standalone=True)
+    assert "\\documentclass[border=8pt, varwidth=60cm, 12pt]{standalone}" in document
+    assert "\\section" not in document and "\\maketitle" not in document
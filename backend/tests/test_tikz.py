@@ -0,0 +1,56 @@
+import asyncio
+
+from src.compilation.services.cache import CompileCache
+from src.compilation.services.engine import CompileJob, LatexCompileEngine
+from src.compilation.services.tikz import TikzExternalizer
+
+PICTURE = "\\begin{{tikzpicture}}\\node {{{0}}};\\end{{tikzpicture}}"
+
+
+def document(*labels: str) -> str:
+    pictures = "\n".join(PICTURE.format(label) for label in labels)
+    return f"\\documentclass{{article}}\n\\usepackage{{tikz}}\n\\begin{{document}}\n{pictures}\n\\end{{document}}\n"
+
+
+def make_engine(toolchain, tmp_path):
+    cache = CompileCache(cache_dir=str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+    return LatexCompileEngine(toolchain, temp_dir=str(tmp_path), cache=cache, tikz=TikzExternalizer(min_pictures=2))
+
+
+def test_plan_skips_contextual_pictures():
+    latex = document("a", "b", "c").replace("\\node {b}", "\\node[remember picture] {b}")
+    assert [picture.source for picture in TikzExternalizer(min_pictures=2).plan(latex)] == [
+        PICTURE.format("a"), PICTURE.format("c"),
+    ]
+    assert TikzExternalizer(min_pictures=3).plan(latex) == []
+
+
+def test_assemble_keeps_line_count():
+    externalizer = TikzExternalizer(min_pictures=2)
+    latex = document("a", "b").replace("\\node", "\n\\node")
+    assembled = externalizer.assemble(latex, externalizer.plan(latex))
+    assert "\\includegraphics" in assembled and "tikzpicture" not in assembled
+    assert assembled.count("\n") == latex.count("\n")
+
+
+def test_externalized_pictures_survive_cache_eviction(toolchain, tmp_path):
+    engine = make_engine(toolchain, tmp_path)
+    job = asyncio.run(engine._externalize(CompileJob(latex=document("a", "b"))))
+    assert len(job.assets) == 2
+
+    # Evicted while the document waits for a scheduler slot
+    for entry in list(engine.cache.cache_dir.glob("*/*")):
+        engine.cache.discard(entry.name)
+    job_dir = engine._prepare_job_dir(job)
+    for asset in job.assets:
+        placed = job_dir / asset["filename"]
+        assert not placed.is_symlink()
+        assert placed.read_bytes().startswith(b"%PDF")
+
+
+def test_document_compiles_with_externalized_pictures(toolchain, tmp_path):
+    engine = make_engine(toolchain, tmp_path)
+    assert asyncio.run(engine.compile(CompileJob(latex=document("a", "b")))).success
+    assert engine.tikz.compiled == 2
+    assert asyncio.run(engine.compile(CompileJob(latex=document("a", "c")))).success
+    assert (engine.tikz.reused, engine.tikz.compiled) == (1, 3)